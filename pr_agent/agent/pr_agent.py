@@ -103,11 +103,13 @@ class PRAgent:
                         separator_text = "\n======\n\nIn addition, "
 
                         # Check if the specific language instruction is already present to avoid duplication
+                        # (set() writes to the settings of the request, the section itself may be shared)
                         if lang_instruction_text not in str(current_extra_instructions):
                             if current_extra_instructions: # If there's existing text
-                                setting.extra_instructions = str(current_extra_instructions) + separator_text + lang_instruction_text
+                                get_settings().set(f"{key}.extra_instructions", str(current_extra_instructions) +
+                                                   separator_text + lang_instruction_text)
                             else: # If extra_instructions was None or empty
-                                setting.extra_instructions = lang_instruction_text
+                                get_settings().set(f"{key}.extra_instructions", lang_instruction_text)
                         # If lang_instruction_text is already present, do nothing.
 
         action = action.lstrip("/").lower()
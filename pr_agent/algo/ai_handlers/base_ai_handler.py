@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
 
 
 class BaseAiHandler(ABC):
@@ -16,7 +17,8 @@ class BaseAiHandler(ABC):
         pass
 
     @abstractmethod
-    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None):
+    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None,
+                              response_schema: dict = None):
         """
         This method should be implemented to return a chat completion from the AI model.
         Args:
@@ -24,5 +26,17 @@ class BaseAiHandler(ABC):
             system (str): the system message string to use for the chat completion
             user (str): the user message string to use for the chat completion
             temperature (float): the temperature to use for the chat completion
+            response_schema (dict): optional JSON schema ({'name', 'schema'}) of the response. Handlers which support
+                structured output constrain the response to a JSON object of the schema, and the others ignore it
         """
         pass
+
+    async def chat_completion_stream(self, model: str, system: str, user: str, temperature: float = 0.2,
+                                     img_path: str = None, response_schema: dict = None) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from the AI model, yielding the text chunks as they are generated.
+        Handlers which do not support streaming yield the whole completion as a single chunk.
+        """
+        response, _ = await self.chat_completion(model=model, system=system, user=user, temperature=temperature,
+                                                 img_path=img_path, response_schema=response_schema)
+        yield response
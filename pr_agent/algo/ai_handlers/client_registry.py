@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Iterable, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from pr_agent.config_loader import get_settings
+
+
+class AIClientRegistry:
+    """
+    The AI clients and the handler configurations of the process.
+
+    An async HTTP client (and its pool of keep-alive connections) is bound to the event loop which opened its
+    connections, so the clients are kept per event loop, and per (provider, api base, credentials) within it. A handler
+    configuration is computed by the handler for a settings fingerprint, and reused as long as the settings are
+    unchanged and the configuration did not expire (e.g. an Azure AD token).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}  # id(event loop) -> (event loop, {client key: client})
+        self._handler_configs = {}  # handler name -> (settings fingerprint, configuration, expires at)
+
+    def get_async_openai_client(self, api_key: str, base_url: str = None, organization: str = None) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        key = ("openai", base_url or "", organization or "", hashlib.sha256((api_key or "").encode()).hexdigest())
+        with self._lock:
+            for loop_id in [loop_id for loop_id, (other_loop, _) in self._clients.items() if other_loop.is_closed()]:
+                del self._clients[loop_id]
+            clients = self._clients.setdefault(id(loop), (loop, {}))[1]
+            if key not in clients:
+                clients[key] = AsyncOpenAI(api_key=api_key, base_url=base_url, organization=organization,
+                                           http_client=httpx.AsyncClient(limits=get_http_limits()))
+            return clients[key]
+
+    def get_handler_config(self, handler: str, fingerprint: str, configure: Callable[[], Tuple[dict, float]]) -> dict:
+        """
+        The configuration of 'handler' for the settings 'fingerprint'. 'configure' computes it (and applies its global
+        side effects, e.g. litellm module attributes) and returns it with its expiration time. It is called again only
+        when the settings change, or the configuration expires.
+        """
+        with self._lock:
+            entry = self._handler_configs.get(handler)
+            if entry and entry[0] == fingerprint and entry[2] > time.time():
+                return entry[1]
+            config, expires_at = configure()
+            self._handler_configs[handler] = (fingerprint, config, expires_at)
+            return config
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._handler_configs.clear()
+
+
+def get_http_limits() -> httpx.Limits:
+    settings = get_settings()
+    return httpx.Limits(max_connections=settings.get("CONFIG.AI_HTTP_MAX_CONNECTIONS", 100),
+                        max_keepalive_connections=settings.get("CONFIG.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20),
+                        keepalive_expiry=settings.get("CONFIG.AI_HTTP_KEEPALIVE_EXPIRY", 60))
+
+
+def settings_fingerprint(keys: Iterable[str], environ_keys: Iterable[str] = ()) -> str:
+    """A hash of the values of the settings 'keys', and of which of the 'environ_keys' are set."""
+    settings = get_settings()
+    values = {key: settings.get(key, None) for key in keys}
+    values["environ"] = [key for key in environ_keys if key in os.environ]
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+_ai_client_registry = None
+_ai_client_registry_lock = threading.Lock()
+
+
+def get_ai_client_registry() -> AIClientRegistry:
+    global _ai_client_registry
+    if _ai_client_registry is None:
+        with _ai_client_registry_lock:
+            if _ai_client_registry is None:
+                _ai_client_registry = AIClientRegistry()
+    return _ai_client_registry
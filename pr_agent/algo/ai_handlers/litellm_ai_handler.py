@@ -7,12 +7,26 @@ from tenacity import retry, retry_if_exception_type, retry_if_not_exception_type
 
 from pr_agent.algo import CLAUDE_EXTENDED_THINKING_MODELS, NO_SUPPORT_TEMPERATURE_MODELS, SUPPORT_REASONING_EFFORT_MODELS, USER_MESSAGE_ONLY_MODELS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.client_registry import get_ai_client_registry, settings_fingerprint
+from pr_agent.algo.ai_handlers.rate_limiter import get_rate_limiter
+from pr_agent.algo.ai_handlers.response_cache import get_response_cache, response_cache_key
+from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import ReasoningEffort, get_version
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 import json
+from typing import AsyncIterator, Tuple
 
 OPENAI_RETRIES = 5
+# the settings which the configuration of the handler depends on
+LITELLM_SETTINGS_KEYS = ("OPENAI", "AWS", "LITELLM", "ANTHROPIC", "COHERE", "GROQ", "REPLICATE", "XAI", "HUGGINGFACE",
+                         "OLLAMA", "VERTEXAI", "GOOGLE_AI_STUDIO", "DEEPSEEK", "DEEPINFRA", "MISTRAL", "CODESTRAL",
+                         "AZURE_AD", "OPENROUTER", "CONFIG.MODEL")
+AZURE_AD_TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+
+class ImageLinkError(Exception):
+    pass
 
 
 class LiteLLMAIHandler(BaseAiHandler):
@@ -27,10 +41,36 @@ class LiteLLMAIHandler(BaseAiHandler):
         Initializes the OpenAI API key and other settings from a configuration file.
         Raises a ValueError if the OpenAI key is missing.
         """
+        # the litellm and environment settings are global to the process, so they are applied once per settings
+        # fingerprint, and not by every handler (a tool creates a handler per command)
+        fingerprint = settings_fingerprint(LITELLM_SETTINGS_KEYS, environ_keys=["OPENAI_API_KEY"])
+        config = get_ai_client_registry().get_handler_config("litellm", fingerprint, self._configure)
+        self.azure = config["azure"]
+        self.api_base = config["api_base"]
+        self.repetition_penalty = config["repetition_penalty"]
+
+        # Models that only use user message
+        self.user_message_only_models = USER_MESSAGE_ONLY_MODELS
+
+        # Model that doesn't support temperature argument
+        self.no_support_temperature_models = NO_SUPPORT_TEMPERATURE_MODELS
+
+        # Models that support reasoning effort
+        self.support_reasoning_models = SUPPORT_REASONING_EFFORT_MODELS
+
+        # Models that support extended thinking
+        self.claude_extended_thinking_models = CLAUDE_EXTENDED_THINKING_MODELS
+
+    def _configure(self) -> Tuple[dict, float]:
+        """
+        Applies the settings to litellm, openai and the environment.
+        Returns the configuration of the handler, and its expiration time.
+        """
         self.azure = False
         self.api_base = None
         self.repetition_penalty = None
-        
+        expires_at = float("inf")
+
         if get_settings().get("OPENAI.KEY", None):
             openai.api_key = get_settings().openai.key
             litellm.openai_key = get_settings().openai.key
@@ -110,7 +150,8 @@ class LiteLLMAIHandler(BaseAiHandler):
         if get_settings().get("AZURE_AD.CLIENT_ID", None):
             self.azure = True
             # Generate access token using Azure AD credentials from settings
-            access_token = self._get_azure_ad_token()
+            access_token, token_expires_on = self._get_azure_ad_token()
+            expires_at = token_expires_on - AZURE_AD_TOKEN_REFRESH_MARGIN_SECONDS
             litellm.api_key = access_token
             openai.api_key = access_token
             
@@ -131,23 +172,14 @@ class LiteLLMAIHandler(BaseAiHandler):
             self.api_base = openrouter_api_base
             litellm.api_base = openrouter_api_base
 
-        # Models that only use user message
-        self.user_message_only_models = USER_MESSAGE_ONLY_MODELS
-
-        # Model that doesn't support temperature argument
-        self.no_support_temperature_models = NO_SUPPORT_TEMPERATURE_MODELS
+        return {"azure": self.azure, "api_base": self.api_base, "repetition_penalty": self.repetition_penalty}, \
+            expires_at
 
-        # Models that support reasoning effort
-        self.support_reasoning_models = SUPPORT_REASONING_EFFORT_MODELS
-
-        # Models that support extended thinking
-        self.claude_extended_thinking_models = CLAUDE_EXTENDED_THINKING_MODELS
-
-    def _get_azure_ad_token(self):
+    def _get_azure_ad_token(self) -> Tuple[str, float]:
         """
         Generates an access token using Azure AD credentials from settings.
         Returns:
-            str: The access token
+            Tuple[str, float]: The access token, and its expiration time
         """
         from azure.identity import ClientSecretCredential
         try:
@@ -158,7 +190,7 @@ class LiteLLMAIHandler(BaseAiHandler):
             )
             # Get token for Azure OpenAI service
             token = credential.get_token("https://cognitiveservices.azure.com/.default")
-            return token.token
+            return token.token, token.expires_on
         except Exception as e:
             get_logger().error(f"Failed to get Azure AD token: {e}")
             raise
@@ -273,104 +305,181 @@ class LiteLLMAIHandler(BaseAiHandler):
         """
         return get_settings().get("OPENAI.DEPLOYMENT_ID", None)
 
+    def _get_openai_client(self, model: str):
+        """
+        The long-lived client of the process for the OpenAI models, so that the calls reuse its pool of keep-alive
+        connections. Other providers use the clients of litellm.
+        """
+        if self.azure:
+            return None
+        try:
+            provider = litellm.get_llm_provider(model)[1]
+        except Exception:
+            return None
+        api_key = get_settings().get("OPENAI.KEY", None) or os.environ.get("OPENAI_API_KEY")
+        if provider != "openai" or not api_key:
+            return None
+        return get_ai_client_registry().get_async_openai_client(api_key, self.api_base,
+                                                                get_settings().get("OPENAI.ORG", None))
+
+    @staticmethod
+    def _count_prompt_tokens(system: str, user: str) -> int:
+        token_handler = TokenHandler()
+        return token_handler.count_tokens(system or "") + token_handler.count_tokens(user or "")
+
+    @staticmethod
+    def _supports_response_schema(model: str) -> bool:
+        try:
+            return litellm.supports_response_schema(model=model)
+        except Exception:
+            return False
+
+    def _prepare_completion_kwargs(self, model: str, system: str, user: str, temperature: float,
+                                   img_path: str = None) -> Tuple[dict, str, str]:
+        """
+        Build the arguments of a litellm completion call.
+        Returns the arguments, and the system and user prompts as they are sent to the model.
+        Raises ImageLinkError if the image link cannot be fetched.
+        """
+        deployment_id = self.deployment_id
+        if self.azure:
+            model = 'azure/' + model
+        if 'claude' in model and not system:
+            system = "No system prompt provided"
+            get_logger().warning(
+                "Empty system prompt for claude model. Adding a newline character to prevent OpenAI API error.")
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+        if img_path:
+            try:
+                # check if the image link is alive
+                r = requests.head(img_path, allow_redirects=True)
+            except Exception as e:
+                get_logger().error(f"Error fetching image: {img_path}", e)
+                raise ImageLinkError(f"Error fetching image: {img_path}") from e
+            if r.status_code == 404:
+                error_msg = ("The image link is not [alive](img_path).\nPlease repost the original image as a comment, "
+                             "and send the question again with 'quote reply' (see [instructions]"
+                             "(https://pr-agent-docs.codium.ai/tools/ask/#ask-on-images-using-the-pr-code-as-context)).")
+                get_logger().error(error_msg)
+                raise ImageLinkError(error_msg)
+            messages[1]["content"] = [{"type": "text", "text": messages[1]["content"]},
+                                      {"type": "image_url", "image_url": {"url": img_path}}]
+
+        # Currently, some models do not support a separate system and user prompts
+        if model in self.user_message_only_models or get_settings().config.custom_reasoning_model:
+            user = f"{system}\n\n\n{user}"
+            system = ""
+            get_logger().info(f"Using model {model}, combining system and user prompts")
+            messages = [{"role": "user", "content": user}]
+            kwargs = {
+                "model": model,
+                "deployment_id": deployment_id,
+                "messages": messages,
+                "timeout": get_settings().config.ai_timeout,
+                "api_base": self.api_base,
+            }
+        else:
+            kwargs = {
+                "model": model,
+                "deployment_id": deployment_id,
+                "messages": messages,
+                "timeout": get_settings().config.ai_timeout,
+                "api_base": self.api_base,
+            }
+
+        # Add temperature only if model supports it
+        if model not in self.no_support_temperature_models and not get_settings().config.custom_reasoning_model:
+            # get_logger().info(f"Adding temperature with value {temperature} to model {model}.")
+            kwargs["temperature"] = temperature
+
+        # Add reasoning_effort if model supports it
+        if (model in self.support_reasoning_models):
+            supported_reasoning_efforts = [ReasoningEffort.HIGH.value, ReasoningEffort.MEDIUM.value,
+                                           ReasoningEffort.LOW.value]
+            reasoning_effort = get_settings().config.reasoning_effort
+            if reasoning_effort not in supported_reasoning_efforts:
+                reasoning_effort = ReasoningEffort.MEDIUM.value
+            get_logger().info(f"Adding reasoning_effort with value {reasoning_effort} to model {model}.")
+            kwargs["reasoning_effort"] = reasoning_effort
+
+        # https://docs.anthropic.com/en/docs/build-with-claude/extended-thinking
+        if (model in self.claude_extended_thinking_models) and \
+                get_settings().config.get("enable_claude_extended_thinking", False):
+            kwargs = self._configure_claude_extended_thinking(model, kwargs)
+
+        if get_settings().litellm.get("enable_callbacks", False):
+            kwargs = self.add_litellm_callbacks(kwargs)
+
+        seed = get_settings().config.get("seed", -1)
+        if temperature > 0 and seed >= 0:
+            raise ValueError(f"Seed ({seed}) is not supported with temperature ({temperature}) > 0")
+        elif seed >= 0:
+            get_logger().info(f"Using fixed seed of {seed}")
+            kwargs["seed"] = seed
+
+        if self.repetition_penalty:
+            kwargs["repetition_penalty"] = self.repetition_penalty
+
+        # Added support for extra_headers while using litellm to call underlying model, via a api management gateway,
+        # would allow for passing custom headers for security and authorization
+        if get_settings().get("LITELLM.EXTRA_HEADERS", None):
+            try:
+                litellm_extra_headers = json.loads(get_settings().litellm.extra_headers)
+                if not isinstance(litellm_extra_headers, dict):
+                    raise ValueError("LITELLM.EXTRA_HEADERS must be a JSON object")
+            except json.JSONDecodeError as e:
+                raise ValueError(f"LITELLM.EXTRA_HEADERS contains invalid JSON: {str(e)}") from e
+            kwargs["extra_headers"] = litellm_extra_headers
+
+        client = self._get_openai_client(model)
+        if client is not None:
+            kwargs["client"] = client
+
+        get_logger().debug("Prompts", artifact={"system": system, "user": user})
+
+        if get_settings().config.verbosity_level >= 2:
+            get_logger().info(f"\nSystem prompt:\n{system}")
+            get_logger().info(f"\nUser prompt:\n{user}")
+        return kwargs, system, user
+
     @retry(
         retry=retry_if_exception_type(openai.APIError) & retry_if_not_exception_type(openai.RateLimitError),
         stop=stop_after_attempt(OPENAI_RETRIES),
     )
-    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None):
+    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None,
+                              response_schema: dict = None):
         try:
             resp, finish_reason = None, None
-            deployment_id = self.deployment_id
-            if self.azure:
-                model = 'azure/' + model
-            if 'claude' in model and not system:
-                system = "No system prompt provided"
-                get_logger().warning(
-                    "Empty system prompt for claude model. Adding a newline character to prevent OpenAI API error.")
-            messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
-
-            if img_path:
-                try:
-                    # check if the image link is alive
-                    r = requests.head(img_path, allow_redirects=True)
-                    if r.status_code == 404:
-                        error_msg = f"The image link is not [alive](img_path).\nPlease repost the original image as a comment, and send the question again with 'quote reply' (see [instructions](https://pr-agent-docs.codium.ai/tools/ask/#ask-on-images-using-the-pr-code-as-context))."
-                        get_logger().error(error_msg)
-                        return f"{error_msg}", "error"
-                except Exception as e:
-                    get_logger().error(f"Error fetching image: {img_path}", e)
-                    return f"Error fetching image: {img_path}", "error"
-                messages[1]["content"] = [{"type": "text", "text": messages[1]["content"]},
-                                          {"type": "image_url", "image_url": {"url": img_path}}]
-
-            # Currently, some models do not support a separate system and user prompts
-            if model in self.user_message_only_models or get_settings().config.custom_reasoning_model:
-                user = f"{system}\n\n\n{user}"
-                system = ""
-                get_logger().info(f"Using model {model}, combining system and user prompts")
-                messages = [{"role": "user", "content": user}]
-                kwargs = {
-                    "model": model,
-                    "deployment_id": deployment_id,
-                    "messages": messages,
-                    "timeout": get_settings().config.ai_timeout,
-                    "api_base": self.api_base,
-                }
+            try:
+                kwargs, system, user = self._prepare_completion_kwargs(model, system, user, temperature, img_path)
+            except ImageLinkError as e:
+                return str(e), "error"
+
+            # structured output: the model is constrained to a JSON object of the schema, which is parsed in a
+            # single pass (see 'load_yaml'), instead of a free-form YAML which may need repairs
+            if response_schema and self._supports_response_schema(kwargs["model"]):
+                kwargs["response_format"] = {"type": "json_schema", "json_schema": response_schema}
+
+            # identical requests (e.g. webhook retries, or re-running a tool on an unchanged PR) reuse the response
+            response_cache = get_response_cache()
+            if response_cache:
+                cache_key = response_cache_key(kwargs["model"], kwargs["messages"], kwargs.get("temperature"),
+                                               kwargs.get("seed", -1), kwargs.get("reasoning_effort"),
+                                               kwargs.get("response_format"))
+                cached_response = response_cache.get(cache_key)
+                if cached_response:
+                    get_logger().info("Using a cached AI response", artifact=response_cache.stats())
+                    return cached_response
+
+            # concurrent calls to the same model (e.g. the chunks of /improve, of several PRs) are admitted within
+            # its budget, and a rate limited call is queued again instead of failing
+            rate_limiter = get_rate_limiter(kwargs["model"], kwargs.get("deployment_id"))
+            if rate_limiter:
+                response = await rate_limiter.run(lambda: acompletion(**kwargs), tokens=self._count_prompt_tokens(
+                    system, user))
             else:
-                kwargs = {
-                    "model": model,
-                    "deployment_id": deployment_id,
-                    "messages": messages,
-                    "timeout": get_settings().config.ai_timeout,
-                    "api_base": self.api_base,
-                }
-
-            # Add temperature only if model supports it
-            if model not in self.no_support_temperature_models and not get_settings().config.custom_reasoning_model:
-                # get_logger().info(f"Adding temperature with value {temperature} to model {model}.")
-                kwargs["temperature"] = temperature
-
-            # Add reasoning_effort if model supports it
-            if (model in self.support_reasoning_models):
-                supported_reasoning_efforts = [ReasoningEffort.HIGH.value, ReasoningEffort.MEDIUM.value, ReasoningEffort.LOW.value]
-                reasoning_effort = get_settings().config.reasoning_effort if (get_settings().config.reasoning_effort in supported_reasoning_efforts) else ReasoningEffort.MEDIUM.value
-                get_logger().info(f"Adding reasoning_effort with value {reasoning_effort} to model {model}.")
-                kwargs["reasoning_effort"] = reasoning_effort
-
-            # https://docs.anthropic.com/en/docs/build-with-claude/extended-thinking
-            if (model in self.claude_extended_thinking_models) and get_settings().config.get("enable_claude_extended_thinking", False):
-                kwargs = self._configure_claude_extended_thinking(model, kwargs)
-
-            if get_settings().litellm.get("enable_callbacks", False):
-                kwargs = self.add_litellm_callbacks(kwargs)
-
-            seed = get_settings().config.get("seed", -1)
-            if temperature > 0 and seed >= 0:
-                raise ValueError(f"Seed ({seed}) is not supported with temperature ({temperature}) > 0")
-            elif seed >= 0:
-                get_logger().info(f"Using fixed seed of {seed}")
-                kwargs["seed"] = seed
-
-            if self.repetition_penalty:
-                kwargs["repetition_penalty"] = self.repetition_penalty
-
-            #Added support for extra_headers while using litellm to call underlying model, via a api management gateway, would allow for passing custom headers for security and authorization
-            if get_settings().get("LITELLM.EXTRA_HEADERS", None):
-                try:
-                    litellm_extra_headers = json.loads(get_settings().litellm.extra_headers)
-                    if not isinstance(litellm_extra_headers, dict):
-                        raise ValueError("LITELLM.EXTRA_HEADERS must be a JSON object")
-                except json.JSONDecodeError as e:
-                    raise ValueError(f"LITELLM.EXTRA_HEADERS contains invalid JSON: {str(e)}")
-                kwargs["extra_headers"] = litellm_extra_headers
-
-            get_logger().debug("Prompts", artifact={"system": system, "user": user})
-
-            if get_settings().config.verbosity_level >= 2:
-                get_logger().info(f"\nSystem prompt:\n{system}")
-                get_logger().info(f"\nUser prompt:\n{user}")
-
-            response = await acompletion(**kwargs)
+                response = await acompletion(**kwargs)
         except openai.RateLimitError as e:
             get_logger().error(f"Rate limit error during LLM inference: {e}")
             raise
@@ -395,4 +504,71 @@ class LiteLLMAIHandler(BaseAiHandler):
             if get_settings().config.verbosity_level >= 2:
                 get_logger().info(f"\nAI response:\n{resp}")
 
+            if response_cache and resp:
+                response_cache.set(cache_key, (resp, finish_reason))
+
         return resp, finish_reason
+
+    async def chat_completion_stream(self, model: str, system: str, user: str, temperature: float = 0.2,
+                                     img_path: str = None, response_schema: dict = None) -> AsyncIterator[str]:
+        try:
+            kwargs, system, user = self._prepare_completion_kwargs(model, system, user, temperature, img_path)
+        except ImageLinkError as e:
+            yield str(e)
+            return
+
+        if response_schema and self._supports_response_schema(kwargs["model"]):
+            kwargs["response_format"] = {"type": "json_schema", "json_schema": response_schema}
+
+        response_cache = get_response_cache()
+        if response_cache:
+            cache_key = response_cache_key(kwargs["model"], kwargs["messages"], kwargs.get("temperature"),
+                                           kwargs.get("seed", -1), kwargs.get("reasoning_effort"),
+                                           kwargs.get("response_format"))
+            cached_response = response_cache.get(cache_key)
+            if cached_response:
+                get_logger().info("Using a cached AI response", artifact=response_cache.stats())
+                yield cached_response[0]
+                return
+
+        # a stream holds its admission until it ends. It is not queued again on a rate limit, since its first chunks
+        # may have been yielded already
+        rate_limiter = get_rate_limiter(kwargs["model"], kwargs.get("deployment_id"))
+        if rate_limiter:
+            await rate_limiter.acquire(self._count_prompt_tokens(system, user))
+        success, rate_limited = False, False
+        try:
+            try:
+                response = await acompletion(**kwargs, stream=True)
+            except openai.RateLimitError:
+                rate_limited = True
+                raise
+            except openai.APIError as e:
+                get_logger().warning(f"Error during LLM inference: {e}")
+                raise
+            except Exception as e:
+                get_logger().warning(f"Unknown error during LLM inference: {e}")
+                raise openai.APIError from e
+
+            chunks = []
+            finish_reason = None
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if content:
+                    chunks.append(content)
+                    yield content
+            success = True
+        finally:
+            if rate_limiter:
+                rate_limiter.release(success=success, rate_limited=rate_limited)
+
+        resp = "".join(chunks)
+        get_logger().debug("Full_response", artifact={"system": system, "user": user, "output": resp,
+                                                      "finish_reason": finish_reason, "stream": True})
+        if get_settings().config.verbosity_level >= 2:
+            get_logger().info(f"\nAI response:\n{resp}")
+        if response_cache and resp:
+            response_cache.set(cache_key, (resp, finish_reason))
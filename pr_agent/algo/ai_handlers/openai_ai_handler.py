@@ -1,10 +1,12 @@
 from os import environ
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 import openai
-from openai import AsyncOpenAI
 from tenacity import retry, retry_if_exception_type, retry_if_not_exception_type, stop_after_attempt
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.client_registry import get_ai_client_registry
+from pr_agent.algo.ai_handlers.rate_limiter import get_rate_limiter
+from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
@@ -42,19 +44,30 @@ class OpenAIHandler(BaseAiHandler):
         retry=retry_if_exception_type(openai.APIError) & retry_if_not_exception_type(openai.RateLimitError),
         stop=stop_after_attempt(OPENAI_RETRIES),
     )
-    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None):
+    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None,
+                              response_schema: dict = None):
         try:
             if img_path:
                 get_logger().warning(f"Image path is not supported for OpenAIHandler. Ignoring image path: {img_path}")
             get_logger().info("System: ", system)
             get_logger().info("User: ", user)
             messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
-            client = AsyncOpenAI()
-            chat_completion = await client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-            )
+            # a long-lived client, so that the calls reuse its pool of keep-alive connections
+            client = get_ai_client_registry().get_async_openai_client(get_settings().openai.key,
+                                                                      get_settings().get("OPENAI.API_BASE", None),
+                                                                      get_settings().get("OPENAI.ORG", None))
+            rate_limiter = get_rate_limiter(model, self.deployment_id)
+            if rate_limiter:
+                token_handler = TokenHandler()
+                chat_completion = await rate_limiter.run(
+                    lambda: client.chat.completions.create(model=model, messages=messages, temperature=temperature),
+                    tokens=token_handler.count_tokens(system) + token_handler.count_tokens(user))
+            else:
+                chat_completion = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                )
             resp = chat_completion.choices[0].message.content
             finish_reason = chat_completion.choices[0].finish_reason
             usage = chat_completion.usage
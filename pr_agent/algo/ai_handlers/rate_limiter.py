@@ -0,0 +1,156 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+T = TypeVar("T")
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Admits the AI calls of a model (or deployment) in FIFO order, within:
+    - an adaptive concurrency limit (AIMD): +1 per 'limit' successful calls, halved by a rate limit error, which also
+      pauses the admissions for an exponential backoff.
+    - a budget of requests and estimated prompt tokens per sliding window (a minute), if configured.
+
+    A call which does not fit waits in the queue instead of failing, and a call which hits a rate limit error anyway
+    is queued again (up to 'max_rate_limit_retries' times). The state is shared by all the event loops (and threads)
+    of the process, so the concurrent PRs of a server share the budget of a model.
+    """
+
+    def __init__(self, tokens_per_minute: int = 0, requests_per_minute: int = 0, initial_concurrency: int = 8,
+                 max_concurrency: int = 32, max_rate_limit_retries: int = 3, window_seconds: float = 60.0):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.window_seconds = window_seconds
+        self.concurrency = float(min(initial_concurrency, max_concurrency))
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._consecutive_rate_limits = 0
+        self._lock = threading.Lock()
+        self._window = deque()  # (admission time, estimated tokens)
+        self._window_tokens = 0
+        self._queue = deque()  # (event loop, event) of the waiting calls
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Runs 'call' (a factory of a new awaitable on each attempt) when admitted, and re-queues on rate limits."""
+        for attempt in range(self.max_rate_limit_retries + 1):
+            await self.acquire(tokens)
+            try:
+                result = await call()
+            except openai.RateLimitError:
+                self.release(rate_limited=True)
+                if attempt == self.max_rate_limit_retries:
+                    raise
+                get_logger().warning(f"Rate limited, queueing the call again (concurrency limit: "
+                                     f"{int(self.concurrency)})")
+                continue
+            except BaseException:
+                self.release(success=False)
+                raise
+            self.release()
+            return result
+
+    async def acquire(self, tokens: int = 0):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._queue.append(waiter)
+        try:
+            while True:
+                with self._lock:
+                    wait_seconds = self._try_admit(tokens) if self._queue[0] is waiter else math.inf
+                    if wait_seconds is None:
+                        self._queue.popleft()
+                        self._wake_head()
+                        return
+                    waiter[1].clear()
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), None if wait_seconds == math.inf else wait_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:  # e.g. the waiting task was cancelled
+            with self._lock:
+                if waiter in self._queue:
+                    was_head = self._queue[0] is waiter
+                    self._queue.remove(waiter)
+                    if was_head:
+                        self._wake_head()
+            raise
+
+    def release(self, success: bool = True, rate_limited: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if rate_limited:
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self._consecutive_rate_limits += 1
+                backoff_seconds = min(self.window_seconds, 2.0 ** self._consecutive_rate_limits)
+                self._paused_until = max(self._paused_until, time.monotonic() + backoff_seconds)
+            elif success:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+                self._consecutive_rate_limits = 0
+            self._wake_head()
+
+    def _try_admit(self, tokens: int) -> Optional[float]:
+        """Admits a call and returns None, or returns the seconds until it may be admitted (inf: until a release)."""
+        now = time.monotonic()
+        while self._window and self._window[0][0] <= now - self.window_seconds:
+            self._window_tokens -= self._window.popleft()[1]
+        if self.in_flight >= int(self.concurrency):
+            return math.inf
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._window:
+            window_reset = self._window[0][0] + self.window_seconds - now
+            if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+                return window_reset
+            # a call of more tokens than the whole budget is admitted alone
+            if self.tokens_per_minute and self._window_tokens + tokens > self.tokens_per_minute:
+                return window_reset
+        self.in_flight += 1
+        self._window.append((now, tokens))
+        self._window_tokens += tokens
+        return None
+
+    def _wake_head(self):
+        if self._queue:
+            loop, event = self._queue[0]
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # the event loop of the waiter is closed
+                self._queue.popleft()
+                self._wake_head()
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str, deployment_id: str = None) -> Optional[AdaptiveConcurrencyLimiter]:
+    """The limiter of a model (and deployment), shared by the process. None if 'AI_RATE_LIMITER.ENABLED' is false."""
+    settings = get_settings()
+    if not settings.get("AI_RATE_LIMITER.ENABLED", False):
+        return None
+    key = (model, deployment_id or "")
+    if key not in _rate_limiters:
+        with _rate_limiters_lock:
+            if key not in _rate_limiters:
+                model_limits = settings.get("AI_RATE_LIMITER.MODEL_LIMITS", {}) or {}
+                limits = model_limits.get(model, {}) or {}
+                _rate_limiters[key] = AdaptiveConcurrencyLimiter(
+                    tokens_per_minute=limits.get("tokens_per_minute",
+                                                 settings.get("AI_RATE_LIMITER.TOKENS_PER_MINUTE", 0)),
+                    requests_per_minute=limits.get("requests_per_minute",
+                                                   settings.get("AI_RATE_LIMITER.REQUESTS_PER_MINUTE", 0)),
+                    initial_concurrency=settings.get("AI_RATE_LIMITER.INITIAL_CONCURRENCY", 8),
+                    max_concurrency=settings.get("AI_RATE_LIMITER.MAX_CONCURRENCY", 32),
+                    max_rate_limit_retries=settings.get("AI_RATE_LIMITER.MAX_RATE_LIMIT_RETRIES", 3))
+    return _rate_limiters[key]
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+CachedResponse = Tuple[str, str]  # (response, finish_reason)
+
+
+def response_cache_key(model: str, messages: list, temperature: Optional[float], seed: int,
+                       reasoning_effort: Optional[str] = None, response_format: Optional[dict] = None) -> str:
+    """
+    Hash of everything that determines the model response: the model, the rendered prompts (messages),
+    the sampling parameters, and the requested response format (structured output), if any.
+    """
+    key = {"model": model, "messages": messages, "temperature": temperature, "seed": seed,
+           "reasoning_effort": reasoning_effort}
+    if response_format:
+        key["response_format"] = response_format
+    payload = json.dumps(key, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCacheBackend(ABC):
+    """
+    Storage of cached responses. A backend evicts entries after their TTL, and when it exceeds its size limit.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedResponse]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: CachedResponse, ttl_seconds: int):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class InMemoryResponseCacheBackend(ResponseCacheBackend):
+    """An LRU cache of the process, with a maximal number of entries."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CachedResponse, ttl_seconds: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, tuple(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseCacheBackend(ResponseCacheBackend):
+    """A cache in a local SQLite file, which can be shared between server workers and survives restarts."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, "
+                                     "finish_reason TEXT, expires_at REAL, accessed_at REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT response, finish_reason, expires_at FROM responses WHERE key = ?",
+                                           (key,)).fetchone()
+            if row is None:
+                return None
+            if row[2] < now:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def set(self, key: str, value: CachedResponse, ttl_seconds: int):
+        now = time.time()
+        response, finish_reason = value
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                     (key, response, str(finish_reason), now + ttl_seconds, now))
+            self._connection.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            self._connection.execute("DELETE FROM responses WHERE key NOT IN "
+                                     "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)",
+                                     (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+
+class RedisResponseCacheBackend(ResponseCacheBackend):
+    """
+    A cache in a Redis-compatible server (e.g. a local redis, valkey or dragonfly instance). Entries expire by their
+    TTL, and size-based eviction is left to the server 'maxmemory-policy'.
+    """
+
+    KEY_PREFIX = "pr_agent:response_cache:"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise Exception("Please install 'redis' to use redis as a response cache backend") from e
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        value = self._client.get(self.KEY_PREFIX + key)
+        if value is None:
+            return None
+        response, finish_reason = json.loads(value)
+        return response, finish_reason
+
+    def set(self, key: str, value: CachedResponse, ttl_seconds: int):
+        self._client.set(self.KEY_PREFIX + key, json.dumps(list(value)), ex=ttl_seconds)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.KEY_PREFIX + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+
+class ResponseCache:
+    """
+    A cache of LLM responses, keyed by 'response_cache_key'. Failures of the backend never fail the LLM call,
+    they are logged and treated as a cache miss.
+    """
+
+    def __init__(self, backend: ResponseCacheBackend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            get_logger().warning(f"Failed to read from the response cache: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: CachedResponse):
+        try:
+            self.backend.set(key, value, self.ttl_seconds)
+        except Exception as e:
+            get_logger().warning(f"Failed to write to the response cache: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the response cache of the process, or None if it is disabled.
+    """
+    global _response_cache
+    settings = get_settings()
+    if not settings.get("RESPONSE_CACHE.ENABLED", False):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                backend_type = settings.get("RESPONSE_CACHE.BACKEND", "memory")
+                max_entries = settings.get("RESPONSE_CACHE.MAX_ENTRIES", 1000)
+                if backend_type == "sqlite":
+                    backend = SQLiteResponseCacheBackend(settings.get("RESPONSE_CACHE.SQLITE_PATH",
+                                                                      "./.pr_agent_response_cache.db"), max_entries)
+                elif backend_type == "redis":
+                    backend = RedisResponseCacheBackend(settings.get("RESPONSE_CACHE.REDIS_URL",
+                                                                     "redis://localhost:6379/0"))
+                elif backend_type == "memory":
+                    backend = InMemoryResponseCacheBackend(max_entries)
+                else:
+                    raise ValueError(f"Unknown response cache backend: {backend_type}")
+                _response_cache = ResponseCache(backend, settings.get("RESPONSE_CACHE.TTL_SECONDS", 86400))
+    return _response_cache
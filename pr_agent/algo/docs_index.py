@@ -0,0 +1,320 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+try:
+    import numpy as np
+except ImportError:  # embeddings are optional, the BM25 index doesn't need numpy
+    np = None
+
+WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+STOP_WORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "if",
+              "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+              "with", "you", "your"}
+RST_SECTION_CHARS = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+@dataclass
+class DocSection:
+    file_path: str  # as presented to the model, e.g. '/docs/usage-guide/index.md'
+    heading: str  # the heading line of the section, '' for the text before the first heading
+    content: str  # including the heading line
+    tokens: int = 0
+
+
+def _split_at_headings(lines: List[str], ext: str) -> List[Tuple[str, List[str]]]:
+    sections = [("", [])]
+    in_code_block = False
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_code_block = not in_code_block
+        if in_code_block:
+            sections[-1][1].append(line)
+            continue
+        if ext in (".md", ".mdx") and stripped.startswith("#"):
+            sections.append((stripped, [line]))
+            continue
+        if (ext == ".rst" and stripped and i + 1 < len(lines) and len(lines[i + 1].rstrip()) >= len(stripped) and
+                lines[i + 1].rstrip() and all(c == lines[i + 1][0] for c in lines[i + 1].rstrip()) and
+                lines[i + 1][0] in RST_SECTION_CHARS):
+            sections.append((stripped, [line]))
+            continue
+        sections[-1][1].append(line)
+    return sections
+
+
+def split_doc_sections(file_path: str, content: str, max_section_chars: int = 4000) -> List[DocSection]:
+    """
+    Splits a documentation file into its sections (by Markdown or reStructuredText headings). Sections longer than
+    'max_section_chars' are chunked at paragraph boundaries, and every chunk keeps the heading of its section.
+    """
+    ext = os.path.splitext(file_path)[-1].lower()
+    doc_sections = []
+    for heading, lines in _split_at_headings(content.splitlines(), ext):
+        text = "\n".join(lines).strip()
+        if not re.search(r"[a-zA-Z]", text):
+            continue
+        chunk = ""
+        for paragraph in re.split(r"\n\s*\n", text):
+            if chunk and len(chunk) + len(paragraph) > max_section_chars:
+                doc_sections.append(DocSection(file_path, heading, chunk))
+                chunk = f"{heading}\n(continued)\n\n" if heading else ""
+            chunk += f"{paragraph[:max_section_chars]}\n\n"
+        doc_sections.append(DocSection(file_path, heading, chunk.strip()))
+    return doc_sections
+
+
+class BM25Index:
+    """A lexical (Okapi BM25) index of a list of documents, with inverted postings: term -> [(document, tf)]."""
+
+    def __init__(self, postings: Dict[str, List[List[int]]], doc_lengths: List[int], k1: float = 1.2,
+                 b: float = 0.75):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, documents: List[str]) -> "BM25Index":
+        postings, doc_lengths = {}, []
+        for doc_id, document in enumerate(documents):
+            terms = tokenize(document)
+            doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append([doc_id, tf])
+        return cls(postings, doc_lengths)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        The 'top_k' (document, score) of the query, by descending score. Documents without a query term are left out.
+        """
+        num_docs = len(self.doc_lengths)
+        scores = Counter()
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_doc_length or 1)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return scores.most_common(top_k)
+
+    def to_dict(self) -> dict:
+        return {"postings": self.postings, "doc_lengths": self.doc_lengths}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        return cls(data["postings"], data["doc_lengths"])
+
+
+class SectionEmbeddings:
+    """The embeddings of the sections of a docs index: a float32 matrix with one unit-normalized row per section."""
+
+    def __init__(self, model: str, matrix):
+        self.model = model
+        self.matrix = matrix
+
+    @classmethod
+    def from_vectors(cls, model: str, vectors: List[List[float]]) -> "SectionEmbeddings":
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return cls(model, matrix / np.maximum(norms, 1e-12))
+
+    def search(self, query_vector: List[float], top_k: int) -> List[Tuple[int, float]]:
+        """The 'top_k' (section, cosine similarity) of the query vector, by descending similarity."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = self.matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [(int(i), float(scores[i])) for i in top[np.argsort(-scores[top])]]
+
+
+class DocsIndex:
+    """
+    The documentation of a repo at a commit: its sections, their token counts, and a BM25 index of them (and
+    optionally their embeddings). 'files' maps each indexed file to its blob sha, so that a newer commit re-reads
+    only the changed files.
+    """
+
+    def __init__(self, commit_sha: str, files: Dict[str, str], sections: List[DocSection], bm25: BM25Index = None,
+                 refreshed_at: float = 0.0, embeddings: SectionEmbeddings = None):
+        self.commit_sha = commit_sha
+        self.files = files
+        self.sections = sections
+        self.bm25 = bm25 or BM25Index.build([f"{section.file_path}\n{section.content}" for section in sections])
+        self.refreshed_at = refreshed_at or time.time()
+        self.embeddings = embeddings
+
+    @classmethod
+    def build(cls, commit_sha: str, files: List[Tuple[str, str]], read_files: Callable[[List[str]], List[str]],
+              count_tokens: Callable[[str], int], previous: "DocsIndex" = None) -> "DocsIndex":
+        """
+        Indexes 'files' ([(file path, blob sha)]). The sections of files which are unchanged since the 'previous' index
+        are reused, and only the other files are read (by 'read_files') and tokenized.
+        """
+        previous_sections = {}
+        if previous:
+            for section in previous.sections:
+                previous_sections.setdefault(section.file_path, []).append(section)
+        changed_files = [path for path, blob_sha in files if not previous or previous.files.get(path) != blob_sha]
+        new_sections = {}
+        for path, content in zip(changed_files, read_files(changed_files) if changed_files else [], strict=True):
+            new_sections[path] = split_doc_sections(path, content)
+            for section in new_sections[path]:
+                section.tokens = count_tokens(section.content)
+        sections = []
+        for path, _ in files:
+            sections.extend(new_sections[path] if path in new_sections else previous_sections.get(path, []))
+        get_logger().info(f"Indexed the docs at commit {commit_sha}: {len(files)} files ({len(changed_files)} read), "
+                          f"{len(sections)} sections")
+        return cls(commit_sha, dict(files), sections)
+
+    def search(self, question: str, max_tokens: int, max_sections: int = None,
+               query_embedding: List[float] = None) -> List[DocSection]:
+        """
+        The sections most relevant to the question, by descending relevance, up to 'max_tokens' in total. Ranked by
+        cosine similarity when the embedding of the question is given (and the index has embeddings), else by BM25.
+        """
+        top_k = max_sections or len(self.sections)
+        if query_embedding is not None and self.embeddings is not None:
+            ranking = self.embeddings.search(query_embedding, top_k)
+        else:
+            ranking = self.bm25.search(question, top_k)
+        ranked = [self.sections[doc_id] for doc_id, _ in ranking]
+        if not ranked:  # no common terms - the model decides if the question is relevant at all
+            ranked = self.sections[:top_k]
+        selected, total_tokens = [], 0
+        for section in ranked:
+            if total_tokens + section.tokens > max_tokens:
+                continue
+            selected.append(section)
+            total_tokens += section.tokens
+        return selected
+
+    def group_by_file(self, sections: List[DocSection]) -> Dict[str, str]:
+        """File path -> the contents of its given sections (in the order of the file). Files by order of relevance."""
+        section_order = {id(section): i for i, section in enumerate(self.sections)}
+        file_path_to_sections = {}
+        for section in sections:
+            file_path_to_sections.setdefault(section.file_path, []).append(section)
+        return {file_path: "\n\n".join(section.content for section in
+                                        sorted(file_sections, key=lambda s: section_order.get(id(s), 0)))
+                for file_path, file_sections in file_path_to_sections.items()}
+
+    def to_dict(self) -> dict:
+        return {"commit_sha": self.commit_sha, "files": self.files, "refreshed_at": self.refreshed_at,
+                "sections": [asdict(section) for section in self.sections], "bm25": self.bm25.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DocsIndex":
+        return cls(data["commit_sha"], data["files"], [DocSection(**section) for section in data["sections"]],
+                   BM25Index.from_dict(data["bm25"]), data["refreshed_at"])
+
+    def save(self, index_dir: str):
+        """Saves the index as 'index.json', and its embeddings (if any) as a NumPy matrix, 'embeddings.npy'."""
+        os.makedirs(index_dir, exist_ok=True)
+        data = self.to_dict()
+        if self.embeddings is not None:
+            data["embedding_model"] = self.embeddings.model
+            np.save(os.path.join(index_dir, "embeddings.npy"), self.embeddings.matrix, allow_pickle=False)
+        with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, index_dir: str) -> "DocsIndex":
+        with open(os.path.join(index_dir, "index.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls.from_dict(data)
+        embeddings_path = os.path.join(index_dir, "embeddings.npy")
+        if data.get("embedding_model") and np is not None and os.path.exists(embeddings_path):
+            index.embeddings = SectionEmbeddings(data["embedding_model"],
+                                                 np.load(embeddings_path, mmap_mode="r", allow_pickle=False))
+        return index
+
+
+class DocsIndexStore:
+    """
+    The latest docs index per key (a repo and the docs configuration): in memory, and as JSON files under 'index_dir',
+    which are shared between server workers and survive restarts.
+    """
+
+    def __init__(self, index_dir: str, max_entries: int = 32):
+        self.index_dir = index_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.index_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json")
+
+    def get(self, key: str) -> Optional[DocsIndex]:
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                index = DocsIndex.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            get_logger().warning(f"Failed to load the docs index of {key}: {e}")
+            return None
+        self._put(key, index)
+        return index
+
+    def set(self, key: str, index: DocsIndex):
+        self._put(key, index)
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(index.to_dict(), f)
+            os.replace(temp_path, self._path(key))  # atomic - readers never see a partial index
+        except Exception as e:
+            get_logger().warning(f"Failed to save the docs index of {key}: {e}")
+
+    def _put(self, key: str, index: DocsIndex):
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_docs_index_store = None
+_docs_index_store_lock = threading.Lock()
+
+
+def get_docs_index_store() -> DocsIndexStore:
+    global _docs_index_store
+    if _docs_index_store is None:
+        with _docs_index_store_lock:
+            if _docs_index_store is None:
+                _docs_index_store = DocsIndexStore(get_settings().get("PR_HELP_DOCS.DOCS_INDEX_DIR",
+                                                                      "/tmp/pr_agent_docs_index"))
+    return _docs_index_store
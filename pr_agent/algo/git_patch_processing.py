@@ -7,6 +7,8 @@ from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
+RE_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
+
 
 def extend_patch(original_file_str, patch_str, patch_extra_lines_before=0,
                  patch_extra_lines_after=0, filename: str = "", new_file_str="") -> str:
@@ -297,6 +299,24 @@ def handle_patch_deletions(patch: str, original_file_content_str: str,
     return patch
 
 
+def split_patch_to_hunks(patch: str) -> tuple[str, list[str]]:
+    """
+    Split a patch (either a raw patch, or a patch converted by 'decouple_and_convert_to_hunks_with_lines_numbers')
+    into its header (e.g. the '## File: ...' line), and its hunks. Each hunk starts with its '@@ ... @@' line.
+    Joining the (non-empty) header and the hunks with newlines restores the original patch.
+    """
+    header_lines = []
+    hunks = []
+    for line in patch.split('\n'):
+        if line.startswith('@@') and RE_HUNK_HEADER.match(line):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+        else:
+            header_lines.append(line)
+    return '\n'.join(header_lines), ['\n'.join(hunk_lines) for hunk_lines in hunks]
+
+
 def decouple_and_convert_to_hunks_with_lines_numbers(patch: str, file) -> str:
     """
     Convert a given patch string into a string with line numbers for each hunk, indicating the new and old content of
@@ -0,0 +1,148 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+FINDING_KEYS = ("relevant_file", "issue_header", "issue_content", "start_line", "end_line")
+
+
+@dataclass
+class ReviewState:
+    """The head commit of the last review of a PR by a command, and the findings of that review."""
+    head_sha: str
+    findings: List[dict] = field(default_factory=list)
+    updated_at: float = 0.0
+
+
+class ReviewStateStore:
+    """
+    The last review state per (PR, command). An LRU of the process by default, or a local SQLite file, which is shared
+    between server workers and survives restarts.
+    """
+
+    def __init__(self, sqlite_path: str = "", max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (pr_url, command) -> ReviewState
+        self._connection = None
+        if sqlite_path:
+            if os.path.dirname(sqlite_path):
+                os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
+            self._connection = sqlite3.connect(sqlite_path, timeout=10, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS review_states (pr_url TEXT, command TEXT, "
+                                         "head_sha TEXT, findings TEXT, updated_at REAL, "
+                                         "PRIMARY KEY (pr_url, command))")
+
+    def get(self, pr_url: str, command: str) -> Optional[ReviewState]:
+        with self._lock:
+            if self._connection is None:
+                state = self._entries.get((pr_url, command))
+                if state is not None:
+                    self._entries.move_to_end((pr_url, command))
+                return state
+            row = self._connection.execute("SELECT head_sha, findings, updated_at FROM review_states "
+                                           "WHERE pr_url = ? AND command = ?", (pr_url, command)).fetchone()
+        if row is None:
+            return None
+        return ReviewState(head_sha=row[0], findings=json.loads(row[1]), updated_at=row[2])
+
+    def set(self, pr_url: str, command: str, state: ReviewState):
+        state = ReviewState(state.head_sha, list(state.findings), state.updated_at or time.time())
+        with self._lock:
+            if self._connection is None:
+                self._entries[(pr_url, command)] = state
+                self._entries.move_to_end((pr_url, command))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                return
+            with self._connection:
+                self._connection.execute("INSERT OR REPLACE INTO review_states VALUES (?, ?, ?, ?, ?)",
+                                         (pr_url, command, state.head_sha, json.dumps(state.findings),
+                                          state.updated_at))
+                self._connection.execute("DELETE FROM review_states WHERE rowid NOT IN "
+                                         "(SELECT rowid FROM review_states ORDER BY updated_at DESC LIMIT ?)",
+                                         (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM review_states")
+
+
+_review_state_store = None
+_review_state_store_lock = threading.Lock()
+
+
+def get_review_state_store() -> ReviewStateStore:
+    global _review_state_store
+    if _review_state_store is None:
+        with _review_state_store_lock:
+            if _review_state_store is None:
+                settings = get_settings()
+                _review_state_store = ReviewStateStore(
+                    settings.get("PR_REVIEWER.INCREMENTAL_REVIEW_STATE_PATH", ""),
+                    settings.get("PR_REVIEWER.INCREMENTAL_REVIEW_MAX_ENTRIES", 1000))
+    return _review_state_store
+
+
+def get_interdiff_files(git_provider, last_reviewed_sha: str, head_sha: str) -> Optional[List[FilePatchInfo]]:
+    """
+    The changes of the PR since 'last_reviewed_sha': the diff between the two heads, restricted to the files of the
+    PR (so changes merged from the base branch are left out). Only the head contents of these files are fetched, when
+    the inter-diff doesn't include them; the full PR diff files are reused only if they are already loaded.
+    Returns None if the inter-diff is not available (e.g. the PR history was rewritten), which means a full review.
+    """
+    try:
+        interdiff_files = git_provider.get_diff_files_between(last_reviewed_sha, head_sha)
+    except Exception as e:
+        get_logger().warning(f"Failed to compute the changes since commit {last_reviewed_sha}: {e}")
+        return None
+    if interdiff_files is None:
+        return None
+    pr_filenames = {getattr(file, "filename", file) for file in git_provider.get_files()}
+    loaded_files = {file.filename: file for file in getattr(git_provider, "diff_files", None) or []}
+    diff_files = []
+    for file in interdiff_files:
+        if file.filename not in pr_filenames or not file.patch:
+            continue
+        head_file = file.head_file
+        if not head_file and file.edit_type != EDIT_TYPE.DELETED:
+            head_file = git_provider.get_pr_file_content(file.filename, head_sha)
+        loaded_file = loaded_files.get(file.filename)
+        patch_lines = file.patch.splitlines()
+        diff_files.append(FilePatchInfo(file.base_file, head_file, file.patch, file.filename,
+                                        edit_type=file.edit_type, old_filename=file.old_filename,
+                                        num_plus_lines=len([line for line in patch_lines if line.startswith("+")]),
+                                        num_minus_lines=len([line for line in patch_lines if line.startswith("-")]),
+                                        language=loaded_file.language if loaded_file else file.language,
+                                        ai_file_summary=loaded_file.ai_file_summary if loaded_file else None))
+    return diff_files
+
+
+def get_review_findings(data: dict) -> List[dict]:
+    """The findings ('key_issues_to_review') of a parsed review, with only the fields which are reused as context."""
+    key_issues = (data or {}).get("review", {}).get("key_issues_to_review", [])
+    if not isinstance(key_issues, list):
+        return []
+    return [{key: issue.get(key) for key in FINDING_KEYS if key in issue} for issue in key_issues
+            if isinstance(issue, dict)]
+
+
+def format_review_findings(findings: List[dict]) -> str:
+    findings_str = []
+    for finding in findings:
+        lines = f"{finding.get('start_line')}-{finding.get('end_line')}" if finding.get("start_line") else ""
+        findings_str.append(f"- {finding.get('relevant_file', '')} {lines}: {finding.get('issue_header', '')}\n"
+                            f"  {str(finding.get('issue_content', '')).strip()}")
+    return "\n".join(findings_str)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 import traceback
 from typing import Callable, List, Tuple
 
@@ -7,7 +8,7 @@ from github import RateLimitExceededException
 
 from pr_agent.algo.file_filter import filter_ignored
 from pr_agent.algo.git_patch_processing import (
-    extend_patch, handle_patch_deletions,
+    extend_patch, handle_patch_deletions, split_patch_to_hunks,
     decouple_and_convert_to_hunks_with_lines_numbers)
 from pr_agent.algo.language_handler import sort_files_by_main_languages
 from pr_agent.algo.token_handler import TokenHandler
@@ -27,6 +28,10 @@ OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD = 1500
 OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD = 1000
 MAX_EXTRA_LINES = 10
 
+RE_HUNK_SECTION_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@[ ]?(.*)")
+RE_CHANGED_LINE = re.compile(r"^(?:\d+ )?[+-]")  # '+'/'-' lines of a raw patch, or of a patch with line numbers
+SECTION_HEADER_HUNK_FACTOR = 1.25
+
 
 def cap_and_log_extra_lines(value, direction) -> int:
     if value > MAX_EXTRA_LINES:
@@ -40,7 +45,8 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
                 add_line_numbers_to_hunks: bool = False,
                 disable_extra_lines: bool = False,
                 large_pr_handling=False,
-                return_remaining_files=False):
+                return_remaining_files=False,
+                diff_files: list[FilePatchInfo] = None):
     if disable_extra_lines:
         PATCH_EXTRA_LINES_BEFORE = 0
         PATCH_EXTRA_LINES_AFTER = 0
@@ -50,11 +56,13 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
         PATCH_EXTRA_LINES_BEFORE = cap_and_log_extra_lines(PATCH_EXTRA_LINES_BEFORE, "before")
         PATCH_EXTRA_LINES_AFTER = cap_and_log_extra_lines(PATCH_EXTRA_LINES_AFTER, "after")
 
-    try:
-        diff_files = git_provider.get_diff_files()
-    except RateLimitExceededException as e:
-        get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
-        raise
+    # 'diff_files' can be a subset of the PR changes, e.g. the changes since the last review (incremental review)
+    if diff_files is None:
+        try:
+            diff_files = git_provider.get_diff_files()
+        except RateLimitExceededException as e:
+            get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
+            raise
 
     # get pr languages
     pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
@@ -100,7 +108,8 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
     # generate the added, modified, and deleted files lists
     if (max_tokens - curr_token) > delta_tokens:
         for filename, file_values in file_dict.items():
-            if filename in files_in_patch:
+            # files which were only partly packed into the patch are listed too
+            if filename in files_in_patch and filename not in remaining_files_list:
                 continue
             if file_values['edit_type'] == EDIT_TYPE.ADDED:
                 unprocessed_files.append(filename)
@@ -214,8 +223,11 @@ def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, mo
 
     # sort each one of the languages in top_langs by the number of tokens in the diff
     sorted_files = []
-    for lang in top_langs:
+    language_ranks = {}
+    for language_rank, lang in enumerate(top_langs):
         sorted_files.extend(sorted(lang['files'], key=lambda x: x.tokens, reverse=True))
+        for file in lang['files']:
+            language_ranks.setdefault(file.filename, language_rank)
 
     # generate patches for each file, and count tokens
     file_dict = {}
@@ -242,17 +254,21 @@ def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, mo
         #     patch = add_ai_summary_top_patch(file, patch)
 
         new_patch_tokens = token_handler.count_tokens(patch)
-        file_dict[file.filename] = {'patch': patch, 'tokens': new_patch_tokens, 'edit_type': file.edit_type}
+        file_dict[file.filename] = {'patch': patch, 'tokens': new_patch_tokens, 'edit_type': file.edit_type,
+                                    'language_rank': language_ranks.get(file.filename, 0)}
 
     max_tokens_model = get_max_tokens(model)
 
+    # when packing hunks, the hunks which were left out of a patch are carried to the next iterations
+    pending_file_dict = dict(file_dict)
+
     # first iteration
     files_in_patches_list = []
     remaining_files_list =  [file.filename for file in sorted_files]
     patches_list =[]
     total_tokens_list = []
-    total_tokens, patches, remaining_files_list, files_in_patch_list = generate_full_patch(convert_hunks_to_line_numbers, file_dict,
-                                       max_tokens_model, remaining_files_list, token_handler)
+    total_tokens, patches, remaining_files_list, files_in_patch_list = generate_full_patch(
+        convert_hunks_to_line_numbers, pending_file_dict, max_tokens_model, remaining_files_list, token_handler)
     patches_list.append(patches)
     total_tokens_list.append(total_tokens)
     files_in_patches_list.append(files_in_patch_list)
@@ -262,10 +278,9 @@ def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, mo
         NUMBER_OF_ALLOWED_ITERATIONS = get_settings().pr_description.max_ai_calls - 1 # one more call is to summarize
         for i in range(NUMBER_OF_ALLOWED_ITERATIONS-1):
             if remaining_files_list:
-                total_tokens, patches, remaining_files_list, files_in_patch_list = generate_full_patch(convert_hunks_to_line_numbers,
-                                                                                 file_dict,
-                                                                                  max_tokens_model,
-                                                                                  remaining_files_list, token_handler)
+                total_tokens, patches, remaining_files_list, files_in_patch_list = generate_full_patch(
+                    convert_hunks_to_line_numbers, pending_file_dict, max_tokens_model, remaining_files_list,
+                    token_handler)
                 if patches:
                     patches_list.append(patches)
                     total_tokens_list.append(total_tokens)
@@ -273,6 +288,8 @@ def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, mo
             else:
                 break
 
+    # files which were only partly packed into the patches (some of their hunks were left out) remain in
+    # 'remaining_files_list', so they are still reported as not fully processed
     return patches_list, total_tokens_list, deleted_files_list, remaining_files_list, file_dict, files_in_patches_list
 
 
@@ -288,35 +305,123 @@ def generate_full_patch(convert_hunks_to_line_numbers, file_dict, max_tokens_mod
         patch = data['patch']
         new_patch_tokens = data['tokens']
         edit_type = data['edit_type']
+        if not convert_hunks_to_line_numbers:
+            patch_prefix, patch_suffix = f"\n\n## File: '{filename.strip()}'\n\n", "\n"
+        else:
+            patch_prefix, patch_suffix = "\n\n", ""
 
         # Hard Stop, no more tokens
         if total_tokens > max_tokens_model - OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD:
             get_logger().warning(f"File was fully skipped, no more tokens: {filename}.")
             continue
 
-        # If the patch is too large, just show the file name
+        # If the patch is too large, pack its most relevant hunks (if enabled), or just show the file name
         if total_tokens + new_patch_tokens > max_tokens_model - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD:
-            # Current logic is to skip the patch if it's too large
-            # TODO: Option for alternative logic to remove hunks from the patch to reduce the number of tokens
-            #  until we meet the requirements
+            if patch and get_settings().config.get('patch_packing_policy', 'file') == 'hunks':
+                wrapper_tokens = token_handler.count_tokens(patch_prefix) + token_handler.count_tokens(patch_suffix)
+                available_tokens = max_tokens_model - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD - total_tokens
+                packed_patch, packed_tokens, patch_rest = pack_patch_hunks(
+                    patch, token_handler, available_tokens - wrapper_tokens, data.get('language_rank', 0))
+                if packed_patch:
+                    packed_wrapped_tokens = token_handler.count_wrapped_tokens(patch_prefix, packed_patch,
+                                                                               packed_tokens, patch_suffix)
+                    if packed_wrapped_tokens <= available_tokens:
+                        patches.append(patch_prefix + packed_patch.strip() + patch_suffix)
+                        total_tokens += packed_wrapped_tokens
+                        files_in_patch_list.append(filename)
+                        if patch_rest:
+                            file_dict[filename] = {**data, 'patch': patch_rest,
+                                                   'tokens': token_handler.count_tokens(patch_rest)}
+                            remaining_files_list_new.append(filename)
+                        if get_settings().config.verbosity_level >= 2:
+                            get_logger().info(f"Packed hunks of a large patch, tokens: {total_tokens}, "
+                                              f"last filename: {filename}")
+                        continue
             if get_settings().config.verbosity_level >= 2:
                 get_logger().warning(f"Patch too large, skipping it: '{filename}'")
             remaining_files_list_new.append(filename)
             continue
 
         if patch:
-            if not convert_hunks_to_line_numbers:
-                patch_final = f"\n\n## File: '{filename.strip()}'\n\n{patch.strip()}\n"
-            else:
-                patch_final = "\n\n" + patch.strip()
+            patch_final = patch_prefix + patch.strip() + patch_suffix
             patches.append(patch_final)
-            total_tokens += token_handler.count_tokens(patch_final)
+            # the wrapper overhead is computed from the already known patch tokens, instead of re-encoding the patch
+            total_tokens += token_handler.count_wrapped_tokens(patch_prefix, patch, new_patch_tokens, patch_suffix)
             files_in_patch_list.append(filename)
             if get_settings().config.verbosity_level >= 2:
                 get_logger().info(f"Tokens: {total_tokens}, last filename: {filename}")
     return total_tokens, patches, remaining_files_list_new, files_in_patch_list
 
 
+def score_hunk(hunk: str, language_rank: int = 0) -> float:
+    """
+    Score the relevance of a hunk for review: the number of changed lines, weighted by the priority of the file
+    language (files in the main language of the PR first), and boosted if the hunk has a section header
+    (e.g. an enclosing function or class).
+    """
+    hunk_lines = hunk.splitlines()
+    num_changed_lines = sum(1 for line in hunk_lines[1:] if RE_CHANGED_LINE.match(line))
+    score = num_changed_lines / (1 + language_rank)
+    match = RE_HUNK_SECTION_HEADER.match(hunk_lines[0]) if hunk_lines else None
+    if match and match.group(1).strip():
+        score *= SECTION_HEADER_HUNK_FACTOR
+    return score
+
+
+def pack_patch_hunks(patch: str, token_handler: TokenHandler, max_tokens: int,
+                     language_rank: int = 0) -> Tuple[str, int, str]:
+    """
+    Pack the most relevant hunks of a patch into a token budget, instead of skipping the whole patch.
+
+    The hunks are selected greedily by their score per token (a knapsack approximation), and the selection is
+    compared to the single most relevant hunk that fits. Hunks without changed lines (score 0) are packed last, only
+    into the budget that is left. The selected hunks keep their original order.
+
+    Returns:
+        Tuple[str, int, str]: the packed patch (empty if no hunk fits), its number of tokens, and a patch with the
+        hunks that were left out (empty if all the hunks were packed).
+    """
+    header, hunks = split_patch_to_hunks(patch)
+    if not hunks or max_tokens <= 0:
+        return "", 0, patch
+
+    def join_hunks(indices) -> str:
+        return "\n".join(([header] if header else []) + [hunks[i] for i in indices])
+
+    header_tokens = token_handler.count_tokens(header + "\n") if header else 0
+    budget = max_tokens - header_tokens
+    hunk_tokens = [token_handler.count_tokens(hunk + "\n") for hunk in hunks]
+    hunk_scores = [score_hunk(hunk, language_rank) for hunk in hunks]
+
+    candidates = sorted((i for i in range(len(hunks)) if hunk_tokens[i] <= budget),
+                        key=lambda i: hunk_scores[i] / max(hunk_tokens[i], 1), reverse=True)
+    selected = []
+    used_tokens = 0
+    for i in candidates:
+        if used_tokens + hunk_tokens[i] <= budget:
+            selected.append(i)
+            used_tokens += hunk_tokens[i]
+    if candidates:
+        best_single = max(candidates, key=lambda i: hunk_scores[i])
+        if hunk_scores[best_single] > sum(hunk_scores[i] for i in selected):
+            selected = [best_single]
+
+    # the sum of the hunk tokens is an estimate, so the packed patch is verified, dropping the least relevant hunks
+    packed_patch, packed_tokens = "", 0
+    while selected:
+        packed_patch = join_hunks(sorted(selected))
+        packed_tokens = token_handler.count_tokens(packed_patch)
+        if packed_tokens <= max_tokens:
+            break
+        selected.pop()
+    if not selected:
+        return "", 0, patch
+
+    selected = set(selected)
+    left_out = [i for i in range(len(hunks)) if i not in selected]
+    return packed_patch, packed_tokens, join_hunks(left_out) if left_out else ""
+
+
 async def retry_with_fallback_models(f: Callable, model_type: ModelType = ModelType.REGULAR):
     all_models = _get_all_models(model_type)
     all_deployments = _get_all_deployments(all_models)
@@ -400,8 +505,11 @@ def get_pr_multi_diffs(git_provider: GitProvider,
 
     # Sort files within each language group by tokens in descending order
     sorted_files = []
-    for lang in pr_languages:
+    language_ranks = {}
+    for language_rank, lang in enumerate(pr_languages):
         sorted_files.extend(sorted(lang['files'], key=lambda x: x.tokens, reverse=True))
+        for file in lang['files']:
+            language_ranks.setdefault(file.filename, language_rank)
 
     # Get the maximum number of extra lines before and after the patch
     PATCH_EXTRA_LINES_BEFORE = get_settings().config.patch_extra_lines_before
@@ -473,6 +581,18 @@ def get_pr_multi_diffs(git_provider: GitProvider,
                 continue
 
         if patch and (total_tokens + new_patch_tokens > get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD):
+            if get_settings().config.get('patch_packing_policy', 'file') == 'hunks':
+                # fill the current call with the most relevant hunks, and carry the rest of the patch to the next call
+                available_tokens = get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD - total_tokens
+                packed_patch, packed_tokens, patch = pack_patch_hunks(patch, token_handler, available_tokens,
+                                                                      language_ranks.get(file.filename, 0))
+                if packed_patch:
+                    patches.append(packed_patch)
+                    total_tokens += packed_tokens
+                if not patch:
+                    continue
+                new_patch_tokens = token_handler.count_tokens(patch)
+
             final_diff = "\n".join(patches)
             final_diff_list.append(final_diff)
             patches = []
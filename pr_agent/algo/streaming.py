@@ -0,0 +1,140 @@
+import re
+import textwrap
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import yaml
+
+from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.log import get_logger
+
+RE_LIST_KEY = re.compile(r"^(\s*)([\w-]+):\s*$")
+
+
+class IncrementalYamlListParser:
+    """
+    Parses a streamed YAML response line by line, and returns the items of the given list keys (e.g.
+    'code_suggestions', 'key_issues_to_review', 'pr_files') as soon as each item is complete, i.e. when the next item
+    (or the next key) starts.
+    The full response should still be parsed at the end of the stream, the items are only meant for progress updates.
+    """
+
+    def __init__(self, list_keys: Iterable[str]):
+        self.list_keys = set(list_keys)
+        self._buffer = ""  # the last, incomplete line
+        self._key = None
+        self._key_indent = -1
+        self._item_indent = None
+        self._item_lines = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        items = []
+        for line in lines:
+            items.extend(self._process_line(line))
+        return items
+
+    def close(self) -> List[Tuple[str, object]]:
+        items = []
+        if self._buffer:
+            items.extend(self._process_line(self._buffer))
+            self._buffer = ""
+        items.extend(self._finish_item())
+        self._key = None
+        return items
+
+    def _process_line(self, line: str) -> List[Tuple[str, object]]:
+        stripped = line.strip()
+        items = []
+        if self._key is not None:
+            if not stripped:
+                if self._item_lines:
+                    self._item_lines.append(line)
+                return items
+            indent = len(line) - len(line.lstrip())
+            is_new_item = stripped == "-" or stripped.startswith("- ")
+            if self._item_indent is None and is_new_item and indent >= self._key_indent:
+                self._item_indent = indent
+            if is_new_item and indent == self._item_indent:
+                items.extend(self._finish_item())
+                self._item_lines = [line]
+                return items
+            if self._item_lines and indent > self._item_indent:
+                self._item_lines.append(line)
+                return items
+            # the list has ended
+            items.extend(self._finish_item())
+            self._key = None
+
+        match = RE_LIST_KEY.match(line)
+        if match and match.group(2) in self.list_keys:
+            self._key = match.group(2)
+            self._key_indent = len(match.group(1))
+            self._item_indent = None
+        return items
+
+    def _finish_item(self) -> List[Tuple[str, object]]:
+        if not self._item_lines:
+            return []
+        item_text = textwrap.dedent("\n".join(self._item_lines) + "\n")
+        self._item_lines = []
+        try:
+            parsed = yaml.safe_load(item_text)
+        except yaml.YAMLError:
+            return []
+        if not isinstance(parsed, list) or not parsed or parsed[0] is None:
+            return []
+        return [(self._key, parsed[0])]
+
+
+class ThrottledCommentUpdater:
+    """
+    Edits a (progress) comment, at most once every 'min_interval_sec' seconds, to stay within the rate limits of the
+    git provider. Throttled updates are dropped, so each update should contain the full comment body.
+    """
+
+    def __init__(self, git_provider, comment, min_interval_sec: float):
+        self.git_provider = git_provider
+        self.comment = comment
+        self.min_interval_sec = min_interval_sec
+        self._last_update = 0.0
+
+    def update(self, body: str, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._last_update < self.min_interval_sec:
+            return False
+        self._last_update = now
+        try:
+            self.git_provider.edit_comment(self.comment, body=body)
+        except Exception as e:
+            get_logger().debug(f"Failed to update the progress comment: {e}")
+            return False
+        return True
+
+
+async def stream_chat_completion(ai_handler: BaseAiHandler, model: str, system: str, user: str, temperature: float,
+                                 list_keys: Iterable[str] = (),
+                                 on_items: Optional[Callable[[List[Tuple[str, object]]], None]] = None,
+                                 on_text: Optional[Callable[[str], None]] = None,
+                                 response_schema: Optional[dict] = None) -> str:
+    """
+    Streams a chat completion, calling 'on_items' with the completed items of 'list_keys' (see
+    IncrementalYamlListParser), and 'on_text' with the response generated so far. Returns the full response.
+    With a 'response_schema' (structured output), the response is a JSON object, so no items are found while it's
+    streamed.
+    """
+    parser = IncrementalYamlListParser(list_keys)
+    response = ""
+    async for chunk in ai_handler.chat_completion_stream(model=model, system=system, user=user,
+                                                         temperature=temperature, response_schema=response_schema):
+        response += chunk
+        items = parser.feed(chunk)
+        if items and on_items:
+            on_items(items)
+        if on_text:
+            on_text(response)
+    items = parser.close()
+    if items and on_items:
+        on_items(items)
+    return response
@@ -0,0 +1,118 @@
+import copy
+import functools
+import json
+import re
+from typing import List, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# the pydantic definitions of the expected output, between '=====' lines of the rendered system prompt
+PYDANTIC_BLOCK_PATTERN = re.compile(r"^=====\n(.*?(?:^class \w+\(BaseModel\):).*?)^=====$", re.MULTILINE | re.DOTALL)
+CLASS_PATTERN = re.compile(r"^class (\w+)\(BaseModel\):\s*$")
+FIELD_PATTERN = re.compile(r"^\s+(\S+?):\s*(.+?)(?:\s*=\s*Field\((.*)\))?\s*$")
+DESCRIPTION_PATTERN = re.compile(r'(?:^|description=)"((?:[^"\\]|\\.)*)"')
+PRIMITIVE_TYPES = {"str": {"type": "string"}, "int": {"type": "integer"}, "float": {"type": "number"},
+                   "bool": {"type": "boolean"}, "dict": {"type": "object"}, "Any": {}}
+
+
+def _split_type_arguments(text: str) -> List[str]:
+    arguments, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            arguments.append(text[start:i].strip())
+            start = i + 1
+    arguments.append(text[start:].strip())
+    return arguments
+
+
+def _type_to_schema(type_text: str, classes: dict) -> dict:
+    type_text = type_text.strip()
+    name, _, arguments = type_text.partition("[")
+    arguments = _split_type_arguments(arguments[:-1]) if arguments else []
+    if name in ("List", "list") and arguments:
+        return {"type": "array", "items": _type_to_schema(arguments[0], classes)}
+    if name == "Optional" and arguments:
+        return {"anyOf": [_type_to_schema(arguments[0], classes), {"type": "null"}]}
+    if name == "Union" and arguments:
+        return {"anyOf": [_type_to_schema(argument, classes) for argument in arguments]}
+    if name == "Literal" and arguments:
+        return {"enum": [argument.strip("'\"") for argument in arguments]}
+    if name in classes:
+        return copy.deepcopy(classes[name])
+    return copy.deepcopy(PRIMITIVE_TYPES.get(name, {}))
+
+
+@functools.lru_cache(maxsize=64)
+def pydantic_definitions_to_json_schema(definitions: str) -> Optional[dict]:
+    """
+    Converts the pydantic definitions of a prompt (as text - they are never executed) to the JSON schema of the last
+    class, which is the type of the output. Returns {'name': class name, 'schema': JSON schema}, or None.
+    """
+    classes = {}
+    name = None
+    for line in definitions.splitlines():
+        if not line.strip():
+            continue
+        class_match = CLASS_PATTERN.match(line)
+        if class_match:
+            name = class_match.group(1)
+            classes[name] = {"type": "object", "properties": {}, "required": []}
+            continue
+        field_match = FIELD_PATTERN.match(line)
+        if not field_match or name is None:
+            return None  # not a definitions block which we understand
+        field_name, type_text, field_arguments = field_match.groups()
+        field_schema = _type_to_schema(type_text, classes)
+        description = DESCRIPTION_PATTERN.search(field_arguments or "")
+        if description:
+            field_schema["description"] = description.group(1).replace('\\"', '"')
+        classes[name]["properties"][field_name] = field_schema
+        classes[name]["required"].append(field_name)
+    if name is None:
+        return None
+    return {"name": name, "schema": classes[name]}
+
+
+def get_response_schema(system_prompt: str) -> Optional[dict]:
+    """
+    The JSON schema of the output of a prompt, from the pydantic definitions in its (rendered) system prompt, when
+    'config.structured_output' is enabled. Returns None otherwise, and for prompts without such definitions.
+    """
+    if not get_settings().get("CONFIG.STRUCTURED_OUTPUT", False) or not system_prompt:
+        return None
+    block = PYDANTIC_BLOCK_PATTERN.search(system_prompt)
+    if not block:
+        return None
+    try:
+        return copy.deepcopy(pydantic_definitions_to_json_schema(block.group(1)))
+    except Exception as e:
+        get_logger().warning(f"Failed to convert the pydantic definitions of the prompt to a JSON schema: {e}")
+        return None
+
+
+def get_structured_output_kwargs(system_prompt: str) -> dict:
+    """The arguments of 'chat_completion' which request a structured output for the prompt, if any."""
+    response_schema = get_response_schema(system_prompt)
+    return {"response_schema": response_schema} if response_schema else {}
+
+
+def parse_json_response(response_text: str) -> Optional[dict]:
+    """
+    A single-pass parser for structured (JSON) responses. Tolerates control characters in strings, a surrounding
+    code fence, and trailing text. Returns None if the response is not a JSON object.
+    """
+    text = response_text.strip()
+    if text.startswith("```"):
+        text = text.removeprefix("```json").removeprefix("```").rstrip().removesuffix("```").strip()
+    if not text.startswith("{"):
+        return None
+    try:
+        data, _ = json.JSONDecoder(strict=False).raw_decode(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
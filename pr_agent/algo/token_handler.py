@@ -1,13 +1,28 @@
-from threading import Lock
-from math import ceil
+import hashlib
 import re
+from collections import OrderedDict
+from functools import lru_cache
+from math import ceil
+from threading import Lock
 
 from jinja2 import Environment, StrictUndefined
-from tiktoken import encoding_for_model, get_encoding
+from tiktoken import Encoding, encoding_for_model, get_encoding
 
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
+# a single jinja environment, shared by all the prompt templates of the process
+JINJA_ENVIRONMENT = Environment(undefined=StrictUndefined)
+
+
+@lru_cache(maxsize=256)
+def get_prompt_template(template: str):
+    """
+    Returns the compiled jinja template of a prompt. The prompts are loaded once from 'settings/*.toml', so the same
+    template texts are rendered over and over, and are compiled only once per process.
+    """
+    return JINJA_ENVIRONMENT.from_string(template)
+
 
 class ModelTypeValidator:
     @staticmethod
@@ -39,6 +54,40 @@ class TokenEncoder:
         return cls._encoder_instance
 
 
+class TokenCountCache:
+    """
+    A process-wide LRU memo of token counts, keyed by (encoding name, digest of the text).
+
+    The same patch strings are tokenized several times during a single tool run (extended diff, compressed diff,
+    final patch), and again by every tool that runs on the same PR.
+    """
+    MAX_ENTRIES = 20_000
+    _counts = OrderedDict()
+    _lock = Lock()
+
+    @classmethod
+    def count(cls, encoder, text: str) -> int:
+        if not isinstance(encoder, Encoding):  # custom or mocked encoders are not memoized
+            return len(encoder.encode(text, disallowed_special=()))
+        key = (encoder.name, hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest())
+        with cls._lock:
+            count = cls._counts.get(key)
+            if count is not None:
+                cls._counts.move_to_end(key)
+                return count
+        count = len(encoder.encode(text, disallowed_special=()))
+        with cls._lock:
+            cls._counts[key] = count
+            if len(cls._counts) > cls.MAX_ENTRIES:
+                cls._counts.popitem(last=False)
+        return count
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._counts.clear()
+
+
 class TokenHandler:
     """
     A class for handling tokens in the context of a pull request.
@@ -55,6 +104,9 @@ class TokenHandler:
     # Constants
     CLAUDE_MODEL = "claude-3-7-sonnet-20250219"
     CLAUDE_MAX_CONTENT_SIZE = 9_000_000 # Maximum allowed content size (9MB) for Claude API
+    # encodings whose pre-tokenization never merges a chunk across a newline followed by a non-whitespace character
+    # (other than '/'). For these, token counts are additive across such boundaries.
+    NEWLINE_SPLIT_STABLE_ENCODINGS = ("o200k_base", "cl100k_base")
 
     def __init__(self, pr=None, vars: dict = {}, system="", user=""):
         """
@@ -86,11 +138,10 @@ class TokenHandler:
         The sum of the number of tokens in the system and user strings.
         """
         try:
-            environment = Environment(undefined=StrictUndefined)
-            system_prompt = environment.from_string(system).render(vars)
-            user_prompt = environment.from_string(user).render(vars)
-            system_prompt_tokens = len(encoder.encode(system_prompt))
-            user_prompt_tokens = len(encoder.encode(user_prompt))
+            system_prompt = get_prompt_template(system).render(vars)
+            user_prompt = get_prompt_template(user).render(vars)
+            system_prompt_tokens = TokenCountCache.count(encoder, system_prompt)
+            user_prompt_tokens = TokenCountCache.count(encoder, user_prompt)
             return system_prompt_tokens + user_prompt_tokens
         except Exception as e:
             get_logger().error(f"Error in _get_system_user_tokens: {e}")
@@ -162,10 +213,46 @@ class TokenHandler:
         Returns:
         The number of tokens in the patch string.
         """
-        encoder_estimate = len(self.encoder.encode(patch, disallowed_special=()))
+        encoder_estimate = TokenCountCache.count(self.encoder, patch)
 
         # If an estimate is enough (for example, in cases where the maximal allowed tokens is way below the known limits), return it.
         if not force_accurate:
             return encoder_estimate
 
         return self._get_token_count_by_model_type(patch, encoder_estimate)
+
+    def count_wrapped_tokens(self, prefix: str, text: str, text_tokens: int, suffix: str = "") -> int:
+        """
+        Counts the number of tokens in 'prefix + text.strip() + suffix', given the (already known) number of tokens
+        in 'text', without re-encoding the whole string.
+
+        The text is split into its leading whitespace, its body up to the last line, and its last line (with the
+        trailing whitespace). When all the split points are newline boundaries which the encoding never merges across,
+        the count is computed arithmetically from the counts of the small parts. Otherwise, the wrapped string is
+        counted directly, so the result is always identical to count_tokens(prefix + text.strip() + suffix).
+        """
+        body = text.strip()
+        if not self._is_stable_split(prefix, body):
+            return self.count_tokens(prefix + body + suffix)
+
+        last_line_start = body.rfind("\n") + 1
+        if last_line_start == 0:  # single line, nothing to reuse
+            return self.count_tokens(prefix) + self.count_tokens(body + suffix)
+
+        last_line = body[last_line_start:]
+        leading_whitespace = text[:len(text) - len(text.lstrip())]
+        if last_line[0] == "/" or "\r" in last_line or (leading_whitespace and not leading_whitespace.endswith("\n")):
+            return self.count_tokens(prefix + body + suffix)
+
+        trailing_whitespace = text[len(leading_whitespace) + len(body):]
+        leading_whitespace_tokens = self.count_tokens(leading_whitespace) if leading_whitespace else 0
+        return (self.count_tokens(prefix)
+                + text_tokens - leading_whitespace_tokens - self.count_tokens(last_line + trailing_whitespace)
+                + self.count_tokens(last_line + suffix))
+
+    def _is_stable_split(self, prefix: str, body: str) -> bool:
+        return (isinstance(self.encoder, Encoding)
+                and self.encoder.name in self.NEWLINE_SPLIT_STABLE_ENCODINGS
+                and prefix.endswith("\n")
+                and bool(body)
+                and body[0] != "/")
@@ -15,6 +15,7 @@ import traceback
 from datetime import datetime
 from enum import Enum
 from importlib.metadata import PackageNotFoundError, version
+from itertools import accumulate
 from typing import Any, List, Tuple, TypedDict
 
 import html2text
@@ -22,10 +23,12 @@ import requests
 import yaml
 from pydantic import BaseModel
 from starlette_context import context
+from tiktoken import Encoding
 
 from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.git_patch_processing import extract_hunk_lines_from_patch
-from pr_agent.algo.token_handler import TokenEncoder
+from pr_agent.algo.structured_output import parse_json_response
+from pr_agent.algo.token_handler import TokenCountCache, TokenEncoder
 from pr_agent.algo.types import FilePatchInfo
 from pr_agent.config_loader import get_settings, global_settings
 from pr_agent.log import get_logger
@@ -741,6 +744,10 @@ def _fix_key_value(key: str, value: str):
 
 
 def load_yaml(response_text: str, keys_fix_yaml: List[str] = [], first_key="", last_key="") -> dict:
+    # structured outputs (JSON) are parsed in a single pass, without the YAML repair fallbacks
+    data = parse_json_response(response_text)
+    if data is not None:
+        return data
     response_text_original = copy.deepcopy(response_text)
     response_text = response_text.strip('\n').removeprefix('```yaml').rstrip().removesuffix('```')
     try:
@@ -980,9 +987,10 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
     """
     Clip the number of tokens in a string to a maximum number of tokens.
 
-    This function limits text to a specified token count by calculating the approximate
-    character-to-token ratio and truncating the text accordingly. A safety factor of 0.9
-    (10% reduction) is applied to ensure the result stays within the token limit.
+    The text is encoded once, and cut at the exact token boundary that fits the budget (including the
+    "\\n...(truncated)" indicator), using the byte offsets of the encoded tokens. If the encoder does not expose
+    token bytes (e.g. a custom encoder), the cut is estimated from the average character-to-token ratio, with a
+    safety factor of 0.9 (10% reduction).
 
     Args:
         text (str): The string to clip. If empty or None, returns the input unchanged.
@@ -992,8 +1000,9 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
                                        of the clipped text to indicate truncation.
                                        Defaults to True.
         num_input_tokens (int, optional): Pre-computed number of tokens in the input text.
-                                        If provided, skips token encoding step for efficiency.
-                                        If None, tokens will be counted using TokenEncoder.
+                                        If it is within the limit, the text is returned without encoding it.
+                                        If it is larger than the encoder count (e.g. an accurate count of
+                                        a different model tokenizer), the budget is scaled down accordingly.
                                         Defaults to None.
         delete_last_line (bool, optional): Whether to remove the last line from the
                                          clipped content before adding truncation indicator.
@@ -1013,45 +1022,41 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
         >>> text = "This is a sample text that might be too long"
         >>> result = clip_tokens(text, max_tokens=10)
         >>> print(result)
-        This is a sample...
-        (truncated)
+        This is a sample text
+        ...(truncated)
 
         Without truncation indicator:
         >>> result = clip_tokens(text, max_tokens=10, add_three_dots=False)
         >>> print(result)
-        This is a sample
-
-        With pre-computed token count:
-        >>> result = clip_tokens(text, max_tokens=5, num_input_tokens=15)
-        >>> print(result)
-        This...
-        (truncated)
+        This is a sample text that might be too long
 
         With line deletion:
         >>> multiline_text = "Line 1\\nLine 2\\nLine 3"
-        >>> result = clip_tokens(multiline_text, max_tokens=3, delete_last_line=True)
+        >>> result = clip_tokens(multiline_text, max_tokens=8, delete_last_line=True)
         >>> print(result)
         Line 1
-        Line 2
-        ...
-        (truncated)
+        ...(truncated)
 
     Notes:
-        The function uses a safety factor of 0.9 (10% reduction) to ensure the
-        result stays within the token limit, as character-to-token ratios can vary.
         If token encoding fails, the original text is returned with a warning logged.
     """
     if not text:
         return text
 
     try:
+        if num_input_tokens is not None and num_input_tokens <= max_tokens:
+            return text
+        if max_tokens < 0:
+            return ""
+
+        encoder = TokenEncoder.get_token_encoder()
+        if isinstance(encoder, Encoding):
+            return _clip_tokens_exact(text, max_tokens, encoder, add_three_dots, num_input_tokens, delete_last_line)
+
         if num_input_tokens is None:
-            encoder = TokenEncoder.get_token_encoder()
             num_input_tokens = len(encoder.encode(text))
         if num_input_tokens <= max_tokens:
             return text
-        if max_tokens < 0:
-            return ""
 
         # calculate the number of characters to keep
         num_chars = len(text)
@@ -1074,6 +1079,54 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
         get_logger().warning(f"Failed to clip tokens: {e}")
         return text
 
+
+def _clip_tokens_exact(text: str, max_tokens: int, encoder: Encoding, add_three_dots: bool,
+                       num_input_tokens: int | None, delete_last_line: bool) -> str:
+    try:
+        text_bytes = text.encode('utf-8')
+    except UnicodeEncodeError:  # lone surrogates are replaced, the same way tiktoken does before encoding
+        text = text.encode('utf-16', 'surrogatepass').decode('utf-16', 'replace')
+        text_bytes = text.encode('utf-8')
+    tokens = encoder.encode(text, disallowed_special=())
+    if num_input_tokens is not None and num_input_tokens > len(tokens):
+        # the input was counted by a different (more accurate) tokenizer, so the budget is scaled to the encoder count
+        # (before the early return - the input may fit by the encoder count, but not by the accurate one)
+        max_tokens = int(max_tokens * len(tokens) / num_input_tokens)
+    if len(tokens) <= max_tokens:
+        return text
+
+    suffix = "\n...(truncated)" if add_three_dots else ""
+    budget = max_tokens - (TokenCountCache.count(encoder, suffix) if suffix else 0)
+    if budget <= 0:
+        return ""
+
+    # byte offset of the end of each token in the original text
+    token_ends = list(accumulate(len(token_bytes) for token_bytes in encoder.decode_tokens_bytes(tokens[:budget])))
+
+    def clip_at(num_tokens: int) -> str:
+        clipped_text = text_bytes[:token_ends[num_tokens - 1]].decode('utf-8', errors='ignore') if num_tokens else ""
+        if delete_last_line:
+            clipped_text = clipped_text.rsplit('\n', 1)[0]
+        return clipped_text + suffix if clipped_text else ""
+
+    # re-encoding the clipped text may merge differently at the cut, so the result is verified. In the rare case it
+    # does not fit, binary search for the longest token prefix that fits
+    clipped_text = clip_at(budget)
+    if TokenCountCache.count(encoder, clipped_text) <= max_tokens:
+        return clipped_text
+    low, high = 0, budget - 1
+    clipped_text = ""
+    while low <= high:
+        mid = (low + high) // 2
+        candidate = clip_at(mid)
+        if TokenCountCache.count(encoder, candidate) <= max_tokens:
+            clipped_text = candidate
+            low = mid + 1
+        else:
+            high = mid - 1
+    return clipped_text
+
+
 def replace_code_tags(text):
     """
     Replace odd instances of ` with <code> and even instances of ` with </code>
@@ -1160,6 +1213,12 @@ def find_line_number_of_relevant_line_in_file(diff_files: List[FilePatchInfo],
     return position, absolute_position
 
 def get_rate_limit_status(github_token) -> dict:
+    if get_settings().get("GITHUB.RATE_LIMIT_BUDGET", False):
+        # the budget tracked from the rate limit headers of the responses, if any - saves the '/rate_limit' call
+        from pr_agent.git_providers.rate_limit_budget import get_rate_limit_key, get_rate_limit_tracker
+        rate_limit_status = get_rate_limit_tracker().get_status(get_rate_limit_key(github_token))
+        if rate_limit_status:
+            return rate_limit_status
     GITHUB_API_URL = get_settings(use_context=False).get("GITHUB.BASE_URL", "https://api.github.com").rstrip("/")  # "https://api.github.com"
     # GITHUB_API_URL = "https://api.github.com"
     RATE_LIMIT_URL = f"{GITHUB_API_URL}/rate_limit"
@@ -1200,6 +1259,11 @@ def validate_rate_limit_github(github_token, installation_id=None, threshold=0.1
 
 
 def validate_and_await_rate_limit(github_token):
+    """
+    Returns the rate limit status, sleeping until the rate limit resets when a resource is close to it. With
+    'github.rate_limit_budget', an error is logged instead, and the caller is expected to degrade (e.g. skip optional
+    calls) - the request thread never sleeps.
+    """
     try:
         rate_limit_status = get_rate_limit_status(github_token)
         # validate that the rate limit is not exceeded
@@ -1208,6 +1272,9 @@ def validate_and_await_rate_limit(github_token):
                 get_logger().error(f"key: {key}, value: {value}")
                 sleep_time_sec = value['reset'] - datetime.now().timestamp()
                 sleep_time_hour = sleep_time_sec / 3600.0
+                if get_settings().get("GITHUB.RATE_LIMIT_BUDGET", False):
+                    get_logger().error(f"Rate limit exceeded. Resets in {sleep_time_hour} hours")
+                    continue
                 get_logger().error(f"Rate limit exceeded. Sleeping for {sleep_time_hour} hours")
                 if sleep_time_sec > 0:
                     time.sleep(sleep_time_sec + 1)
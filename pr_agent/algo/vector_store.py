@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pr_agent.algo.docs_index import tokenize
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+try:
+    import numpy as np
+except ImportError:  # numpy is needed only by the local vector store
+    np = None
+
+EmbeddingFunction = Callable[[List[str]], List[List[float]]]
+
+
+class LocalVectorStore:
+    """
+    A vector store in a local directory: a float32 matrix of unit-normalized embeddings ('vectors.npy', memory-mapped
+    when searched), and the metadata of its rows in SQLite. Records belong to documents (e.g. an issue and its
+    comments), which are upserted as a whole and keyed by their 'updated_at', so that re-indexing embeds only the new
+    and the updated documents.
+    """
+
+    def __init__(self, path: str, embedding_model: str):
+        if np is None:
+            raise Exception("Please install numpy to use the local vectordb")
+        os.makedirs(path, exist_ok=True)
+        self.matrix_path = os.path.join(path, "vectors.npy")
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "metadata.db"), timeout=10, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS documents (namespace TEXT, key TEXT, "
+                                     "updated_at TEXT, PRIMARY KEY (namespace, key))")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS records (namespace TEXT, id TEXT, document TEXT, "
+                                     "row INTEGER, metadata TEXT, PRIMARY KEY (namespace, id))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS records_by_document ON records (namespace, document)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._connection.execute("SELECT value FROM settings WHERE key = 'embedding_model'").fetchone()
+            if row is not None and row[0] != embedding_model:
+                get_logger().info(f"The embedding model changed from {row[0]} to {embedding_model}, "
+                                  f"re-indexing from scratch")
+                self._clear()
+            self._connection.execute("INSERT OR REPLACE INTO settings VALUES ('embedding_model', ?)",
+                                     (embedding_model,))
+
+    def get_documents(self, namespace: str) -> Dict[str, str]:
+        """The indexed documents of the namespace: key -> updated_at."""
+        with self._lock:
+            rows = self._connection.execute("SELECT key, updated_at FROM documents WHERE namespace = ?",
+                                            (namespace,)).fetchall()
+        return dict(rows)
+
+    def upsert(self, namespace: str, documents: Dict[str, str], records: List[Tuple[str, str, dict]], vectors):
+        """
+        Replaces the records of 'documents' (key -> updated_at) with 'records' ([(record id, document key, metadata)])
+        and their embeddings 'vectors'. The embeddings are written to rows which are free before the upsert, or
+        appended, and the metadata is committed after them - so an interrupted upsert leaves the previous state.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(records), -1) if records else None
+        if vectors is not None:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            matrix = self._load_matrix("r+")
+            if matrix is not None and vectors is not None and matrix.shape[1] != vectors.shape[1]:
+                get_logger().info(f"The embedding dimension changed from {matrix.shape[1]} to {vectors.shape[1]}, "
+                                  f"re-indexing from scratch")
+                self._clear()
+                matrix = None
+            num_rows = 0 if matrix is None else matrix.shape[0]
+            used_rows = {row for row, in self._connection.execute("SELECT row FROM records")}
+            rows = [row for row in range(num_rows) if row not in used_rows][:len(records)]
+            rows += list(range(num_rows, num_rows + len(records) - len(rows)))
+            if rows and rows[-1] >= num_rows:
+                matrix = self._grow_matrix(matrix, rows[-1] + 1, vectors.shape[1])
+            if rows:
+                matrix[rows] = vectors
+                matrix.flush()
+            del matrix
+            with self._connection:
+                for key, updated_at in documents.items():
+                    self._connection.execute("DELETE FROM records WHERE namespace = ? AND document = ?",
+                                             (namespace, key))
+                    self._connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                                             (namespace, key, updated_at))
+                self._connection.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                                             [(namespace, record_id, document, row, json.dumps(metadata))
+                                              for (record_id, document, metadata), row
+                                              in zip(records, rows, strict=True)])
+
+    def search(self, namespace: str, vector: List[float], top_k: int) -> List[Tuple[str, dict, float]]:
+        """The 'top_k' (record id, metadata, cosine similarity) of the namespace, by descending similarity."""
+        with self._lock:
+            records = self._connection.execute("SELECT id, row, metadata FROM records WHERE namespace = ? "
+                                               "ORDER BY row", (namespace,)).fetchall()
+            matrix = self._load_matrix("r")
+        if not records or matrix is None:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix[[row for _, row, _ in records]] @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [(records[i][0], json.loads(records[i][2]), float(scores[i])) for i in top[np.argsort(-scores[top])]]
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        with self._connection:
+            self._connection.execute("DELETE FROM documents")
+            self._connection.execute("DELETE FROM records")
+        if os.path.exists(self.matrix_path):
+            os.remove(self.matrix_path)
+
+    def _load_matrix(self, mode: str):
+        if not os.path.exists(self.matrix_path):
+            return None
+        return np.load(self.matrix_path, mmap_mode=mode)
+
+    def _grow_matrix(self, matrix, num_rows: int, dimension: int):
+        # doubles the capacity, so that a series of small upserts copies the matrix a logarithmic number of times
+        capacity = max(num_rows, 2 * (0 if matrix is None else matrix.shape[0]))
+        tmp_path = f"{self.matrix_path}.tmp"
+        new_matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, dimension))
+        if matrix is not None:
+            new_matrix[:matrix.shape[0]] = matrix
+        new_matrix.flush()
+        del new_matrix, matrix
+        os.replace(tmp_path, self.matrix_path)
+        return np.load(self.matrix_path, mmap_mode="r+")
+
+
+def get_embedding_batches(texts: List[str], count_tokens: Callable[[str], int], max_batch_size: int,
+                          max_batch_tokens: int) -> List[List[int]]:
+    """Splits the texts to batches (of indices) of at most 'max_batch_size' texts and 'max_batch_tokens' tokens."""
+    batches, batch, batch_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed_texts(texts: List[str], embed: EmbeddingFunction, count_tokens: Callable[[str], int],
+                max_batch_size: int = 64, max_batch_tokens: int = 8000) -> List[Optional[List[float]]]:
+    """
+    Embeds the texts in size-aware batches. A batch which fails is split in half and retried, so a single bad text
+    costs a logarithmic number of extra calls, and only its own embedding is None.
+    """
+    embeddings = [None] * len(texts)
+
+    def embed_batch(batch: List[int]):
+        try:
+            for i, vector in zip(batch, embed([texts[i] for i in batch]), strict=True):
+                embeddings[i] = vector
+        except Exception as e:
+            if len(batch) == 1:
+                get_logger().warning(f"Failed to embed a text of {len(texts[batch[0]])} characters: {e}")
+                return
+            embed_batch(batch[:len(batch) // 2])
+            embed_batch(batch[len(batch) // 2:])
+
+    for batch in get_embedding_batches(texts, count_tokens, max_batch_size, max_batch_tokens):
+        embed_batch(batch)
+    return embeddings
+
+
+def hashing_embedding(texts: List[str], dimension: int = 1024) -> List[List[float]]:
+    """
+    An offline embedding: the signed feature hashing of the words and word pairs of a text. Much weaker than a learned
+    embedding model, but it needs no model or network access.
+    """
+    vectors = []
+    for text in texts:
+        vector = [0.0] * dimension
+        words = tokenize(text)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:], strict=False)]:
+            feature_hash = zlib.crc32(feature.encode("utf-8"))
+            vector[feature_hash % dimension] += 1.0 if feature_hash & (1 << 31) else -1.0
+        vectors.append(vector)
+    return vectors
+
+
+EMBEDDINGS = ("openai", "hashing")
+
+
+def get_embedding_function(model: str) -> Tuple[str, EmbeddingFunction]:
+    """
+    The (name, function) of the embedding of the local vectordb, by 'LOCAL_VECTORDB.EMBEDDING': "openai" ('model' by
+    litellm) or "hashing" ('hashing_embedding', offline). The settings can be set by PR comments and repo settings
+    files, so they select from this fixed list, and never name a function to import.
+    """
+    embedding = get_settings().get("LOCAL_VECTORDB.EMBEDDING", "openai")
+    if embedding not in EMBEDDINGS:
+        raise ValueError(f"Unknown local_vectordb.embedding '{embedding}', expected one of {EMBEDDINGS}")
+    if embedding == "hashing":
+        return "hashing", hashing_embedding
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        import litellm
+        response = litellm.embedding(model=model, input=texts)
+        return [record['embedding'] for record in response.data]
+
+    return model, embed
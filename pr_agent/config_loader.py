@@ -1,8 +1,12 @@
+import copy
 from os.path import abspath, dirname, join
 from pathlib import Path
 from typing import Optional
 
 from dynaconf import Dynaconf
+from dynaconf.utils import object_merge
+from dynaconf.utils.boxing import DynaBox
+from dynaconf.utils.parse_conf import parse_conf_data
 from starlette_context import context
 
 PR_AGENT_TOML_KEY = 'pr-agent'
@@ -38,6 +42,129 @@ global_settings = Dynaconf(
 )
 
 
+_UNSET = object()
+
+
+def _find_key(section: dict, key: str) -> str:
+    # nested keys keep the case of the settings file, and are looked up case-insensitively
+    return next((existing for existing in section if str(existing).upper() == key.upper()), key)
+
+
+class LayeredSettings:
+    """
+    Per-request settings: a thin overlay on top of the shared (global) settings, used instead of a deep copy of the
+    global settings, which holds all the prompts.
+    Reads fall through to the base settings, and writes ('set', 'unset', or assigning to the attributes of a section)
+    go to the overlay - the base settings are never modified. A top-level section is copied from the base settings
+    only when it is accessed as an attribute (e.g. 'settings.pr_reviewer', which may be modified in place) or written
+    to. Values returned by 'get' may be shared with other requests, and should not be modified in place.
+    """
+
+    def __init__(self, base: Dynaconf):
+        object.__setattr__(self, "_base", base)
+        object.__setattr__(self, "_overlay", {})  # upper-cased top-level key -> value (or _UNSET)
+
+    def _materialize(self, name: str):
+        """Returns a top-level value, copying it to the overlay first if it's a section (or a list)."""
+        name = name.upper()
+        if name in self._overlay:
+            return self._overlay[name]
+        value = self._base.get(name, _UNSET)
+        if isinstance(value, (dict, list)):
+            value = self._overlay[name] = copy.deepcopy(value)
+        return value
+
+    def get(self, key, default=None, **kwargs):
+        name, _, path = str(key).partition(".")
+        if name.upper() not in self._overlay:
+            return self._base.get(key, default, **kwargs)
+        value = self._overlay[name.upper()]
+        for part in path.split(".") if path else []:
+            value = value.get(part, _UNSET) if isinstance(value, dict) else _UNSET
+        return default if value is _UNSET else value
+
+    def set(self, key, value, merge=None, tomlfy=False, **kwargs):
+        name, _, path = str(key).partition(".")
+        value = parse_conf_data(value, tomlfy=tomlfy, box_settings=self._base)
+        if isinstance(value, dict) and not isinstance(value, DynaBox):
+            value = DynaBox(value, box_settings=self._base)
+        if not path:
+            if merge is None:
+                merge = self._base.get("MERGE_ENABLED_FOR_DYNACONF", False)
+            existing = self._materialize(name)
+            if merge and isinstance(existing, dict) and isinstance(value, dict):
+                value = object_merge(existing, value)
+            self._overlay[name.upper()] = value
+            return
+        # a dotted key always reassigns the value, as in Dynaconf
+        section = self._materialize(name)
+        if not isinstance(section, dict):
+            section = self._overlay[name.upper()] = DynaBox(box_settings=self._base)
+        *parents, leaf = path.split(".")
+        for part in parents:
+            section = section.setdefault(_find_key(section, part), {})
+        section[_find_key(section, leaf)] = value
+
+    def unset(self, key, **kwargs):
+        name, _, path = str(key).partition(".")
+        if not path:
+            self._overlay[name.upper()] = _UNSET
+            return
+        section = self._materialize(name)
+        *parents, leaf = path.split(".")
+        for part in parents:
+            section = section.get(part) if isinstance(section, dict) else None
+        if isinstance(section, dict):
+            section.pop(_find_key(section, leaf), None)
+
+    def keys(self):
+        keys = [key for key in self._base.keys() if self._overlay.get(key, None) is not _UNSET]
+        keys += [key for key, value in self._overlay.items() if value is not _UNSET and key not in self._base]
+        return keys
+
+    def as_dict(self, *args, **kwargs):
+        data = self._base.as_dict(*args, **kwargs)
+        for key, value in self._overlay.items():
+            if value is _UNSET:
+                data.pop(key, None)
+            else:
+                data[key] = value.to_dict() if isinstance(value, DynaBox) else copy.deepcopy(value)
+        return data
+
+    to_dict = as_dict
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = self._materialize(name)
+        if value is not _UNSET:
+            return value
+        if name.upper() in self._overlay:  # unset
+            raise AttributeError(name)
+        return getattr(self._base, name)  # methods of the base settings (e.g. find_file)
+
+    def __setattr__(self, name, value):
+        self.set(name, value)
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __deepcopy__(self, memo):
+        settings = LayeredSettings(self._base)
+        memo[id(_UNSET)] = _UNSET
+        settings._overlay.update(copy.deepcopy(self._overlay, memo))
+        return settings
+
+
 def get_settings(use_context=False):
     """
     Retrieves the current settings.
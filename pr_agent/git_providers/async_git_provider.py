@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import threading
+import weakref
+from typing import Any, Callable
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_provider import GitProvider
+
+
+class AsyncGitProvider:
+    """
+    The async interface of a git provider, used by the tools so that provider I/O doesn't block the event loop of the
+    servers. Each method of the wrapped GitProvider is available as a coroutine with the same arguments, e.g.
+    'await async_provider.get_files()'. Attributes which are not methods (e.g. 'pr') are returned as is.
+
+    The provider calls run in a worker thread (in a copy of the caller context, so the request settings remain
+    visible). The providers are not thread-safe - they lazily set shared state (e.g. 'git_files', 'diff_files',
+    'pr_commits') - so the calls of a provider are serialized, also when they are gathered: the event loop serves the
+    other requests meanwhile, but the calls of one provider run one at a time. With
+    'config.offload_git_provider_calls' disabled, the calls run inline.
+    """
+
+    def __init__(self, git_provider: GitProvider, offload: bool = True):
+        self.git_provider = git_provider
+        self.offload = offload
+        self.lock = _get_provider_lock(git_provider)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Runs a blocking function which uses the provider (e.g. a helper of a tool)."""
+        if not self.offload:
+            return func(*args, **kwargs)
+        return await asyncio.to_thread(self._run_locked, func, *args, **kwargs)
+
+    async def run_stateless(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Runs a blocking function which doesn't touch the state of the provider (e.g. a single PyGithub call), without
+        serializing it with the other calls of the provider - so such calls can run concurrently.
+        """
+        if not self.offload:
+            return func(*args, **kwargs)
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    def _run_locked(self, func: Callable, *args, **kwargs) -> Any:
+        with self.lock:
+            return func(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.git_provider, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+
+_provider_locks = weakref.WeakKeyDictionary()
+_provider_locks_lock = threading.Lock()
+
+
+def _get_provider_lock(git_provider: GitProvider) -> threading.RLock:
+    """The lock of a provider instance, shared by all its AsyncGitProvider views."""
+    with _provider_locks_lock:
+        lock = _provider_locks.get(git_provider)
+        if lock is None:
+            lock = _provider_locks[git_provider] = threading.RLock()
+        return lock
+
+
+def get_async_git_provider(git_provider: GitProvider) -> AsyncGitProvider:
+    if isinstance(git_provider, AsyncGitProvider):
+        return git_provider
+    return AsyncGitProvider(git_provider, offload=get_settings().get("CONFIG.OFFLOAD_GIT_PROVIDER_CALLS", True))
@@ -11,6 +11,7 @@ from ..algo.utils import (PRDescriptionHeader, clip_tokens,
                           load_large_diff)
 from ..config_loader import get_settings
 from ..log import get_logger
+from .blob_cache import get_cached_blob
 from .git_provider import GitProvider
 
 AZURE_DEVOPS_AVAILABLE = True
@@ -188,6 +189,17 @@ class AzureDevopsProvider(GitProvider):
                 files.append(c["item"]["path"])
         return list(set(files))
 
+    def _get_file_content(self, file: str, version) -> str:
+        return get_cached_blob(f"{self.workspace_slug}/{self.repo_slug}", version.version, file,
+                               lambda: self.azure_devops_client.get_item(
+                                   repository_id=self.repo_slug,
+                                   path=file,
+                                   project=self.workspace_slug,
+                                   version_descriptor=version,
+                                   download=False,
+                                   include_content=True,
+                               ).content)
+
     def get_diff_files(self) -> list[FilePatchInfo]:
         try:
 
@@ -270,16 +282,7 @@ class AzureDevopsProvider(GitProvider):
                     version=head_sha.commit_id, version_type="commit"
                 )
                 try:
-                    new_file_content_str = self.azure_devops_client.get_item(
-                        repository_id=self.repo_slug,
-                        path=file,
-                        project=self.workspace_slug,
-                        version_descriptor=version,
-                        download=False,
-                        include_content=True,
-                    )
-
-                    new_file_content_str = new_file_content_str.content
+                    new_file_content_str = self._get_file_content(file, version)
                 except Exception as error:
                     get_logger().error(f"Failed to retrieve new file content of {file} at version {version}", error=error)
                     # get_logger().error(
@@ -305,15 +308,7 @@ class AzureDevopsProvider(GitProvider):
                     original_file_content_str = ""
                 else:
                     try:
-                        original_file_content_str = self.azure_devops_client.get_item(
-                            repository_id=self.repo_slug,
-                            path=file,
-                            project=self.workspace_slug,
-                            version_descriptor=version,
-                            download=False,
-                            include_content=True,
-                        )
-                        original_file_content_str = original_file_content_str.content
+                        original_file_content_str = self._get_file_content(file, version)
                     except Exception as error:
                         get_logger().error(f"Failed to retrieve original file content of {file} at version {version}", error=error)
                         original_file_content_str = ""
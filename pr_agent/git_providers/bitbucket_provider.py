@@ -4,7 +4,6 @@ import re
 from typing import Optional, Tuple
 from urllib.parse import urlparse
 
-import requests
 from atlassian.bitbucket import Cloud
 from starlette_context import context
 
@@ -15,7 +14,9 @@ from ..algo.language_handler import is_valid_file
 from ..algo.utils import find_line_number_of_relevant_line_in_file
 from ..config_loader import get_settings
 from ..log import get_logger
+from .blob_cache import get_cached_blob
 from .git_provider import MAX_FILES_ALLOWED_FULL, GitProvider
+from .http_session import create_pooled_session
 
 
 def _gef_filename(diff):
@@ -28,7 +29,7 @@ class BitbucketProvider(GitProvider):
     def __init__(
         self, pr_url: Optional[str] = None, incremental: Optional[bool] = False
     ):
-        s = requests.Session()
+        s = create_pooled_session()
         s.headers["Content-Type"] = "application/json"
 
         self.auth_type = get_settings().get("BITBUCKET.AUTH_TYPE", "bearer")
@@ -59,6 +60,7 @@ class BitbucketProvider(GitProvider):
             get_logger().exception(f"Failed to initialize Bitbucket authentication: {e}")
             raise
 
+        self.session = s
         self.headers = s.headers
         self.bitbucket_client = Cloud(session=s)
         self.max_comment_length = 31000
@@ -81,7 +83,7 @@ class BitbucketProvider(GitProvider):
         try:
             url = (f"https://api.bitbucket.org/2.0/repositories/{self.workspace_slug}/{self.repo_slug}/src/"
                    f"{self.pr.destination_branch}/.pr_agent.toml")
-            response = requests.request("GET", url, headers=self.headers)
+            response = self.session.request("GET", url, headers=self.headers)
             if response.status_code == 404:  # not found
                 return ""
             contents = response.text.encode('utf-8')
@@ -211,10 +213,45 @@ class BitbucketProvider(GitProvider):
                 self.git_files = [_gef_filename(diff) for diff in self.pr.diffstat()]
             return self.git_files
 
+    def _get_mirror_refspecs(self) -> list[str]:
+        return [f"+refs/heads/{branch}:refs/mirror/heads/{branch}"
+                for branch in (self.pr.source_branch, self.pr.destination_branch)]
+
+    def get_pr_head_sha(self) -> str | None:
+        try:
+            return self.pr.data["source"]["commit"]["hash"]
+        except (KeyError, TypeError):
+            return None
+
+    def get_diff_files_between(self, base_sha: str, head_sha: str) -> list[FilePatchInfo] | None:
+        # from the local mirror only (same-repo PRs), as for the full diff
+        try:
+            source, destination = self.pr.data["source"], self.pr.data["destination"]
+            if source["repository"]["full_name"] != destination["repository"]["full_name"]:
+                return None
+        except (KeyError, TypeError):
+            return None
+        return self._get_diff_files_from_mirror(self.get_git_repo_url(), base_sha, head_sha,
+                                                refspecs=self._get_mirror_refspecs(), against_merge_base=False)
+
     def get_diff_files(self) -> list[FilePatchInfo]:
         if self.diff_files:
             return self.diff_files
 
+        # full files content of any PR size from a local mirror (the API is used only for the PR metadata).
+        # bitbucket returns abbreviated commit hashes, so the PR branches are fetched (fork PRs are not supported)
+        try:
+            source, destination = self.pr.data["source"], self.pr.data["destination"]
+            if source["repository"]["full_name"] == destination["repository"]["full_name"]:
+                diff_files = self._get_diff_files_from_mirror(
+                    self.get_git_repo_url(), destination["commit"]["hash"], source["commit"]["hash"],
+                    refspecs=self._get_mirror_refspecs())
+                if diff_files is not None:
+                    self.diff_files = diff_files
+                    return diff_files
+        except (KeyError, TypeError):
+            pass
+
         diffs_original = list(self.pr.diffstat())
         diffs = filter_ignored(diffs_original, 'bitbucket')
         if diffs != diffs_original:
@@ -435,7 +472,7 @@ class BitbucketProvider(GitProvider):
                 "path": file
             },
         })
-        response = requests.request(
+        response = self.session.request(
             "POST", self.bitbucket_comment_api_url, data=payload, headers=self.headers
         )
         return response
@@ -494,7 +531,7 @@ class BitbucketProvider(GitProvider):
     def get_repo_default_branch(self):
         try:
             url_repo = f"https://api.bitbucket.org/2.0/repositories/{self.workspace_slug}/{self.repo_slug}/"
-            response_repo = requests.request("GET", url_repo, headers=self.headers).json()
+            response_repo = self.session.request("GET", url_repo, headers=self.headers).json()
             return response_repo['mainbranch']['name']
         except:
             return self.pr.destination_branch
@@ -560,11 +597,7 @@ class BitbucketProvider(GitProvider):
                 branch = self.pr.data["destination"]["commit"]["hash"]
             url = (f"https://api.bitbucket.org/2.0/repositories/{self.workspace_slug}/{self.repo_slug}/src/"
                    f"{branch}/{file_path}")
-            response = requests.request("GET", url, headers=self.headers)
-            if response.status_code == 404:  # not found
-                return ""
-            contents = response.text
-            return contents
+            return self._get_pr_file_content(url)
         except Exception:
             return ""
 
@@ -580,15 +613,24 @@ class BitbucketProvider(GitProvider):
             "message": message,
             "branch": branch
         }
-        headers = {'Authorization': self.headers['Authorization']} if 'Authorization' in self.headers else {}
+        # the multipart request sets its own content type
+        headers = {'Content-Type': None}
         try:
-            requests.request("POST", url, headers=headers, data=data, files=files)
+            self.session.request("POST", url, headers=headers, data=data, files=files)
         except Exception:
             get_logger().exception(f"Failed to create empty file {file_path} in branch {branch}")
 
     def _get_pr_file_content(self, remote_link: str):
+        # remote links have the form: .../repositories/{workspace}/{repo}/src/{commit_hash}/{file_path}
+        match = re.search(r"/repositories/([^/]+/[^/]+)/src/([^/]+)/(.+)$", remote_link)
+        if not match:
+            return self._download_file_content(remote_link)
+        repo, sha, file_path = match.groups()
+        return get_cached_blob(repo, sha, file_path, lambda: self._download_file_content(remote_link))
+
+    def _download_file_content(self, remote_link: str):
         try:
-            response = requests.request("GET", remote_link, headers=self.headers)
+            response = self.session.request("GET", remote_link, headers=self.headers)
             if response.status_code == 404:  # not found
                 return ""
             contents = response.text
@@ -607,7 +649,7 @@ class BitbucketProvider(GitProvider):
 
         })
 
-        response = requests.request("PUT", self.bitbucket_pull_request_api_url, headers=self.headers, data=payload)
+        response = self.session.request("PUT", self.bitbucket_pull_request_api_url, headers=self.headers, data=payload)
         try:
             if response.status_code != 200:
                 get_logger().info(f"Failed to update description, error code: {response.status_code}")
@@ -17,7 +17,9 @@ from ..algo.utils import (find_line_number_of_relevant_line_in_file,
                           load_large_diff)
 from ..config_loader import get_settings
 from ..log import get_logger
+from .blob_cache import get_cached_blob
 from .git_provider import GitProvider
+from .http_session import create_pooled_session
 
 
 class BitbucketServerProvider(GitProvider):
@@ -40,7 +42,8 @@ class BitbucketServerProvider(GitProvider):
         self.bitbucket_server_url = self._parse_bitbucket_server(url=pr_url)
         self.bitbucket_client = bitbucket_client or Bitbucket(url=self.bitbucket_server_url,
                                                               token=get_settings().get("BITBUCKET_SERVER.BEARER_TOKEN",
-                                                                                       None))
+                                                                                       None),
+                                                              session=create_pooled_session())
         try:
             self.bitbucket_api_version = parse_version(self.bitbucket_client.get("rest/api/1.0/application-properties").get('version'))
         except Exception:
@@ -180,6 +183,10 @@ class BitbucketServerProvider(GitProvider):
         self.pr = self._get_pr()
 
     def get_file(self, path: str, commit_id: str):
+        return get_cached_blob(f"{self.workspace_slug}/{self.repo_slug}", commit_id, path,
+                               lambda: decode_if_bytes(self._download_file(path, commit_id)))
+
+    def _download_file(self, path: str, commit_id: str):
         file_content = ""
         try:
             file_content = self.bitbucket_client.get_content_of_file(self.workspace_slug,
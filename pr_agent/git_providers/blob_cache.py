@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# full (or abbreviated, as returned by Bitbucket links) commit hashes. Branch and tag names are never cached,
+# since they may point to a different commit on the next call
+COMMIT_SHA_PATTERN = re.compile(r"^[0-9a-f]{12,64}$")
+
+
+def is_commit_sha(ref: str) -> bool:
+    return bool(ref) and bool(COMMIT_SHA_PATTERN.match(ref))
+
+
+class BlobCache:
+    """
+    A content-addressed cache of file contents, keyed by (repo, commit sha, path).
+
+    The contents of a file at a given commit never change, so entries never go stale, and are only evicted to keep
+    the cache within its byte budget. The cache has two tiers:
+    - an in-memory LRU tier, shared by all the requests handled by the process.
+    - an optional on-disk tier, which can be shared between processes (e.g. gunicorn workers) and survives restarts.
+    """
+
+    def __init__(self, max_memory_bytes: int, disk_path: str = "", max_disk_bytes: int = 0):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._list_disk_entries())
+
+    @staticmethod
+    def _digest(repo: str, sha: str, path: str) -> str:
+        return hashlib.sha256(f"{repo}\0{sha}\0{path}".encode("utf-8")).hexdigest()
+
+    def get(self, repo: str, sha: str, path: str) -> Optional[str]:
+        digest = self._digest(repo, sha, path)
+        with self._lock:
+            content = self._memory.get(digest)
+            if content is not None:
+                self._memory.move_to_end(digest)
+                self.hits += 1
+                return content
+        content = self._read_from_disk(digest)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_in_memory(digest, content)
+        return content
+
+    def set(self, repo: str, sha: str, path: str, content: str):
+        digest = self._digest(repo, sha, path)
+        with self._lock:
+            self._put_in_memory(digest, content)
+        self._write_to_disk(digest, content)
+
+    def clear(self):
+        """Removes all the entries, from both tiers (the disk tier is also cleared for the other processes)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if not self.disk_path:
+                return
+            for file_path, _, _ in self._list_disk_entries():
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+            self._disk_bytes = 0
+
+    def _put_in_memory(self, digest: str, content: str):
+        size = len(content.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        if digest in self._memory:
+            self._memory_bytes -= len(self._memory.pop(digest).encode("utf-8"))
+        self._memory[digest] = content
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.encode("utf-8"))
+
+    def _disk_file(self, digest: str) -> str:
+        return os.path.join(self.disk_path, digest[:2], digest)
+
+    def _read_from_disk(self, digest: str) -> Optional[str]:
+        if not self.disk_path:
+            return None
+        file_path = self._disk_file(digest)
+        try:
+            with open(file_path, "rb") as f:
+                content = f.read().decode("utf-8")
+            os.utime(file_path)  # mark as recently used, for the eviction order
+            return content
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        except OSError as e:
+            get_logger().debug(f"Failed to read blob cache file {file_path}: {e}")
+            return None
+
+    def _write_to_disk(self, digest: str, content: str):
+        if not self.disk_path:
+            return
+        data = content.encode("utf-8")
+        if len(data) > self.max_disk_bytes:
+            return
+        file_path = self._disk_file(digest)
+        if os.path.exists(file_path):
+            return
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # write to a temporary file first, so concurrent readers never see a partial blob
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            get_logger().debug(f"Failed to write blob cache file {file_path}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_from_disk()
+
+    def _list_disk_entries(self) -> list[tuple[str, int, float]]:
+        entries = []
+        for root, _, files in os.walk(self.disk_path):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((file_path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_from_disk(self):
+        # the disk tier may be shared with other processes, so the actual usage is re-scanned before evicting
+        entries = sorted(self._list_disk_entries(), key=lambda entry: entry[2])
+        self._disk_bytes = sum(size for _, size, _ in entries)
+        target_bytes = int(self.max_disk_bytes * 0.9)  # evict a bit more than needed, to avoid evicting on every write
+        for file_path, size, _ in entries:
+            if self._disk_bytes <= target_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= size
+
+
+_blob_cache = None
+_blob_cache_lock = threading.Lock()
+
+
+def get_blob_cache() -> BlobCache:
+    global _blob_cache
+    if _blob_cache is None:
+        with _blob_cache_lock:
+            if _blob_cache is None:
+                settings = get_settings()
+                _blob_cache = BlobCache(max_memory_bytes=settings.get("BLOB_CACHE.MAX_MEMORY_BYTES", 64 * 1024 * 1024),
+                                        disk_path=settings.get("BLOB_CACHE.DISK_PATH", ""),
+                                        max_disk_bytes=settings.get("BLOB_CACHE.MAX_DISK_BYTES", 0))
+    return _blob_cache
+
+
+def get_cached_blob(repo: str, sha: str, path: str, fetch: Callable[[], str]) -> str:
+    """
+    Returns the content of 'path' at commit 'sha' of 'repo', calling 'fetch' only on a cache miss.
+    Refs which are not commit hashes (e.g. branch names) bypass the cache. Empty contents are not cached,
+    since providers also return an empty string when a request fails.
+    """
+    if not get_settings().get("BLOB_CACHE.ENABLED", False) or not is_commit_sha(sha):
+        return fetch()
+    cache = get_blob_cache()
+    content = cache.get(repo, sha, path)
+    if content is not None:
+        return content
+    content = fetch()
+    if content and isinstance(content, str):
+        cache.set(repo, sha, path, content)
+    return content
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows - the mirrors are only locked within the process
+    fcntl = None
+
+EDIT_TYPES = {"A": EDIT_TYPE.ADDED, "D": EDIT_TYPE.DELETED, "M": EDIT_TYPE.MODIFIED, "T": EDIT_TYPE.MODIFIED,
+              "R": EDIT_TYPE.RENAMED, "C": EDIT_TYPE.ADDED}
+
+
+class GitMirrorError(Exception):
+    pass
+
+
+class GitMirror:
+    """
+    A persistent bare mirror of a repository, under 'cache_dir'. Only the commits of the reviewed PRs are fetched
+    (incrementally - the fetched commits are kept as refs, so later fetches only download the new objects), and the
+    diff files of a PR (merge base, patches and full files content) are computed locally with git plumbing.
+    The clone url (which may contain a token) is never stored in the mirror.
+    """
+
+    def __init__(self, cache_dir: str, repo_url: str, timeout: int = 300):
+        self.repo_url = repo_url
+        self.timeout = timeout
+        key = hashlib.sha256(repo_url.encode("utf-8")).hexdigest()[:32]
+        self.path = os.path.join(cache_dir, f"{key}.git")
+        self._lock_path = os.path.join(cache_dir, f"{key}.lock")
+        self._lock = threading.Lock()
+
+    def _git(self, *args, input: bytes = None, timeout: int = None) -> bytes:
+        result = subprocess.run(["git", "-C", self.path, *args], input=input, capture_output=True,
+                                timeout=timeout or self.timeout)
+        if result.returncode != 0:
+            raise GitMirrorError(f"git {args[0]} failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return result.stdout
+
+    @contextmanager
+    def _locked(self):
+        # fetches are serialized within the process (threads) and between processes (workers sharing the cache dir)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self._lock_path, "w") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _init(self):
+        if os.path.exists(os.path.join(self.path, "HEAD")):
+            return
+        subprocess.run(["git", "init", "--bare", "-q", self.path], check=True, capture_output=True)
+        self._git("config", "core.logAllRefUpdates", "false")
+
+    def has_commits(self, shas: List[str]) -> bool:
+        if not os.path.exists(os.path.join(self.path, "HEAD")):
+            return False
+        try:
+            output = self._git("cat-file", "--batch-check",
+                               input="".join(f"{sha}^{{commit}}\n" for sha in shas).encode())
+        except GitMirrorError:
+            return False
+        lines = output.splitlines()  # '<sha> commit <size>', or '<object> missing'
+        return len(lines) == len(shas) and all(line.split()[1:2] == [b"commit"] for line in lines)
+
+    def fetch(self, clone_url: str, shas: List[str], refspecs: List[str] = None):
+        """
+        Makes sure the commits 'shas' are in the mirror, fetching them from 'clone_url' if needed.
+        The commits are fetched by sha. 'refspecs' (e.g. the PR source and target branches) are fetched instead when
+        the server doesn't allow fetching by sha, or the shas are abbreviated.
+        """
+        if self.has_commits(shas):
+            return
+        with self._locked():
+            if self.has_commits(shas):  # fetched by another worker meanwhile
+                return
+            self._init()
+            fetch_args = ["-c", "protocol.version=2", "fetch", "-q", "--no-tags", "--no-write-fetch-head", clone_url]
+            full_shas = [sha for sha in shas if len(sha) == 40]
+            try:
+                if len(full_shas) != len(shas):
+                    raise GitMirrorError("abbreviated shas can't be fetched")
+                self._git(*fetch_args, *[f"+{sha}:refs/mirror/commits/{sha}" for sha in shas])
+            except GitMirrorError:
+                if not refspecs:
+                    raise
+                self._git(*fetch_args, *refspecs)
+            if not self.has_commits(shas):
+                raise GitMirrorError(f"commits {shas} were not fetched")
+
+    def fetch_ref(self, clone_url: str, ref: str = "HEAD", depth: int = None) -> str:
+        """
+        Fetches 'ref' of the remote (e.g. 'HEAD' or 'refs/heads/main'), shallowly if 'depth' is given, and returns its
+        commit sha. Only the objects which are not in the mirror yet are downloaded.
+        """
+        local_ref = f"refs/mirror/fetched/{ref.removeprefix('refs/')}"
+        with self._locked():
+            self._init()
+            fetch_args = ["-c", "protocol.version=2", "fetch", "-q", "--no-tags", "--no-write-fetch-head"]
+            if depth:
+                fetch_args += ["--depth", str(depth)]
+            self._git(*fetch_args, clone_url, f"+{ref}:{local_ref}")
+            return self._git("rev-parse", local_ref).decode().strip()
+
+    def ls_remote(self, clone_url: str, ref: str = "HEAD") -> str:
+        """The commit sha of 'ref' on the remote. It needs access to the remote, but downloads no objects."""
+        result = subprocess.run(["git", "ls-remote", "--", clone_url, ref], capture_output=True, timeout=self.timeout)
+        if result.returncode != 0:
+            raise GitMirrorError(f"git ls-remote failed: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        for line in result.stdout.decode().splitlines():
+            sha, _, name = line.partition("\t")
+            if name == ref:
+                return sha
+        raise GitMirrorError(f"{ref} was not found in the remote")
+
+    def list_files(self, commit: str, paths: List[str] = None, recursive: bool = True) -> List[Tuple[str, str]]:
+        """(path, blob sha) of the files of 'commit', under 'paths' if given."""
+        output = self._git("ls-tree", *(["-r"] if recursive else []), "-z", "--full-tree", commit, "--", *(paths or []))
+        files = []
+        for entry in output.decode("utf-8", errors="replace").split("\0"):
+            if not entry:
+                continue
+            info, path = entry.split("\t", 1)
+            _, object_type, blob_sha = info.split()
+            if object_type == "blob":
+                files.append((path, blob_sha))
+        return files
+
+    def get_merge_base(self, base: str, head: str) -> str:
+        return self._git("merge-base", base, head).decode().strip()
+
+    def is_ancestor(self, ancestor: str, commit: str) -> bool:
+        try:
+            self._git("merge-base", "--is-ancestor", ancestor, commit)
+            return True
+        except GitMirrorError:
+            return False
+
+    def _get_changes(self, base: str, head: str) -> List[Tuple[str, str, Optional[str]]]:
+        """(status, filename, old filename) of the changed files, in the order of 'git diff'."""
+        fields = self._git("diff", "--name-status", "-z", "-M", "--no-ext-diff", base, head).decode(
+            "utf-8", errors="replace").split("\0")
+        changes = []
+        i = 0
+        while i < len(fields) and fields[i]:
+            status = fields[i][0]
+            if status in ("R", "C"):
+                changes.append((status, fields[i + 2], fields[i + 1]))
+                i += 3
+            else:
+                changes.append((status, fields[i + 1], None))
+                i += 2
+        return changes
+
+    def _get_patches(self, base: str, head: str, count: int) -> List[str]:
+        """The patches of the changed files (hunks only, as returned by the GitHub API), in the order of 'git diff'."""
+        diff = self._git("diff", "-M", "--no-color", "--no-ext-diff", "-U3", base, head).decode(
+            "utf-8", errors="replace")
+        file_diffs = diff.split("\ndiff --git ")
+        if len(file_diffs) != count:  # e.g. 'diff --git ' in a changed line - very unlikely, but never misattribute
+            raise GitMirrorError(f"unexpected diff of {len(file_diffs)} files instead of {count}")
+        patches = []
+        for file_diff in file_diffs:
+            hunks_start = file_diff.find("\n@@ ")
+            patches.append(file_diff[hunks_start + 1:].rstrip("\n") if hunks_start != -1 else "")  # binary, mode only
+        return patches
+
+    def get_files_content(self, blobs: List[Tuple[str, str]]) -> List[str]:
+        """The contents of (commit, path) blobs, in one 'git cat-file' process. Missing and binary files are ''."""
+        if not blobs:
+            return []
+        output = self._git("cat-file", "--batch",
+                           input="".join(f"{commit}:{path}\n" for commit, path in blobs).encode())
+        contents = []
+        position = 0
+        for _ in blobs:
+            header_end = output.index(b"\n", position)
+            header = output[position:header_end].split()
+            position = header_end + 1
+            if header[-1] == b"missing" or len(header) != 3:
+                contents.append("")
+                continue
+            size = int(header[2])
+            content = output[position:position + size]
+            position += size + 1
+            contents.append("" if b"\0" in content[:8000] else content.decode("utf-8", errors="replace"))
+        return contents
+
+    def get_diff_files(self, base: str, head: str, against_merge_base: bool = True) -> List[FilePatchInfo]:
+        """
+        The diff files of 'head' against its merge base with 'base' (or against 'base' itself), with the full content
+        of all the files.
+        """
+        merge_base = self.get_merge_base(base, head) if against_merge_base else base
+        changes = self._get_changes(merge_base, head)
+        patches = self._get_patches(merge_base, head, len(changes)) if changes else []
+        blobs = []
+        for status, filename, old_filename in changes:
+            blobs.append((head, filename) if status != "D" else None)
+            blobs.append((merge_base, old_filename or filename) if status not in ("A", "C") else None)
+        contents = iter(self.get_files_content([blob for blob in blobs if blob]))
+
+        diff_files = []
+        for (status, filename, old_filename), patch, head_blob, base_blob in zip(changes, patches, blobs[::2],
+                                                                                blobs[1::2], strict=True):
+            head_file = next(contents) if head_blob else ""
+            base_file = next(contents) if base_blob else ""
+            patch_lines = patch.splitlines()
+            num_plus_lines = len([line for line in patch_lines if line.startswith("+")])
+            num_minus_lines = len([line for line in patch_lines if line.startswith("-")])
+            diff_files.append(FilePatchInfo(base_file, head_file, patch, filename,
+                                            edit_type=EDIT_TYPES.get(status, EDIT_TYPE.UNKNOWN),
+                                            old_filename=old_filename if status == "R" else None,
+                                            num_plus_lines=num_plus_lines, num_minus_lines=num_minus_lines))
+        return diff_files
+
+
+_git_mirrors: Dict[str, GitMirror] = {}
+_lock = threading.Lock()
+
+
+def get_git_mirror(repo_url: str) -> GitMirror:
+    with _lock:
+        mirror = _git_mirrors.get(repo_url)
+        if mirror is None:
+            settings = get_settings()
+            mirror = GitMirror(settings.get("GIT_MIRROR.CACHE_DIR", "/tmp/pr_agent_git_mirrors"), repo_url,
+                               timeout=settings.get("GIT_MIRROR.FETCH_TIMEOUT_SEC", 300))
+            _git_mirrors[repo_url] = mirror
+        return mirror
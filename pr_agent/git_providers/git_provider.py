@@ -5,9 +5,12 @@ import shutil
 import subprocess
 from typing import Optional, Tuple
 
+from pr_agent.algo.file_filter import filter_ignored
+from pr_agent.algo.language_handler import is_valid_file
 from pr_agent.algo.types import FilePatchInfo
 from pr_agent.algo.utils import Range, process_description
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_mirror import get_git_mirror
 from pr_agent.log import get_logger
 
 MAX_FILES_ALLOWED_FULL = 50
@@ -86,6 +89,30 @@ class GitProvider(ABC):
         finally:
             return returned_obj
 
+    # Computes the diff files of a PR (with the full content of all the files) from a local mirror of the repo, when
+    # [git_mirror] is enabled. Returns None (and the provider falls back to its API) if disabled or failed.
+    def _get_diff_files_from_mirror(self, repo_url: str, base: str, head: str, refspecs: list[str] = None,
+                                    against_merge_base: bool = True) -> list[FilePatchInfo] | None:
+        if not get_settings().get("GIT_MIRROR.ENABLED", False) or not all([repo_url, base, head]):
+            return None
+        try:
+            clone_url = self._prepare_clone_url_with_token(repo_url)
+            if not clone_url:
+                return None
+            mirror = get_git_mirror(repo_url)
+            mirror.fetch(clone_url, [base, head], refspecs)
+            if not against_merge_base and not mirror.is_ancestor(base, head):
+                get_logger().info(f"Commit {base} is not an ancestor of {head} in {repo_url}")
+                return None
+            diff_files = mirror.get_diff_files(base, head, against_merge_base=against_merge_base)
+            diff_files = [file for file in filter_ignored(diff_files) if is_valid_file(file.filename)]
+            get_logger().info(f"Computed {len(diff_files)} diff files from the local mirror of {repo_url}")
+            return diff_files
+        except Exception as e:
+            get_logger().warning(f"Failed to compute the diff files from the local mirror of {repo_url}, "
+                                 f"falling back to the API: {e}")
+            return None
+
     @abstractmethod
     def get_files(self) -> list:
         pass
@@ -97,6 +124,18 @@ class GitProvider(ABC):
     def get_incremental_commits(self, is_incremental):
         pass
 
+    def get_pr_head_sha(self) -> str | None:
+        """The sha of the head commit of the PR, or None if the provider doesn't support incremental reviews."""
+        return None
+
+    def get_diff_files_between(self, base_sha: str, head_sha: str) -> list[FilePatchInfo] | None:
+        """
+        The diff files between two commits of the PR branch ('head_sha' against 'base_sha' itself, not against their
+        merge base), for incremental reviews. Returns None if not available, e.g. when 'base_sha' is no longer an
+        ancestor of 'head_sha' (a force push), or if the provider doesn't support it.
+        """
+        return None
+
     @abstractmethod
     def publish_description(self, pr_title: str, pr_body: str):
         pass
@@ -206,6 +245,13 @@ class GitProvider(ABC):
     def get_repo_settings(self):
         pass
 
+    def get_repo_settings_sha(self) -> Optional[str]:
+        """
+        Returns the git blob sha of the repo settings file ("" if there is no such file), with a lookup cheaper than
+        'get_repo_settings'. None if the provider has no such lookup.
+        """
+        return None
+
     def get_workspace_name(self):
         return ""
 
@@ -414,6 +460,10 @@ class IncrementalPR:
         self.commits_range = None
         self.first_new_commit = None
         self.last_seen_commit = None
+        # set by the provider-agnostic incremental review engine (see 'pr_agent.algo.incremental_review')
+        self.last_reviewed_sha = None
+        self.diff_files = None  # the changes since 'last_reviewed_sha'
+        self.previous_findings = []
 
     @property
     def first_new_commit_sha(self):
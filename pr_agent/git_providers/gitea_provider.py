@@ -12,9 +12,11 @@ from pr_agent.algo.types import EDIT_TYPE
 from pr_agent.algo.utils import (clip_tokens,
                                  find_line_number_of_relevant_line_in_file)
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.blob_cache import get_cached_blob
 from pr_agent.git_providers.git_provider import (MAX_FILES_ALLOWED_FULL,
                                                  FilePatchInfo, GitProvider,
                                                  IncrementalPR)
+from pr_agent.git_providers.http_session import get_shared_pool_manager
 from pr_agent.log import get_logger
 
 
@@ -48,6 +50,13 @@ class GiteaProvider(GitProvider):
         configuration.ssl_ca_cert = get_settings().get("GITEA.SSL_CA_CERT", None)
 
         client = giteapy.ApiClient(configuration)
+        # the token is sent per request, so the connection pool is shared between provider instances
+        client.rest_client.pool_manager = get_shared_pool_manager(configuration.verify_ssl, configuration.ssl_ca_cert,
+                                                                  cert_file=configuration.cert_file,
+                                                                  key_file=configuration.key_file,
+                                                                  proxy=configuration.proxy,
+                                                                  maxsize=configuration.connection_pool_maxsize,
+                                                                  assert_hostname=configuration.assert_hostname)
         self.repo_api = RepoApi(client)
         self.owner = None
         self.repo = None
@@ -870,7 +879,10 @@ class RepoApi(giteapy.RepositoryApi):
 
     def get_file_content(self, owner: str, repo: str, commit_sha: str, filepath: str) -> str:
         """Get raw file content from a specific commit"""
+        return get_cached_blob(f"{owner}/{repo}", commit_sha, filepath,
+                               lambda: self._download_file_content(owner, repo, commit_sha, filepath))
 
+    def _download_file_content(self, owner: str, repo: str, commit_sha: str, filepath: str) -> str:
         try:
             token = self.api_client.configuration.api_key.get('Authorization', '').replace('token ', '')
             url = f'/repos/{owner}/{repo}/raw/{filepath}'
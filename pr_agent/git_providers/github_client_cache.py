@@ -0,0 +1,180 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+from typing import Tuple, Union
+
+from github import Auth, Github
+from github.GithubIntegration import GithubIntegration
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.http_session import create_pooled_session
+from pr_agent.git_providers.rate_limit_budget import get_rate_limit_key, get_rate_limit_tracker
+from pr_agent.log import get_logger
+
+_thread_local = threading.local()
+
+
+def _get_thread_session():
+    # a session per thread, all mounted with the shared connection pool (requests sessions are not thread safe)
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = _thread_local.session = create_pooled_session()
+    return session
+
+
+class _PooledConnectionMixin:
+    """
+    Replaces the connection objects of PyGithub, which create a new connection pool per client, and keep the state of
+    the current request on a connection shared by all the threads using the client.
+    Once installed on a client, a connection object is created per request (cheap), and all of them use the shared
+    pool - with its retries and pool size, instead of the 'retry' and 'pool_size' of the client.
+    The rate limit headers of each response feed the rate limit budget of its token.
+    """
+
+    def _init_connection(self, host, port, protocol, default_port, timeout, kwargs):
+        self.host = host
+        self.port = port if port else default_port
+        self.protocol = protocol
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = _get_thread_session()
+
+    def getresponse(self):
+        response = super().getresponse()
+        authorization = (self.headers or {}).get("Authorization", "")
+        # installation and user tokens only (app JWTs are created per call)
+        if authorization.startswith("token ") and get_settings().get("GITHUB.RATE_LIMIT_BUDGET", False):
+            get_rate_limit_tracker().update_from_headers(get_rate_limit_key(authorization[len("token "):]),
+                                                         dict(response.getheaders()))
+        return response
+
+
+class PooledHTTPSConnection(_PooledConnectionMixin, HTTPSRequestsConnectionClass):
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self._init_connection(host, port, "https", 443, timeout, kwargs)
+
+
+class PooledHTTPConnection(_PooledConnectionMixin, HTTPRequestsConnectionClass):
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self._init_connection(host, port, "http", 80, timeout, kwargs)
+
+
+class InstallationTokenAuth(Auth.Auth):
+    """
+    GitHub app installation authentication, shared by all the clients of an installation.
+    The installation token is requested (with a JWT signed by the app private key) only when there is no token, or the
+    token expires within 'refresh_margin_sec'. Refreshes are serialized, so concurrent requests never exchange tokens
+    in parallel.
+    """
+
+    def __init__(self, app_id: Union[int, str], private_key: str, installation_id: int, base_url: str,
+                 refresh_margin_sec: float):
+        self.app_id = app_id
+        self.installation_id = installation_id
+        self.base_url = base_url
+        self.refresh_margin_sec = refresh_margin_sec
+        self._app_auth = Auth.AppAuth(app_id, private_key)
+        self._token = None
+        self._expires_at = 0.0  # epoch seconds
+        self._lock = threading.Lock()
+        self.refresh_count = 0
+
+    @property
+    def token_type(self) -> str:
+        return "token"
+
+    def _needs_refresh(self) -> bool:
+        return self._token is None or time.time() >= self._expires_at - self.refresh_margin_sec
+
+    @property
+    def token(self) -> str:
+        if self._needs_refresh():
+            with self._lock:
+                if self._needs_refresh():
+                    self._refresh()
+        return self._token
+
+    def _refresh(self):
+        integration = GithubIntegration(auth=self._app_auth, base_url=self.base_url)
+        authorization = integration.get_access_token(self.installation_id)
+        expires_at = authorization.expires_at
+        if expires_at.tzinfo is None:  # PyGithub returns naive UTC datetimes
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        self._token = authorization.token
+        self._expires_at = expires_at.timestamp()
+        self.refresh_count += 1
+
+
+class GithubClientCache:
+    """
+    A process-wide cache of the GitHub app installation authentications and PyGithub clients, keyed by
+    (base url, app, installation). A client holds no per-request state, so it's shared by all the requests (and
+    threads) of an installation, once the pooled connections are installed.
+    """
+
+    def __init__(self, max_entries: int, refresh_margin_sec: float):
+        self.max_entries = max_entries
+        self.refresh_margin_sec = refresh_margin_sec
+        self._entries = OrderedDict()  # key -> (auth, client)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get_client(self, base_url: str, app_id: Union[int, str], private_key: str,
+                   installation_id: int) -> Tuple[InstallationTokenAuth, Github]:
+        key = (base_url, str(app_id), hashlib.sha256(private_key.encode("utf-8")).hexdigest(), installation_id)
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker (e.g. gunicorn with preload) - don't reuse the tokens and connections of the parent
+                self._entries.clear()
+                self._pid = os.getpid()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            auth = InstallationTokenAuth(app_id, private_key, installation_id, base_url, self.refresh_margin_sec)
+            entry = (auth, use_pooled_connections(Github(auth=auth, base_url=base_url)))
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_github_client_cache = None
+_lock = threading.Lock()
+
+
+def use_pooled_connections(client: Github) -> Github:
+    """
+    Makes a PyGithub client use the shared connection pool, with a connection per request. Only for the clients which
+    pr-agent creates without 'retry' and 'pool_size'. The other clients of the process are not changed: PyGithub has
+    no per-client option for this, and its 'Requester.injectConnectionClasses' applies to the whole process.
+    """
+    requester = getattr(client, "_Github__requester", None)
+    scheme = getattr(requester, "_Requester__scheme", None)
+    if scheme not in ("http", "https"):  # a PyGithub version with a different Requester
+        get_logger().debug("Unable to install the pooled connections on the PyGithub client")
+        return client
+    requester._Requester__connectionClass = PooledHTTPSConnection if scheme == "https" else PooledHTTPConnection
+    requester._Requester__persist = False
+    requester._Requester__connection = None
+    return client
+
+
+def get_github_client_cache() -> GithubClientCache:
+    global _github_client_cache
+    if _github_client_cache is None:
+        with _lock:
+            if _github_client_cache is None:
+                settings = get_settings()
+                _github_client_cache = GithubClientCache(
+                    max_entries=settings.get("GITHUB.CLIENT_CACHE_MAX_ENTRIES", 1000),
+                    refresh_margin_sec=settings.get("GITHUB.TOKEN_REFRESH_MARGIN_SEC", 300))
+    return _github_client_cache
@@ -0,0 +1,79 @@
+from typing import Callable, List, Optional, Tuple
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.http_session import create_pooled_session
+from pr_agent.git_providers.rate_limit_budget import get_rate_limit_key, get_rate_limit_tracker
+from pr_agent.log import get_logger
+
+BLOB_FIELDS = "... on Blob { text isBinary isTruncated }"
+
+
+class GithubGraphQLError(Exception):
+    pass
+
+
+def get_graphql_url(base_url: str) -> str:
+    """'https://api.github.com' -> 'https://api.github.com/graphql', 'https://host/api/v3' -> 'https://host/api/graphql'"""
+    base_url = base_url.rstrip("/")
+    if base_url.endswith("/api/v3"):
+        return base_url[:-len("/v3")] + "/graphql"
+    return base_url + "/graphql"
+
+
+class GithubGraphQLClient:
+    """A minimal GitHub GraphQL client, using the shared connection pool."""
+
+    def __init__(self, base_url: str, get_token: Callable[[], str], timeout: int = 30):
+        self.url = get_graphql_url(base_url)
+        self.get_token = get_token
+        self.timeout = timeout
+        self.session = create_pooled_session()
+
+    def query(self, query: str, variables: dict) -> dict:
+        token = self.get_token()
+        response = self.session.post(self.url, json={"query": query, "variables": variables},
+                                     headers={"Authorization": f"bearer {token}"}, timeout=self.timeout)
+        if get_settings().get("GITHUB.RATE_LIMIT_BUDGET", False):
+            get_rate_limit_tracker().update_from_headers(get_rate_limit_key(token), response.headers)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("errors"):
+            raise GithubGraphQLError(result["errors"])
+        return result["data"]
+
+    def get_blob_sha(self, repo: str, expression: str) -> str:
+        """Returns the sha of the blob at 'expression' (e.g. 'HEAD:path') of 'repo', or "" if there is no such blob."""
+        owner, name = repo.split("/", 1)
+        query = ("query($owner: String!, $name: String!, $expression: String!) {\n"
+                 "repository(owner: $owner, name: $name) { object(expression: $expression) { oid } }\n}")
+        blob = self.query(query, {"owner": owner, "name": name, "expression": expression})["repository"]["object"]
+        return blob["oid"] if blob else ""
+
+    def get_blob_texts(self, repo: str, blobs: List[Tuple[str, str]], batch_size: int = 50) -> List[Optional[str]]:
+        """
+        Fetches the texts of (sha, path) blobs of 'repo' ('owner/name'), 'batch_size' blobs per query.
+        Returns the texts in the order of 'blobs'. As from the REST API, files which don't exist at the commit (e.g.
+        the base side of an added file) and binary files are returned as an empty string. Truncated (large) blobs are
+        returned as None, so the caller can fetch them otherwise.
+        """
+        owner, name = repo.split("/", 1)
+        texts = []
+        for start in range(0, len(blobs), batch_size):
+            batch = blobs[start:start + batch_size]
+            arguments = "".join(f", $e{i}: String!" for i in range(len(batch)))
+            objects = "\n".join(f"b{i}: object(expression: $e{i}) {{ {BLOB_FIELDS} }}" for i in range(len(batch)))
+            query = (f"query($owner: String!, $name: String!{arguments}) {{\n"
+                     f"repository(owner: $owner, name: $name) {{\n{objects}\n}}\n}}")
+            variables = {"owner": owner, "name": name}
+            variables.update({f"e{i}": f"{sha}:{path}" for i, (sha, path) in enumerate(batch)})
+            repository = self.query(query, variables)["repository"]
+            for i in range(len(batch)):
+                blob = repository.get(f"b{i}")
+                if not blob or blob.get("isBinary"):
+                    texts.append("")
+                elif blob.get("isTruncated") or blob.get("text") is None:
+                    texts.append(None)
+                else:
+                    texts.append(blob["text"])
+            get_logger().debug(f"Fetched {len(batch)} file contents of {repo} in one GraphQL query")
+        return texts
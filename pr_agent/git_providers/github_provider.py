@@ -1,3 +1,4 @@
+import contextvars
 import copy
 import difflib
 import hashlib
@@ -6,6 +7,7 @@ import re
 import time
 import traceback
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Tuple
 from urllib.parse import urlparse
@@ -25,6 +27,10 @@ from ..algo.utils import (PRReviewHeader, Range, clip_tokens,
 from ..config_loader import get_settings
 from ..log import get_logger
 from ..servers.utils import RateLimitExceeded
+from .blob_cache import BlobCache, get_blob_cache, get_cached_blob, is_commit_sha
+from .github_client_cache import get_github_client_cache, use_pooled_connections
+from .github_graphql import GithubGraphQLClient
+from .rate_limit_budget import get_rate_limit_key, get_rate_limit_tracker
 from .git_provider import (MAX_FILES_ALLOWED_FULL, FilePatchInfo, GitProvider,
                            IncrementalPR)
 
@@ -40,6 +46,7 @@ class GithubProvider(GitProvider):
         self.base_url = get_settings().get("GITHUB.BASE_URL", "https://api.github.com").rstrip("/") # "https://api.github.com"
         self.base_url_html = self.base_url.split("api/")[0].rstrip("/") if "api/" in self.base_url else "https://github.com"
         self.github_client = self._get_github_client()
+        self.graphql_client = None
         self.repo = None
         self.pr_num = None
         self.pr = None
@@ -239,6 +246,19 @@ class GithubProvider(GitProvider):
             if self.diff_files:
                 return self.diff_files
 
+            # full files content of any PR size from a local mirror (the API is used only for the PR metadata)
+            if not self.incremental.is_incremental:
+                diff_files = self._get_diff_files_from_mirror(f"{self.base_url_html}/{self.repo}.git",
+                                                              self.pr.base.sha, self.pr.head.sha,
+                                                              refspecs=self._get_mirror_refspecs())
+                if diff_files is not None:
+                    self.diff_files = diff_files
+                    try:
+                        context["diff_files"] = diff_files
+                    except Exception:
+                        pass
+                    return diff_files
+
             # filter files using [ignore] patterns
             files_original = self.get_files()
             files = filter_ignored(files_original)
@@ -246,7 +266,7 @@ class GithubProvider(GitProvider):
                 try:
                     names_original = [file.filename for file in files_original]
                     names_new = [file.filename for file in files]
-                    get_logger().info(f"Filtered out [ignore] files for pull request:", extra=
+                    get_logger().info("Filtered out [ignore] files for pull request:", extra=
                     {"files": names_original,
                      "filtered_files": names_new})
                 except Exception:
@@ -254,7 +274,6 @@ class GithubProvider(GitProvider):
 
             diff_files = []
             invalid_files_names = []
-            is_close_to_rate_limit = False
 
             # The base.sha will point to the current state of the base branch (including parallel merges), not the original base commit when the PR was created
             # We can fix this by finding the merge base commit between the PR head and base branches
@@ -272,43 +291,54 @@ class GithubProvider(GitProvider):
                 get_logger().info(
                     f"Using merge base commit {merge_base_commit.sha} instead of base commit ")
 
+            # first pass: decide which files are fully loaded, and from which commits
             counter_valid = 0
+            valid_files = []
+            fetch_requests = []
+            bad_extensions = get_settings().bad_extensions.default
+            if get_settings().config.use_extra_bad_extensions:
+                bad_extensions = bad_extensions + get_settings().bad_extensions.extra
             for file in files:
-                if not is_valid_file(file.filename):
+                if not is_valid_file(file.filename, bad_extensions):
                     invalid_files_names.append(file.filename)
                     continue
 
-                patch = file.patch
-                if is_close_to_rate_limit:
-                    new_file_content_str = ""
-                    original_file_content_str = ""
-                else:
-                    # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
-                    counter_valid += 1
-                    avoid_load = False
-                    if counter_valid >= MAX_FILES_ALLOWED_FULL and patch and not self.incremental.is_incremental:
-                        avoid_load = True
-                        if counter_valid == MAX_FILES_ALLOWED_FULL:
-                            get_logger().info(f"Too many files in PR, will avoid loading full content for rest of files")
-
-                    if avoid_load:
-                        new_file_content_str = ""
+                head_sha = base_sha = None
+                # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
+                counter_valid += 1
+                avoid_load = False
+                if counter_valid >= MAX_FILES_ALLOWED_FULL and file.patch and not self.incremental.is_incremental:
+                    avoid_load = True
+                    if counter_valid == MAX_FILES_ALLOWED_FULL:
+                        get_logger().info("Too many files in PR, will avoid loading full content for rest of files")
+
+                if not avoid_load:
+                    head_sha = self.pr.head.sha
+                    if self.incremental.is_incremental and self.unreviewed_files_set:
+                        base_sha = self.incremental.last_seen_commit_sha
                     else:
-                        new_file_content_str = self._get_pr_file_content(file, self.pr.head.sha)  # communication with GitHub
+                        base_sha = merge_base_commit.sha
+                        # base_sha = self.pr.base.sha
+                valid_files.append((file, head_sha, base_sha))
+                fetch_requests.extend((file, sha) for sha in (head_sha, base_sha) if sha)
 
+            # second pass: load the full files content concurrently (communication with GitHub)
+            files_content = iter(self._get_pr_files_content(fetch_requests))
+
+            for file, head_sha, base_sha in valid_files:
+                patch = file.patch
+                new_file_content_str = next(files_content) if head_sha else ""
+                original_file_content_str = next(files_content) if base_sha else ""
+                if new_file_content_str is None or original_file_content_str is None:
+                    # skipped, close to the rate limit - the file is handled with diffs only
+                    head_sha = base_sha = None
+                    new_file_content_str = original_file_content_str = ""
+                if head_sha:
                     if self.incremental.is_incremental and self.unreviewed_files_set:
-                        original_file_content_str = self._get_pr_file_content(file, self.incremental.last_seen_commit_sha)
                         patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
                         self.unreviewed_files_set[file.filename] = patch
-                    else:
-                        if avoid_load:
-                            original_file_content_str = ""
-                        else:
-                            original_file_content_str = self._get_pr_file_content(file, merge_base_commit.sha)
-                            # original_file_content_str = self._get_pr_file_content(file, self.pr.base.sha)
-                        if not patch:
-                            patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
-
+                    elif not patch:
+                        patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
 
                 if file.status == 'added':
                     edit_type = EDIT_TYPE.ADDED
@@ -352,6 +382,36 @@ class GithubProvider(GitProvider):
                                artifact={"traceback": traceback.format_exc()})
             raise RateLimitExceeded("Rate limit exceeded for GitHub API.") from e
 
+    def _get_mirror_refspecs(self) -> list[str]:
+        return [f"+refs/pull/{self.pr.number}/head:refs/mirror/pull/{self.pr.number}/head",
+                f"+refs/heads/{self.pr.base.ref}:refs/mirror/heads/{self.pr.base.ref}"]
+
+    def get_pr_head_sha(self) -> str:
+        return self.pr.head.sha
+
+    def get_diff_files_between(self, base_sha: str, head_sha: str) -> list[FilePatchInfo] | None:
+        diff_files = self._get_diff_files_from_mirror(f"{self.base_url_html}/{self.repo}.git", base_sha, head_sha,
+                                                      refspecs=self._get_mirror_refspecs(), against_merge_base=False)
+        if diff_files is not None:
+            return diff_files
+
+        compare = self.repo_obj.compare(base_sha, head_sha)  # communication with GitHub
+        if compare.status not in ("ahead", "identical"):
+            get_logger().info(f"Commit {base_sha} is not an ancestor of {head_sha} (status: {compare.status})")
+            return None
+        edit_types = {"added": EDIT_TYPE.ADDED, "removed": EDIT_TYPE.DELETED, "renamed": EDIT_TYPE.RENAMED,
+                      "modified": EDIT_TYPE.MODIFIED}
+        diff_files = []
+        for file in filter_ignored(compare.files):
+            if not is_valid_file(file.filename):
+                continue
+            edit_type = edit_types.get(file.status, EDIT_TYPE.UNKNOWN)
+            diff_files.append(FilePatchInfo("", "", file.patch or "", file.filename, edit_type=edit_type,
+                                            old_filename=file.previous_filename if edit_type == EDIT_TYPE.RENAMED
+                                            else None,
+                                            num_plus_lines=file.additions, num_minus_lines=file.deletions))
+        return diff_files
+
     def publish_description(self, pr_title: str, pr_body: str):
         self.pr.edit(title=pr_title, body=pr_body)
 
@@ -740,6 +800,18 @@ class GithubProvider(GitProvider):
         except Exception:
             return ""
 
+    def get_repo_settings_sha(self) -> Optional[str]:
+        if not get_settings().get("GITHUB.USE_GRAPHQL", False):
+            return None
+        try:
+            if self.graphql_client is None:
+                self.graphql_client = GithubGraphQLClient(self.base_url, lambda: self.auth.token)
+            # 'HEAD' is the default branch, as in 'get_repo_settings'
+            return self.graphql_client.get_blob_sha(self.repo, "HEAD:.pr_agent.toml")
+        except Exception as e:
+            get_logger().debug(f"Failed to look up the repo settings file sha: {e}")
+            return None
+
     def get_workspace_name(self):
         return self.repo.split('/')[0]
 
@@ -835,6 +907,11 @@ class GithubProvider(GitProvider):
                 raise ValueError("GitHub app ID and private key are required when using GitHub app deployment") from e
             if not self.installation_id:
                 raise ValueError("GitHub app installation ID is required when using GitHub app deployment")
+            if get_settings().get("GITHUB.CLIENT_CACHE", False):
+                # installation tokens and clients are shared by all the requests of an installation
+                self.auth, github_client = get_github_client_cache().get_client(
+                    self.base_url, app_id, private_key, self.installation_id)
+                return github_client
             auth = AppAuthentication(app_id=app_id, private_key=private_key,
                                      installation_id=self.installation_id)
             self.auth = auth
@@ -847,7 +924,10 @@ class GithubProvider(GitProvider):
                     "https://github.com/Codium-ai/pr-agent#method-2-run-from-source") from e
             self.auth = Auth.Token(token)
         if self.auth:
-            return Github(auth=self.auth, base_url=self.base_url)
+            github_client = Github(auth=self.auth, base_url=self.base_url)
+            if get_settings().get("GITHUB.CLIENT_CACHE", False):
+                use_pooled_connections(github_client)  # the calls of a provider may run in parallel threads
+            return github_client
         else:
             raise ValueError("Could not authenticate to GitHub")
 
@@ -865,6 +945,10 @@ class GithubProvider(GitProvider):
         return self._get_repo().get_pull(self.pr_num)
 
     def get_pr_file_content(self, file_path: str, branch: str) -> str:
+        return get_cached_blob(self.repo, branch, file_path,
+                               lambda: self._download_file_content(file_path, branch))
+
+    def _download_file_content(self, file_path: str, branch: str) -> str:
         try:
             file_content_str = str(
                 self._get_repo()
@@ -891,8 +975,99 @@ class GithubProvider(GitProvider):
             branch=branch,
         )
 
-    def _get_pr_file_content(self, file: FilePatchInfo, sha: str) -> str:
-        return self.get_pr_file_content(file.filename, sha)
+    def _get_rate_limit_key(self) -> Optional[str]:
+        try:
+            return get_rate_limit_key(self.auth.token)
+        except Exception:
+            return None
+
+    def _acquire_rate_limit_budget(self, cost: int, resource: str = "core") -> bool:
+        """
+        Acquires 'cost' calls of the rate limit budget of the token of the provider, for optional bulk work (e.g. full
+        file loads). Returns False if the work should be skipped. Never waits.
+        """
+        if not get_settings().get("GITHUB.RATE_LIMIT_BUDGET", False):
+            return True
+        key = self._get_rate_limit_key()
+        return key is None or get_rate_limit_tracker().try_acquire(key, cost, resource)
+
+    def _acquire_rate_limit_budget_up_to(self, cost: int) -> int:
+        """Like '_acquire_rate_limit_budget', but acquires as many of the 'cost' calls as the budget allows."""
+        if not get_settings().get("GITHUB.RATE_LIMIT_BUDGET", False):
+            return cost
+        key = self._get_rate_limit_key()
+        return cost if key is None else get_rate_limit_tracker().acquire_up_to(key, cost)
+
+    def _get_pr_file_content(self, file: FilePatchInfo, sha: str, blob_cache: Optional[BlobCache] = None) -> str:
+        content = self._download_file_content(file.filename, sha)
+        if content and blob_cache and is_commit_sha(sha):
+            blob_cache.set(self.repo, sha, file.filename, content)
+        return content
+
+    def _get_pr_files_content(self, fetch_requests: list[tuple]) -> list[Optional[str]]:
+        """
+        Fetches the content of several (file, sha) pairs: from the blob cache, then, with 'github.use_graphql', in
+        batched GraphQL queries. The rest (or all of them) are fetched with the REST API, using a bounded thread pool
+        of 'github.file_fetch_concurrency' workers. The results are returned in the order of the requests.
+
+        Only the calls which are actually made are charged to the rate limit budget. Once it is used up, the rest
+        of the contents are skipped, and returned as None.
+        """
+        contents = [None] * len(fetch_requests)
+        blob_cache = get_blob_cache() if get_settings().get("BLOB_CACHE.ENABLED", False) else None
+        if blob_cache:
+            for i, (file, sha) in enumerate(fetch_requests):
+                if is_commit_sha(sha):
+                    contents[i] = blob_cache.get(self.repo, sha, file.filename)
+        missing = [i for i, content in enumerate(contents) if content is None]
+        if get_settings().get("GITHUB.USE_GRAPHQL", False) and missing:
+            self._get_pr_files_content_graphql(fetch_requests, missing, contents)
+            missing = [i for i, content in enumerate(contents) if content is None]
+
+        num_allowed = self._acquire_rate_limit_budget_up_to(len(missing)) if missing else 0
+        if num_allowed < len(missing):
+            get_logger().warning("Close to the GitHub rate limit, will avoid loading full content for rest of files")
+            missing = missing[:num_allowed]
+
+        max_workers = min(get_settings().get("GITHUB.FILE_FETCH_CONCURRENCY", 1), len(missing))
+        if max_workers <= 1:
+            for i in missing:
+                contents[i] = self._get_pr_file_content(*fetch_requests[i], blob_cache)
+            return contents
+
+        # each worker runs in a copy of the caller context, so the request settings remain visible
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {i: executor.submit(contextvars.copy_context().run, self._get_pr_file_content,
+                                          *fetch_requests[i], blob_cache)
+                       for i in missing}
+            for i, future in futures.items():
+                contents[i] = future.result()
+        return contents
+
+    def _get_pr_files_content_graphql(self, fetch_requests: list[tuple], missing: list[int], contents: list):
+        """
+        Fetches the content of the 'missing' (file, sha) pairs into 'contents', in batched GraphQL queries, charged to
+        the 'graphql' rate limit budget. The contents which should be fetched with the REST API are left None.
+        """
+        batch_size = get_settings().get("GITHUB.GRAPHQL_BATCH_SIZE", 50)
+        if not self._acquire_rate_limit_budget(-(-len(missing) // batch_size), resource="graphql"):
+            get_logger().warning("Close to the GitHub GraphQL rate limit, falling back to REST")
+            return
+        try:
+            if self.graphql_client is None:
+                self.graphql_client = GithubGraphQLClient(self.base_url, lambda: self.auth.token)
+            texts = self.graphql_client.get_blob_texts(
+                self.repo, [(fetch_requests[i][1], fetch_requests[i][0].filename) for i in missing],
+                batch_size=batch_size)
+        except Exception as e:
+            get_logger().warning(f"Failed to fetch files content with GraphQL, falling back to REST: {e}")
+            return
+        blob_cache = get_blob_cache() if get_settings().get("BLOB_CACHE.ENABLED", False) else None
+        for i, text in zip(missing, texts, strict=True):
+            contents[i] = text
+            file, sha = fetch_requests[i]
+            if blob_cache and text and is_commit_sha(sha):
+                blob_cache.set(self.repo, sha, file.filename, text)
 
     def publish_labels(self, pr_types):
         try:
@@ -936,7 +1111,8 @@ class GithubProvider(GitProvider):
         """
         max_tokens = get_settings().get("CONFIG.MAX_COMMITS_TOKENS", None)
         try:
-            commit_list = self.pr.get_commits()
+            # the commits of the PR are already loaded by the constructor
+            commit_list = getattr(self, "pr_commits", None) or self.pr.get_commits()
             commit_messages = [commit.commit.message for commit in commit_list]
             commit_messages_str = "\n".join([f"{i + 1}. {message}" for i, message in enumerate(commit_messages)])
         except Exception:
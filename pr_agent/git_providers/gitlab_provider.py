@@ -18,6 +18,7 @@ from ..algo.utils import (clip_tokens,
                           load_large_diff)
 from ..config_loader import get_settings
 from ..log import get_logger
+from .blob_cache import get_cached_blob
 from .git_provider import MAX_FILES_ALLOWED_FULL, GitProvider
 
 
@@ -114,6 +115,10 @@ class GitLabProvider(GitProvider):
             raise DiffNotFoundError(f"Could not get diff for merge request {self.id_mr}") from e
 
     def get_pr_file_content(self, file_path: str, branch: str) -> str:
+        return get_cached_blob(str(self.id_project), branch, file_path,
+                               lambda: self._download_file_content(file_path, branch))
+
+    def _download_file_content(self, file_path: str, branch: str) -> str:
         try:
             file_obj = self.gl.projects.get(self.id_project).files.get(file_path, branch)
             content = file_obj.decode()
@@ -171,6 +176,15 @@ class GitLabProvider(GitProvider):
         if self.diff_files:
             return self.diff_files
 
+        # full files content of any MR size from a local mirror (the API is used only for the MR metadata)
+        if self.pr_url:
+            diff_files = self._get_diff_files_from_mirror(
+                self.get_git_repo_url(self.pr_url), self.mr.diff_refs['base_sha'], self.mr.diff_refs['head_sha'],
+                refspecs=self._get_mirror_refspecs())
+            if diff_files is not None:
+                self.diff_files = diff_files
+                return diff_files
+
         # filter files using [ignore] patterns
         diffs_original = self.mr.changes()['changes']
         diffs = filter_ignored(diffs_original, 'gitlab')
@@ -240,6 +254,42 @@ class GitLabProvider(GitProvider):
         self.diff_files = diff_files
         return diff_files
 
+    def _get_mirror_refspecs(self) -> list[str]:
+        return [f"+refs/merge-requests/{self.id_mr}/head:refs/mirror/merge-requests/{self.id_mr}/head",
+                f"+refs/heads/{self.mr.target_branch}:refs/mirror/heads/{self.mr.target_branch}"]
+
+    def get_pr_head_sha(self) -> str:
+        return self.mr.diff_refs['head_sha']
+
+    def get_diff_files_between(self, base_sha: str, head_sha: str) -> list[FilePatchInfo] | None:
+        if self.pr_url:
+            diff_files = self._get_diff_files_from_mirror(self.get_git_repo_url(self.pr_url), base_sha, head_sha,
+                                                          refspecs=self._get_mirror_refspecs(),
+                                                          against_merge_base=False)
+            if diff_files is not None:
+                return diff_files
+
+        project = self.gl.projects.get(self.id_project)
+        if project.repository_merge_base([base_sha, head_sha])['id'] != base_sha:
+            get_logger().info(f"Commit {base_sha} is not an ancestor of {head_sha}")
+            return None
+        diffs = filter_ignored(project.repository_compare(base_sha, head_sha)['diffs'], 'gitlab')
+        diff_files = []
+        for diff in diffs:
+            if not is_valid_file(diff['new_path']):
+                continue
+            edit_type = EDIT_TYPE.MODIFIED
+            if diff['new_file']:
+                edit_type = EDIT_TYPE.ADDED
+            elif diff['deleted_file']:
+                edit_type = EDIT_TYPE.DELETED
+            elif diff['renamed_file']:
+                edit_type = EDIT_TYPE.RENAMED
+            diff_files.append(FilePatchInfo("", "", diff['diff'], diff['new_path'], edit_type=edit_type,
+                                            old_filename=None if diff['old_path'] == diff['new_path']
+                                            else diff['old_path']))
+        return diff_files
+
     def get_files(self) -> list:
         if not self.git_files:
             self.git_files = [change['new_path'] for change in self.mr.changes()['changes']]
@@ -0,0 +1,89 @@
+import threading
+from typing import Optional
+
+import certifi
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pr_agent.config_loader import get_settings
+
+# transient errors which are retried (with backoff, and respecting a 'Retry-After' header)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_shared_adapter = None
+_shared_pool_managers = {}
+_lock = threading.Lock()
+
+
+def _get_retry() -> Retry:
+    settings = get_settings()
+    return Retry(total=settings.get("HTTP_POOL.MAX_RETRIES", 3),
+                 backoff_factor=settings.get("HTTP_POOL.BACKOFF_FACTOR", 0.5),
+                 status_forcelist=RETRY_STATUS_CODES,
+                 # idempotent methods only, comments are never posted twice
+                 allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                 respect_retry_after_header=True,
+                 raise_on_status=False)
+
+
+def get_shared_http_adapter() -> HTTPAdapter:
+    """
+    Returns the HTTP adapter shared by all the provider sessions of the process. The adapter holds a pool of
+    keep-alive connections per host, so provider instances created for different requests reuse the same
+    connections (and TLS handshakes).
+    """
+    global _shared_adapter
+    if _shared_adapter is None:
+        with _lock:
+            if _shared_adapter is None:
+                settings = get_settings()
+                _shared_adapter = HTTPAdapter(pool_connections=settings.get("HTTP_POOL.POOL_CONNECTIONS", 10),
+                                              pool_maxsize=settings.get("HTTP_POOL.POOL_MAXSIZE", 20),
+                                              max_retries=_get_retry())
+    return _shared_adapter
+
+
+def create_pooled_session() -> requests.Session:
+    """
+    Creates a requests session which uses the shared connection pool. Sessions are cheap, and each provider instance
+    keeps its own session, so credentials set in the session headers are never shared between instances.
+    """
+    session = requests.Session()
+    adapter = get_shared_http_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_shared_pool_manager(verify_ssl: bool = True, ca_certs: Optional[str] = None, cert_file: Optional[str] = None,
+                            key_file: Optional[str] = None, proxy: Optional[str] = None,
+                            maxsize: Optional[int] = None, assert_hostname=None) -> urllib3.PoolManager:
+    """
+    Returns a urllib3 pool manager shared by the process, for clients which are built on urllib3 directly
+    (e.g. giteapy). A pool manager is shared per connection configuration (SSL, client certificate, proxy and pool
+    size), and a proxy manager is returned when 'proxy' is set.
+    """
+    key = (verify_ssl, ca_certs, cert_file, key_file, proxy, maxsize, assert_hostname)
+    pool_manager = _shared_pool_managers.get(key)
+    if pool_manager is None:
+        with _lock:
+            pool_manager = _shared_pool_managers.get(key)
+            if pool_manager is None:
+                settings = get_settings()
+                pool_args = dict(num_pools=settings.get("HTTP_POOL.POOL_CONNECTIONS", 10),
+                                 maxsize=maxsize or settings.get("HTTP_POOL.POOL_MAXSIZE", 20),
+                                 cert_reqs="CERT_REQUIRED" if verify_ssl else "CERT_NONE",
+                                 ca_certs=ca_certs or certifi.where(),
+                                 cert_file=cert_file,
+                                 key_file=key_file,
+                                 retries=_get_retry())
+                if assert_hostname is not None:
+                    pool_args["assert_hostname"] = assert_hostname
+                if proxy:
+                    pool_manager = urllib3.ProxyManager(proxy_url=proxy, **pool_args)
+                else:
+                    pool_manager = urllib3.PoolManager(**pool_args)
+                _shared_pool_managers[key] = pool_manager
+    return pool_manager
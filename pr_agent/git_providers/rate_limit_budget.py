@@ -0,0 +1,152 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Mapping, Optional
+
+from pr_agent.config_loader import get_settings
+
+
+def get_rate_limit_key(token: str) -> str:
+    """The key of a rate limit budget: a digest of the token (installation token, or user token) it belongs to."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+
+class RateLimitBudget:
+    """
+    The rate limit budget of a token for one resource (e.g. 'core'), updated from the 'X-RateLimit-*' headers of the
+    responses, and a token bucket which spreads the optional bulk work (e.g. full file loads) over the rest of the
+    rate limit window. The bucket refills at '(remaining - reserve) / seconds to reset', so bulk work can't use up the
+    budget early in the window, and the reserve is kept for the calls a command can't do without (metadata,
+    comments), which are never charged to the bucket.
+    """
+
+    def __init__(self, limit: int, remaining: int, reset: float, reserve_ratio: float, max_burst: int):
+        self.reserve_ratio = reserve_ratio
+        self.max_burst = max_burst
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.tokens = float(max_burst)
+        self.refilled_at = time.time()
+
+    @property
+    def reserve(self) -> float:
+        return self.limit * self.reserve_ratio
+
+    @property
+    def is_close_to_rate_limit(self) -> bool:
+        return self.remaining <= self.reserve
+
+    def update(self, limit: int, remaining: int, reset: float):
+        self._refill()
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+
+    def _refill(self):
+        now = time.time()
+        if now >= self.reset:  # a new window
+            self.remaining = self.limit
+            self.reset = now + 3600
+        rate = max(self.remaining - self.reserve, 0) / max(self.reset - now, 1)
+        self.tokens = min(self.max_burst, self.tokens + rate * (now - self.refilled_at))
+        self.refilled_at = now
+
+    def try_acquire(self, cost: int) -> bool:
+        self._refill()
+        if self.tokens < cost or self.remaining - cost < self.reserve:
+            return False
+        self.tokens -= cost
+        self.remaining -= cost  # until the headers of the next response
+        return True
+
+    def acquire_up_to(self, cost: int) -> int:
+        self._refill()
+        acquired = max(0, min(cost, int(self.tokens), int(self.remaining - self.reserve)))
+        self.tokens -= acquired
+        self.remaining -= acquired
+        return acquired
+
+
+class RateLimitTracker:
+    """Process-wide rate limit budgets, keyed by (token key, resource). Never sleeps, and never calls '/rate_limit'."""
+
+    def __init__(self, reserve_ratio: float, max_burst: int, max_entries: int = 10000):
+        self.reserve_ratio = reserve_ratio
+        self.max_burst = max_burst
+        self.max_entries = max_entries
+        self._budgets = OrderedDict()  # (key, resource) -> RateLimitBudget
+        self._lock = threading.Lock()
+
+    def update_from_headers(self, key: str, headers: Mapping[str, str]):
+        headers = {name.lower(): value for name, value in headers.items()}
+        try:
+            limit = int(float(headers["x-ratelimit-limit"]))
+            remaining = int(float(headers["x-ratelimit-remaining"]))
+            reset = float(headers.get("x-ratelimit-reset", time.time() + 3600))
+        except (KeyError, ValueError):
+            return  # e.g. GitHub Enterprise with rate limiting disabled
+        resource = headers.get("x-ratelimit-resource", "core")
+        with self._lock:
+            budget = self._budgets.get((key, resource))
+            if budget is None:
+                budget = RateLimitBudget(limit, remaining, reset, self.reserve_ratio, self.max_burst)
+                self._budgets[(key, resource)] = budget
+                while len(self._budgets) > self.max_entries:
+                    self._budgets.popitem(last=False)
+            else:
+                budget.update(limit, remaining, reset)
+                self._budgets.move_to_end((key, resource))
+
+    def get_budget(self, key: str, resource: str = "core") -> Optional[RateLimitBudget]:
+        with self._lock:
+            return self._budgets.get((key, resource))
+
+    def try_acquire(self, key: str, cost: int = 1, resource: str = "core") -> bool:
+        """
+        Acquires 'cost' calls of bulk work from the budget of 'key'. Returns False (without waiting) if the work should
+        be skipped or degraded. Unknown budgets (no response seen yet) are not limited.
+        """
+        with self._lock:
+            budget = self._budgets.get((key, resource))
+            if budget is None:
+                return True
+            return budget.try_acquire(cost)
+
+    def acquire_up_to(self, key: str, cost: int, resource: str = "core") -> int:
+        """Acquires as many of 'cost' calls of bulk work as the budget of 'key' allows, and returns their number."""
+        with self._lock:
+            budget = self._budgets.get((key, resource))
+            if budget is None:
+                return cost
+            return budget.acquire_up_to(cost)
+
+    def is_close_to_rate_limit(self, key: str, resource: str = "core") -> bool:
+        budget = self.get_budget(key, resource)
+        return budget is not None and budget.is_close_to_rate_limit
+
+    def get_status(self, key: str) -> Optional[dict]:
+        """The budgets of 'key', in the format of the GitHub '/rate_limit' response ('resources')."""
+        with self._lock:
+            resources = {resource: {"limit": budget.limit, "remaining": budget.remaining, "reset": int(budget.reset)}
+                         for (budget_key, resource), budget in self._budgets.items() if budget_key == key}
+        if not resources:
+            return None
+        return {"resources": resources, "rate": resources.get("core")}
+
+
+_rate_limit_tracker = None
+_lock = threading.Lock()
+
+
+def get_rate_limit_tracker() -> RateLimitTracker:
+    global _rate_limit_tracker
+    if _rate_limit_tracker is None:
+        with _lock:
+            if _rate_limit_tracker is None:
+                settings = get_settings()
+                _rate_limit_tracker = RateLimitTracker(
+                    reserve_ratio=settings.get("GITHUB.RATE_LIMIT_RESERVE_RATIO", 0.1),
+                    max_burst=settings.get("GITHUB.RATE_LIMIT_MAX_BURST", 400))
+    return _rate_limit_tracker
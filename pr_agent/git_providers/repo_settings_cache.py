@@ -0,0 +1,190 @@
+import copy
+import hashlib
+import re
+import threading
+import time
+import tomllib
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from dynaconf.vendor import toml
+
+from pr_agent.config_loader import get_settings
+
+# strips the PR part of a PR url, e.g. 'https://github.com/org/repo/pull/1' -> 'https://github.com/org/repo'
+PR_URL_SUFFIX_PATTERN = re.compile(r"/(-/)?(pulls?|merge_requests|pull-requests|pullrequest)/\d+.*$")
+
+
+def git_blob_sha(content: bytes) -> str:
+    """The git blob sha of 'content', i.e. the sha of the settings file in the repo."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def _content_sha(content: Union[bytes, str]) -> str:
+    if not content:
+        return ""  # no settings file
+    return git_blob_sha(content.encode("utf-8") if isinstance(content, str) else content)
+
+
+def _to_dict(section) -> dict:
+    if not section:
+        return {}
+    return copy.deepcopy(section.to_dict() if hasattr(section, "to_dict") else dict(section))
+
+
+def parse_repo_settings(content: bytes) -> dict:
+    """
+    Parses the content of a repo settings file in memory. As in Dynaconf, files which are not valid TOML 1.0 are
+    parsed again with the legacy TOML parser.
+    """
+    text = content.decode("utf-8")
+    try:
+        return tomllib.loads(text)
+    except tomllib.TOMLDecodeError as e:
+        try:
+            return toml.loads(text)
+        except Exception:
+            raise e from None
+
+
+class RepoSettingsCache:
+    """
+    A process-wide cache of repo settings files (.pr_agent.toml), which are otherwise fetched and parsed for each event:
+    - the content of the settings file of each repo, keyed by (provider, repo), with its blob sha. On each event the
+      blob sha is looked up (cheaper than fetching the file, where the provider supports it), and the file is fetched
+      again only if it changed, so changes to the file are applied on the next event. With a positive 'ttl_seconds',
+      also the lookup is skipped for 'ttl_seconds' after the last one.
+    - the parsed settings, keyed by the blob sha of the content, so each version of a settings file is parsed once,
+      also when it's shared between repos (e.g. the same file in all the repos of an organization).
+    - the merged sections (a section of the global settings, updated with the repo settings), keyed by (blob sha,
+      section). A merged section is only reused on top of the same global section.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._contents = OrderedDict()  # (provider, repo) -> (content, blob sha, checked_at)
+        self._parsed = OrderedDict()  # blob sha -> parsed settings
+        self._merged = OrderedDict()  # (blob sha, section) -> (global section, merged section)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, entries: OrderedDict, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_content(self, provider: str, repo: str, fetch: Callable[[], Union[bytes, str]],
+                    fetch_sha: Callable[[], Optional[str]]) -> Union[bytes, str]:
+        """
+        Returns the content of the settings file of 'repo', calling 'fetch' only if the blob sha returned by
+        'fetch_sha' differs from the sha of the cached content (or is None).
+        """
+        key = (provider, repo)
+        with self._lock:
+            entry = self._contents.get(key)
+        if entry is not None and time.monotonic() - entry[2] < self.ttl_seconds:
+            with self._lock:
+                self.hits += 1
+            return entry[0]
+        sha = fetch_sha() if entry is not None else None
+        if sha is not None and sha == entry[1]:
+            with self._lock:
+                self.hits += 1
+                self._put(self._contents, key, (entry[0], entry[1], time.monotonic()))
+            return entry[0]
+        content = fetch()
+        with self._lock:
+            self.misses += 1
+            self._put(self._contents, key, (content, _content_sha(content), time.monotonic()))
+        return content
+
+    def get_parsed(self, content: bytes) -> dict:
+        """Returns the parsed settings of 'content'. Raises an exception if the content is invalid (not cached)."""
+        sha = git_blob_sha(content)
+        with self._lock:
+            parsed = self._parsed.get(sha)
+            if parsed is not None:
+                self._parsed.move_to_end(sha)
+                return parsed
+        parsed = parse_repo_settings(content)
+        with self._lock:
+            self._put(self._parsed, sha, parsed)
+        return parsed
+
+    def get_merged_section(self, content: bytes, section: str, current_section, contents: dict) -> dict:
+        """
+        Returns a copy of 'current_section' updated with 'contents' (the repo settings of 'section').
+        The returned dict is owned by the caller.
+        """
+        key = (git_blob_sha(content), section.upper())
+        with self._lock:
+            entry = self._merged.get(key)
+            if entry is not None and entry[0] is current_section:
+                self._merged.move_to_end(key)
+                return copy.deepcopy(entry[1])
+        merged = _to_dict(current_section)
+        for key_name, value in contents.items():
+            merged[key_name] = copy.deepcopy(value)
+        with self._lock:
+            self._put(self._merged, key, (current_section, merged))
+        return copy.deepcopy(merged)
+
+    def clear(self):
+        with self._lock:
+            self._contents.clear()
+            self._parsed.clear()
+            self._merged.clear()
+
+
+_repo_settings_cache = None
+_lock = threading.Lock()
+
+
+def get_repo_settings_cache() -> RepoSettingsCache:
+    global _repo_settings_cache
+    if _repo_settings_cache is None:
+        with _lock:
+            if _repo_settings_cache is None:
+                settings = get_settings()
+                _repo_settings_cache = RepoSettingsCache(
+                    ttl_seconds=settings.get("REPO_SETTINGS_CACHE.TTL_SECONDS", 0),
+                    max_entries=settings.get("REPO_SETTINGS_CACHE.MAX_ENTRIES", 1000))
+    return _repo_settings_cache
+
+
+def get_repo_id(pr_url: str) -> str:
+    return PR_URL_SUFFIX_PATTERN.sub("", pr_url or "")
+
+
+def get_cached_repo_settings(git_provider, pr_url: str) -> Union[bytes, str]:
+    """Returns the content of the repo settings file, through the cache if 'repo_settings_cache.enabled' is on."""
+    if not get_settings().get("REPO_SETTINGS_CACHE.ENABLED", False):
+        return git_provider.get_repo_settings()
+    return get_repo_settings_cache().get_content(type(git_provider).__name__, get_repo_id(pr_url),
+                                                 git_provider.get_repo_settings, git_provider.get_repo_settings_sha)
+
+
+def parse_and_merge_repo_settings(content: Union[bytes, str],
+                                  get_current_section: Callable[[str], Optional[dict]]) -> Tuple[dict, Dict[str, dict]]:
+    """
+    Parses 'content', and returns the repo settings, and the merged sections - the current section (as returned by
+    'get_current_section') updated with the repo settings, for each section of the repo settings.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if not get_settings().get("REPO_SETTINGS_CACHE.ENABLED", False):
+        repo_settings = parse_repo_settings(content)
+        merged_sections = {}
+        for section, contents in repo_settings.items():
+            merged_sections[section] = _to_dict(get_current_section(section))
+            for key, value in contents.items():
+                merged_sections[section][key] = value
+        return repo_settings, merged_sections
+    cache = get_repo_settings_cache()
+    repo_settings = cache.get_parsed(content)
+    merged_sections = {section: cache.get_merged_section(content, section, get_current_section(section), contents)
+                       for section, contents in repo_settings.items()}
+    return repo_settings, merged_sections
@@ -1,12 +1,10 @@
-import copy
 import os
-import tempfile
 
-from dynaconf import Dynaconf
 from starlette_context import context
 
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider_with_context
+from pr_agent.git_providers.repo_settings_cache import get_cached_repo_settings, parse_and_merge_repo_settings
 from pr_agent.log import get_logger
 
 
@@ -14,7 +12,6 @@ def apply_repo_settings(pr_url):
     os.environ["AUTO_CAST_FOR_DYNACONF"] = "false"
     git_provider = get_git_provider_with_context(pr_url)
     if get_settings().config.use_repo_settings_file:
-        repo_settings_file = None
         try:
             try:
                 repo_settings = context.get("repo_settings", None)
@@ -22,7 +19,7 @@ def apply_repo_settings(pr_url):
                 repo_settings = None
                 pass
             if repo_settings is None:  # None is different from "", which is a valid value
-                repo_settings = git_provider.get_repo_settings()
+                repo_settings = get_cached_repo_settings(git_provider, pr_url)
                 try:
                     context["repo_settings"] = repo_settings
                 except Exception:
@@ -30,19 +27,13 @@ def apply_repo_settings(pr_url):
 
             error_local = None
             if repo_settings:
-                repo_settings_file = None
                 category = 'local'
                 try:
-                    fd, repo_settings_file = tempfile.mkstemp(suffix='.toml')
-                    os.write(fd, repo_settings)
-                    new_settings = Dynaconf(settings_files=[repo_settings_file])
-                    for section, contents in new_settings.as_dict().items():
-                        section_dict = copy.deepcopy(get_settings().as_dict().get(section, {}))
-                        for key, value in contents.items():
-                            section_dict[key] = value
+                    new_settings, merged_sections = parse_and_merge_repo_settings(repo_settings, get_settings().get)
+                    for section, section_dict in merged_sections.items():
                         get_settings().unset(section)
                         get_settings().set(section, section_dict, merge=False)
-                    get_logger().info(f"Applying repo settings:\n{new_settings.as_dict()}")
+                    get_logger().info(f"Applying repo settings:\n{new_settings}")
                 except Exception as e:
                     get_logger().warning(f"Failed to apply repo {category} settings, error: {str(e)}")
                     error_local = {'error': str(e), 'settings': repo_settings, 'category': category}
@@ -51,12 +42,6 @@ def apply_repo_settings(pr_url):
                     handle_configurations_errors([error_local], git_provider)
         except Exception as e:
             get_logger().exception("Failed to apply repo settings", e)
-        finally:
-            if repo_settings_file:
-                try:
-                    os.remove(repo_settings_file)
-                except Exception as e:
-                    get_logger().error(f"Failed to remove temporary settings file {repo_settings_file}", e)
 
     # enable switching models with a short definition
     if get_settings().config.model.lower() == 'claude-3-5-sonnet':
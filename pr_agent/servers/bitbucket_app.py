@@ -1,5 +1,4 @@
 import base64
-import copy
 import hashlib
 import json
 import os
@@ -18,12 +17,13 @@ from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.secret_providers import get_secret_provider
+from pr_agent.servers.job_scheduler import get_job_scheduler_stats, get_retry_after_header, submit_webhook_job
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
@@ -83,6 +83,30 @@ def _get_username(data):
     return ""
 
 
+def get_tenant(data: dict):
+    # the workspace of the repository
+    pr_data = data.get("data", {}).get("pullrequest", {})
+    repo_full_name = pr_data.get("destination", {}).get("repository", {}).get("full_name", "")
+    return repo_full_name.split("/")[0] if repo_full_name else None
+
+
+def get_job_key(data: dict):
+    """
+    Returns the key of the job of a webhook, i.e. the PR and the command it triggers, or None if the webhook doesn't
+    trigger a command on a PR. A queued job is replaced by a newer job with the same key.
+    """
+    event = data.get("event", "")
+    pr_url = data.get("data", {}).get("pullrequest", {}).get("links", {}).get("html", {}).get("href")
+    if not pr_url:
+        return None
+    if event == "pullrequest:created":
+        return pr_url, event
+    if event == "pullrequest:comment_created":
+        comment_body = data.get("data", {}).get("comment", {}).get("content", {}).get("raw")
+        return (pr_url, comment_body) if comment_body else None
+    return None
+
+
 async def _perform_commands_bitbucket(commands_conf: str, agent: PRAgent, api_url: str, log_context: dict, data: dict):
     apply_repo_settings(api_url)
     if commands_conf == "pr_commands" and get_settings().config.disable_auto_feedback:  # auto commands for PR, and auto feedback is disabled
@@ -206,7 +230,7 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
             jwt.decode(input_jwt, shared_secret, audience=client_key, algorithms=["HS256"])
             bearer_token = await get_bearer_token(shared_secret, client_key)
             context['bitbucket_bearer_token'] = bearer_token
-            context["settings"] = copy.deepcopy(global_settings)
+            context["settings"] = LayeredSettings(global_settings)
             event = data["event"]
             agent = PRAgent()
             if event == "pullrequest:created":
@@ -231,13 +255,18 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
                         await agent.handle_request(pr_url, comment_body)
         except Exception as e:
             get_logger().error(f"Failed to handle webhook: {e}")
-    background_tasks.add_task(inner)
+    if not submit_webhook_job(background_tasks, inner, tenant=get_tenant(data), key=get_job_key(data)):
+        return JSONResponse({"error": "Too many pending requests"}, status_code=429, headers=get_retry_after_header())
     return "OK"
 
 @router.get("/webhook")
-async def handle_github_webhooks(request: Request, response: Response):
+async def handle_get_webhooks(request: Request, response: Response):
     return "Webhook server online!"
 
+@router.get("/queue_stats")
+async def handle_queue_stats():
+    return get_job_scheduler_stats()
+
 @router.post("/installed")
 async def handle_installed_webhooks(request: Request, response: Response):
     try:
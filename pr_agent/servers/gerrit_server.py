@@ -1,4 +1,3 @@
-import copy
 from enum import Enum
 from json import JSONDecodeError
 
@@ -10,7 +9,7 @@ from starlette_context import context
 from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.log import get_logger, setup_logger
 
 setup_logger()
@@ -35,7 +34,7 @@ class Item(BaseModel):
 @router.post("/api/v1/gerrit/{action}")
 async def handle_gerrit_request(action: Action, item: Item):
     get_logger().debug("Received a Gerrit request")
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = LayeredSettings(global_settings)
 
     if action == Action.ask:
         if not item.msg:
@@ -1,5 +1,4 @@
 import asyncio
-import copy
 import os
 from typing import Any, Dict
 
@@ -10,7 +9,7 @@ from starlette_context import context
 from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.servers.utils import verify_signature
 
@@ -26,7 +25,7 @@ async def handle_gitea_webhooks(background_tasks: BackgroundTasks, request: Requ
     body = await get_body(request)
 
     # Set context for the request
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = LayeredSettings(global_settings)
     context["git_provider"] = {}
 
     # Handle the webhook in background
@@ -1,5 +1,4 @@
 import asyncio.locks
-import copy
 import os
 import re
 import uuid
@@ -14,7 +13,7 @@ from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.git_providers import (get_git_provider,
                                     get_git_provider_with_context)
 from pr_agent.git_providers.git_provider import IncrementalPR
@@ -22,6 +21,8 @@ from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
+from pr_agent.servers.job_scheduler import (get_job_scheduler_stats, get_retry_after_header,
+                                            submit_webhook_job)
 from pr_agent.servers.utils import DefaultDictWithTimeout, verify_signature
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
@@ -48,12 +49,20 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
 
     installation_id = body.get("installation", {}).get("id")
     context["installation_id"] = installation_id
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = LayeredSettings(global_settings)
     context["git_provider"] = {}
-    background_tasks.add_task(handle_request, body, event=request.headers.get("X-GitHub-Event", None))
+    event = request.headers.get("X-GitHub-Event", None)
+    if not submit_webhook_job(background_tasks, lambda: handle_request(body, event=event),
+                              tenant=installation_id, key=get_job_key(body, event)):
+        raise HTTPException(status_code=429, detail="Too many pending requests", headers=get_retry_after_header())
     return {}
 
 
+@router.get("/api/v1/queue_stats")
+async def handle_queue_stats():
+    return get_job_scheduler_stats()
+
+
 @router.post("/api/v1/marketplace_webhooks")
 async def handle_marketplace_webhooks(request: Request, response: Response):
     body = await get_body(request)
@@ -238,6 +247,23 @@ def get_log_context(body, event, action, build_number):
     return log_context, sender, sender_id, sender_type
 
 
+def get_job_key(body: Dict[str, Any], event: str):
+    """
+    Returns the key of the job of a webhook, i.e. the PR and the command it triggers, or None if the webhook doesn't
+    trigger a command on a PR. A queued job is replaced by a newer job with the same key.
+    """
+    action = body.get("action")
+    if event == "pull_request":
+        api_url = body.get("pull_request", {}).get("url")
+        return (api_url, action) if api_url else None
+    if event in ("issue_comment", "pull_request_review_comment") and action == "created":
+        api_url = body.get("issue", {}).get("pull_request", {}).get("url") or \
+                  body.get("comment", {}).get("pull_request_url")
+        comment_body = body.get("comment", {}).get("body")
+        return (api_url, comment_body) if api_url and comment_body else None
+    return None
+
+
 def is_bot_user(sender, sender_type):
     try:
         # logic to ignore PRs opened by bot
@@ -1,4 +1,3 @@
-import copy
 import json
 import re
 from datetime import datetime
@@ -14,10 +13,11 @@ from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.secret_providers import get_secret_provider
+from pr_agent.servers.job_scheduler import get_job_scheduler_stats, get_retry_after_header, submit_webhook_job
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
@@ -170,7 +170,7 @@ def should_process_pr_logic(data) -> bool:
 async def gitlab_webhook(background_tasks: BackgroundTasks, request: Request):
     start_time = datetime.now()
     request_json = await request.json()
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = LayeredSettings(global_settings)
 
     async def inner(data: dict):
         log_context = {"server_type": "gitlab_app"}
@@ -264,12 +264,35 @@ async def gitlab_webhook(background_tasks: BackgroundTasks, request: Request):
 
                 await handle_request(url, body, log_context, sender_id)
 
-    background_tasks.add_task(inner, request_json)
+    if not submit_webhook_job(background_tasks, lambda: inner(request_json), tenant=get_tenant(request_json),
+                              key=get_job_key(request_json)):
+        return JSONResponse(status_code=status.HTTP_429_TOO_MANY_REQUESTS, headers=get_retry_after_header(),
+                            content=jsonable_encoder({"message": "too many pending requests"}))
     end_time = datetime.now()
     get_logger().info(f"Processing time: {end_time - start_time}", request=request_json)
     return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
 
 
+def get_tenant(data: dict):
+    return data.get("project", {}).get("namespace")
+
+
+def get_job_key(data: dict):
+    """
+    Returns the key of the job of a webhook, i.e. the MR and the command it triggers, or None if the webhook doesn't
+    trigger a command on a MR. A queued job is replaced by a newer job with the same key.
+    """
+    if data.get('object_kind') == 'merge_request':
+        object_attributes = data.get('object_attributes', {})
+        url = object_attributes.get('url')
+        return (url, object_attributes.get('action')) if url else None
+    if data.get('object_kind') == 'note' and 'merge_request' in data:
+        url = data['merge_request'].get('url')
+        note = data.get('object_attributes', {}).get('note')
+        return (url, note) if url and note else None
+    return None
+
+
 def handle_ask_line(body, data):
     try:
         line_range_ = data['object_attributes']['position']['line_range']
@@ -290,6 +313,11 @@ def handle_ask_line(body, data):
     return body
 
 
+@router.get("/queue_stats")
+async def handle_queue_stats():
+    return get_job_scheduler_stats()
+
+
 @router.get("/")
 async def root():
     return {"status": "ok"}
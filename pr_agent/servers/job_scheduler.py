@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from starlette.background import BackgroundTasks
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+WAIT_TIMES_WINDOW = 1000  # the wait time metrics are computed over the most recent jobs
+
+_job_scheduler = None
+_lock = threading.Lock()
+
+
+class JobStatus(str, Enum):
+    SCHEDULED = "scheduled"
+    COALESCED = "coalesced"  # replaced a queued job with the same key
+    REJECTED = "rejected"  # the queue is full
+
+
+class _Job:
+    def __init__(self, job: Callable[[], Awaitable[Any]], tenant: Hashable, coalesce_key: Optional[tuple],
+                 tenant_semaphore: asyncio.Semaphore):
+        self.job = job
+        self.tenant = tenant
+        self.coalesce_key = coalesce_key
+        self.tenant_semaphore = tenant_semaphore
+        self.enqueued_at = time.monotonic()
+        self.task = None
+        self.started = False
+        self.finished = False
+
+
+class JobScheduler:
+    """
+    Runs webhook jobs (e.g. the commands triggered by a PR event) in the event loop of the server, instead of starting
+    each one as soon as its webhook arrives:
+    - at most 'max_concurrent_jobs' jobs run at the same time, and at most 'max_concurrent_jobs_per_tenant' per tenant
+      (GitHub installation, GitLab namespace, Bitbucket workspace), so a burst of events from one tenant can't take all
+      the slots.
+    - at most 'max_queued_jobs' jobs wait for a slot. When the queue is full, new jobs are rejected, and the server
+      responds with 429.
+    - a queued job is replaced by a newer job with the same key (e.g. the same command on the same PR), since both
+      would do the same work, and the newer one has the most recent payload. Running jobs are never replaced.
+    """
+
+    def __init__(self, max_concurrent_jobs: int, max_concurrent_jobs_per_tenant: int, max_queued_jobs: int,
+                 coalesce_jobs: bool = True):
+        self.max_concurrent_jobs_per_tenant = max_concurrent_jobs_per_tenant
+        self.max_queued_jobs = max_queued_jobs
+        self.coalesce_jobs = coalesce_jobs
+        self._semaphore = asyncio.Semaphore(max_concurrent_jobs)
+        self._tenant_semaphores: Dict[Hashable, asyncio.Semaphore] = {}
+        self._tenant_jobs: Dict[Hashable, int] = {}  # queued and running jobs per tenant
+        self._queued: Dict[tuple, _Job] = {}  # coalesce key -> queued job
+        self._tasks = set()  # keeps a reference to the running tasks
+        self._num_queued = 0
+        self._num_running = 0
+        self._wait_times = deque(maxlen=WAIT_TIMES_WINDOW)
+        self.num_submitted = 0
+        self.num_coalesced = 0
+        self.num_rejected = 0
+
+    def submit(self, job: Callable[[], Awaitable[Any]], tenant: Hashable = None,
+               key: Optional[Hashable] = None) -> JobStatus:
+        """
+        Queues 'job' (a coroutine function), to run when there's a free slot for 'tenant'. Must be called from the event
+        loop. The job runs in a copy of the current context (i.e. with the request's starlette context).
+        """
+        coalesce_key = (tenant, key) if key is not None and self.coalesce_jobs else None
+        superseded = self._queued.get(coalesce_key) if coalesce_key is not None else None
+        if superseded is None and self._num_queued >= self.max_queued_jobs:
+            self.num_rejected += 1
+            get_logger().warning(f"Job queue is full, rejecting job {key=} of {tenant=}", artifact=self.stats())
+            return JobStatus.REJECTED
+
+        self.num_submitted += 1
+        if tenant not in self._tenant_semaphores:
+            self._tenant_semaphores[tenant] = asyncio.Semaphore(self.max_concurrent_jobs_per_tenant)
+            self._tenant_jobs[tenant] = 0
+        self._tenant_jobs[tenant] += 1
+        new_job = _Job(job, tenant, coalesce_key, self._tenant_semaphores[tenant])
+        self._num_queued += 1
+        if coalesce_key is not None:
+            self._queued[coalesce_key] = new_job
+        new_job.task = asyncio.create_task(self._run(new_job))
+        self._tasks.add(new_job.task)
+        new_job.task.add_done_callback(self._tasks.discard)
+
+        if superseded is not None:
+            self.num_coalesced += 1
+            get_logger().info(f"Replacing a queued job with a newer one, {key=} of {tenant=}")
+            self._finish(superseded)
+            superseded.task.cancel()
+            return JobStatus.COALESCED
+        return JobStatus.SCHEDULED
+
+    async def _run(self, job: _Job):
+        try:
+            async with job.tenant_semaphore, self._semaphore:
+                if job.finished:  # superseded while waiting
+                    return
+                job.started = True
+                self._num_queued -= 1
+                self._num_running += 1
+                if self._queued.get(job.coalesce_key) is job:
+                    del self._queued[job.coalesce_key]
+                wait_time = time.monotonic() - job.enqueued_at
+                self._wait_times.append(wait_time)
+                get_logger().debug(f"Starting job of tenant={job.tenant} after waiting {wait_time:.2f} seconds")
+                await job.job()
+        except asyncio.CancelledError:
+            if job.started:
+                raise
+        except Exception as e:
+            get_logger().error(f"Failed to run job: {e}")
+        finally:
+            self._finish(job)
+
+    def _finish(self, job: _Job):
+        if job.finished:
+            return
+        job.finished = True
+        if job.started:
+            self._num_running -= 1
+        else:
+            self._num_queued -= 1
+            if self._queued.get(job.coalesce_key) is job:
+                del self._queued[job.coalesce_key]
+        self._tenant_jobs[job.tenant] -= 1
+        if not self._tenant_jobs[job.tenant]:
+            del self._tenant_jobs[job.tenant]
+            del self._tenant_semaphores[job.tenant]
+
+    async def join(self):
+        """Waits until all the queued and running jobs are done."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        wait_times = sorted(self._wait_times)
+        return {
+            "queued_jobs": self._num_queued,
+            "running_jobs": self._num_running,
+            "active_tenants": len(self._tenant_jobs),
+            "submitted_jobs": self.num_submitted,
+            "coalesced_jobs": self.num_coalesced,
+            "rejected_jobs": self.num_rejected,
+            "avg_wait_time_sec": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            "p95_wait_time_sec": wait_times[int(0.95 * (len(wait_times) - 1))] if wait_times else 0.0,
+            "max_wait_time_sec": wait_times[-1] if wait_times else 0.0,
+        }
+
+
+def get_job_scheduler() -> Optional[JobScheduler]:
+    """Returns the job scheduler of the process, or None if 'webhook_scheduler.enabled' is off."""
+    global _job_scheduler
+    if not get_settings().get("WEBHOOK_SCHEDULER.ENABLED", False):
+        return None
+    if _job_scheduler is None:
+        with _lock:
+            if _job_scheduler is None:
+                settings = get_settings()
+                _job_scheduler = JobScheduler(
+                    max_concurrent_jobs=settings.get("WEBHOOK_SCHEDULER.MAX_CONCURRENT_JOBS", 20),
+                    max_concurrent_jobs_per_tenant=settings.get("WEBHOOK_SCHEDULER.MAX_CONCURRENT_JOBS_PER_TENANT", 4),
+                    max_queued_jobs=settings.get("WEBHOOK_SCHEDULER.MAX_QUEUED_JOBS", 200),
+                    coalesce_jobs=settings.get("WEBHOOK_SCHEDULER.COALESCE_JOBS", True))
+    return _job_scheduler
+
+
+def submit_webhook_job(background_tasks: BackgroundTasks, job: Callable[[], Awaitable[Any]],
+                       tenant: Hashable = None, key: Optional[Hashable] = None) -> bool:
+    """
+    Submits the job of a webhook to the job scheduler, or adds it to the background tasks of the request if the
+    scheduler is disabled. Returns False if the job was rejected, in which case the server should respond with 429.
+    """
+    scheduler = get_job_scheduler()
+    if scheduler is None:
+        background_tasks.add_task(job)
+        return True
+    return scheduler.submit(job, tenant=tenant, key=key) is not JobStatus.REJECTED
+
+
+def get_retry_after_header() -> Dict[str, str]:
+    return {"Retry-After": str(get_settings().get("WEBHOOK_SCHEDULER.RETRY_AFTER_SEC", 60))}
+
+
+def get_job_scheduler_stats() -> dict:
+    scheduler = get_job_scheduler()
+    return scheduler.stats() if scheduler is not None else {}
@@ -4,13 +4,12 @@ import re
 from functools import partial
 
 import requests
-from jinja2 import Environment, StrictUndefined
 from typing import Tuple
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import get_pr_diff
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.algo.utils import load_yaml
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider
@@ -99,11 +98,10 @@ class PRCheckTicket:
                 "diff": diff,
             }
         )
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(
+        system_prompt = get_prompt_template(
             get_settings().pr_check_ticket_prompt.system
         ).render(self.vars)
-        user_prompt = environment.from_string(
+        user_prompt = get_prompt_template(
             get_settings().pr_check_ticket_prompt.user
         ).render(self.vars)
         
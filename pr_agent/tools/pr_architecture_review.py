@@ -1,9 +1,11 @@
+import asyncio
 from functools import partial
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.async_git_provider import get_async_git_provider
 from pr_agent.log import get_logger
 from pr_agent.tools.pr_reviewer import PRReviewer
 
@@ -22,26 +24,30 @@ class PRArchitectureReview(PRReviewer):
                 cleaned_args.append(arg)
 
         super().__init__(pr_url, args=cleaned_args, ai_handler=ai_handler)
+        self.custom_path = custom_path
 
-        base_path = "ARCHITECTURE.md"
-        branch = get_settings().get("PR_HELP_DOCS.REPO_DEFAULT_BRANCH", "main")
-
-        base_content = ""
+    async def _load_architecture_file(self, git_provider, path: str, branch: str, description: str) -> str:
         try:
-            base_content = self.git_provider.get_pr_file_content(base_path, branch)
+            return await git_provider.get_pr_file_content(path, branch)
         except Exception as e:
             get_logger().warning(
-                f"Failed to load architecture file {base_path}: {e}"
+                f"Failed to load {description} {path}: {e}"
             )
+            return ""
 
-        custom_content = ""
-        if custom_path:
-            try:
-                custom_content = self.git_provider.get_pr_file_content(custom_path, branch)
-            except Exception as e:
-                get_logger().warning(
-                    f"Failed to load custom architecture file {custom_path}: {e}"
-                )
+    async def _prepare_pr_data(self) -> None:
+        await super()._prepare_pr_data()
+
+        base_path = "ARCHITECTURE.md"
+        custom_path = self.custom_path
+        branch = get_settings().get("PR_HELP_DOCS.REPO_DEFAULT_BRANCH", "main")
+
+        git_provider = get_async_git_provider(self.git_provider)
+        base_content, custom_content = await asyncio.gather(
+            self._load_architecture_file(git_provider, base_path, branch, "architecture file"),
+            self._load_architecture_file(git_provider, custom_path, branch, "custom architecture file")
+            if custom_path else asyncio.sleep(0, result=""),
+        )
 
         if base_content or custom_content:
             extra = self.vars.get("extra_instructions", "") or ""
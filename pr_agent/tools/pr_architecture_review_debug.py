@@ -1,11 +1,10 @@
 from functools import partial
 import copy
-from jinja2 import Environment, StrictUndefined
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import get_pr_diff
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 from pr_agent.tools.pr_architecture_review import PRArchitectureReview
@@ -37,11 +36,10 @@ class PRArchitectureReviewDebug(PRArchitectureReview):
 
         variables = copy.deepcopy(self.vars)
         variables["diff"] = self.patches_diff
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(
+        system_prompt = get_prompt_template(
             get_settings().pr_review_prompt.system
         ).render(variables)
-        user_prompt = environment.from_string(
+        user_prompt = get_prompt_template(
             get_settings().pr_review_prompt.user
         ).render(variables)
 
@@ -8,8 +8,6 @@ from datetime import datetime
 from functools import partial
 from typing import Dict, List
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
@@ -17,13 +15,16 @@ from pr_agent.algo.git_patch_processing import decouple_and_convert_to_hunks_wit
 from pr_agent.algo.pr_processing import (add_ai_metadata_to_diff_files,
                                          get_pr_diff, get_pr_multi_diffs,
                                          retry_with_fallback_models)
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.streaming import ThrottledCommentUpdater, stream_chat_completion
+from pr_agent.algo.structured_output import get_structured_output_kwargs
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.algo.utils import (ModelType, load_yaml, replace_code_tags,
                                  show_relevant_configurations, get_max_tokens, clip_tokens, get_model)
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import (AzureDevopsProvider, GithubProvider,
                                     GitLabProvider, get_git_provider,
                                     get_git_provider_with_context)
+from pr_agent.git_providers.async_git_provider import get_async_git_provider
 from pr_agent.git_providers.git_provider import get_main_pr_language, GitProvider
 from pr_agent.log import get_logger
 from pr_agent.servers.help import HelpMessage
@@ -35,9 +36,6 @@ class PRCodeSuggestions:
                  ai_handler: partial[BaseAiHandler,] = LiteLLMAIHandler):
 
         self.git_provider = get_git_provider_with_context(pr_url)
-        self.main_language = get_main_pr_language(
-            self.git_provider.get_languages(), self.git_provider.get_files()
-        )
 
         # limit context specifically for the improve command, which has hard input to parse:
         if get_settings().pr_code_suggestions.max_context_tokens:
@@ -50,16 +48,49 @@ class PRCodeSuggestions:
         num_code_suggestions = int(get_settings().pr_code_suggestions.num_code_suggestions_per_chunk)
 
         self.ai_handler = ai_handler()
-        self.ai_handler.main_pr_language = self.main_language
         self.patches_diff = None
         self.prediction = None
         self.pr_url = pr_url
         self.cli_mode = cli_mode
-        self.pr_description, self.pr_description_files = (
-            self.git_provider.get_pr_description(split_changes_walkthrough=True))
+        self.num_code_suggestions = num_code_suggestions
+
+        if get_settings().pr_code_suggestions.get("decouple_hunks", True):
+            self.pr_code_suggestions_prompt_system = get_settings().pr_code_suggestions_prompt.system
+            self.pr_code_suggestions_prompt_user = get_settings().pr_code_suggestions_prompt.user
+        else:
+            self.pr_code_suggestions_prompt_system = get_settings().pr_code_suggestions_prompt_not_decoupled.system
+            self.pr_code_suggestions_prompt_user = get_settings().pr_code_suggestions_prompt_not_decoupled.user
+
+        # set by '_prepare_pr_data', which fetches the PR data
+        self.main_language = None
+        self.pr_description, self.pr_description_files = None, None
+        self.vars = {}
+        self.token_handler = None
+
+        self.progress = "## Generating PR code suggestions\n\n"
+        self.progress += ("\nWork in progress ...<br>\n"
+                          '<img src="https://codium.ai/images/pr_agent/dual_ball_loading-crop.gif" width=48>')
+        self.progress_response = None
+        self.progress_updater = None
+        self.streamed_suggestions = []
+
+    async def _prepare_pr_data(self):
+        """
+        Fetches the PR data used by the suggestions. The provider calls don't block the event loop.
+        """
+        git_provider = get_async_git_provider(self.git_provider)
+        languages, files, pr_description, commit_messages = await asyncio.gather(
+            git_provider.get_languages(),
+            git_provider.get_files(),
+            git_provider.get_pr_description(split_changes_walkthrough=True),
+            git_provider.get_commit_messages(),
+        )
+        self.main_language = get_main_pr_language(languages, files)
+        self.ai_handler.main_pr_language = self.main_language
+        self.pr_description, self.pr_description_files = pr_description
         if (self.pr_description_files and get_settings().get("config.is_auto_command", False) and
                 get_settings().get("config.enable_ai_metadata", False)):
-            add_ai_metadata_to_diff_files(self.git_provider, self.pr_description_files)
+            await git_provider.run(add_ai_metadata_to_diff_files, self.git_provider, self.pr_description_files)
             get_logger().debug(f"AI metadata added to the this command")
         else:
             get_settings().set("config.enable_ai_metadata", False)
@@ -72,9 +103,9 @@ class PRCodeSuggestions:
             "language": self.main_language,
             "diff": "",  # empty diff for initial calculation
             "diff_no_line_numbers": "",  # empty diff for initial calculation
-            "num_code_suggestions": num_code_suggestions,
+            "num_code_suggestions": self.num_code_suggestions,
             "extra_instructions": get_settings().pr_code_suggestions.extra_instructions,
-            "commit_messages_str": self.git_provider.get_commit_messages(),
+            "commit_messages_str": commit_messages,
             "relevant_best_practices": "",
             "is_ai_metadata": get_settings().get("config.enable_ai_metadata", False),
             "focus_only_on_problems": get_settings().get("pr_code_suggestions.focus_only_on_problems", False),
@@ -82,24 +113,14 @@ class PRCodeSuggestions:
             'duplicate_prompt_examples': get_settings().config.get('duplicate_prompt_examples', False),
         }
 
-        if get_settings().pr_code_suggestions.get("decouple_hunks", True):
-            self.pr_code_suggestions_prompt_system = get_settings().pr_code_suggestions_prompt.system
-            self.pr_code_suggestions_prompt_user = get_settings().pr_code_suggestions_prompt.user
-        else:
-            self.pr_code_suggestions_prompt_system = get_settings().pr_code_suggestions_prompt_not_decoupled.system
-            self.pr_code_suggestions_prompt_user = get_settings().pr_code_suggestions_prompt_not_decoupled.user
-
         self.token_handler = TokenHandler(self.git_provider.pr,
                                           self.vars,
                                           self.pr_code_suggestions_prompt_system,
                                           self.pr_code_suggestions_prompt_user)
 
-        self.progress = f"## Generating PR code suggestions\n\n"
-        self.progress += f"""\nWork in progress ...<br>\n<img src="https://codium.ai/images/pr_agent/dual_ball_loading-crop.gif" width=48>"""
-        self.progress_response = None
-
     async def run(self):
         try:
+            await self._prepare_pr_data()
             if not self.git_provider.get_files():
                 get_logger().info(f"PR has no files: {self.pr_url}, skipping code suggestions")
                 return None
@@ -395,11 +416,20 @@ class PRCodeSuggestions:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = patches_diff  # update diff
         variables["diff_no_line_numbers"] = patches_diff_no_line_number  # update diff
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(self.pr_code_suggestions_prompt_system).render(variables)
-        user_prompt = environment.from_string(get_settings().pr_code_suggestions_prompt.user).render(variables)
-        response, finish_reason = await self.ai_handler.chat_completion(
-            model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt)
+        system_prompt = get_prompt_template(self.pr_code_suggestions_prompt_system).render(variables)
+        user_prompt = get_prompt_template(get_settings().pr_code_suggestions_prompt.user).render(variables)
+        if self.progress_response and get_settings().config.get("stream_progress", False):
+            # publish each suggestion in the progress comment as soon as it is generated
+            response = await stream_chat_completion(self.ai_handler, model=model,
+                                                    temperature=get_settings().config.temperature,
+                                                    system=system_prompt, user=user_prompt,
+                                                    list_keys=["code_suggestions"],
+                                                    on_items=self._publish_streamed_suggestions,
+                                                    **get_structured_output_kwargs(system_prompt))
+        else:
+            response, finish_reason = await self.ai_handler.chat_completion(
+                model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt,
+                **get_structured_output_kwargs(system_prompt))
         if not get_settings().config.publish_output:
             get_settings().system_prompt = system_prompt
             get_settings().user_prompt = user_prompt
@@ -427,6 +457,19 @@ class PRCodeSuggestions:
 
         return data
 
+    def _publish_streamed_suggestions(self, items: list):
+        self.streamed_suggestions.extend(item for _, item in items if isinstance(item, dict))
+        if not self.progress_updater:
+            self.progress_updater = ThrottledCommentUpdater(
+                self.git_provider, self.progress_response,
+                get_settings().config.get("stream_progress_interval_sec", 5))
+        body = self.progress + f"\n\nSuggestions found so far ({len(self.streamed_suggestions)}):\n"
+        for suggestion in self.streamed_suggestions:
+            relevant_file = str(suggestion.get('relevant_file', '')).strip()
+            summary = str(suggestion.get('one_sentence_summary', '')).strip()
+            body += f"\n- `{relevant_file}`: {summary}"
+        self.progress_updater.update(body)
+
     async def analyze_self_reflection_response(self, data, response_reflect):
         response_reflect_yaml = load_yaml(response_reflect)
         code_suggestions_feedback = response_reflect_yaml.get("code_suggestions", [])
@@ -769,7 +812,8 @@ class PRCodeSuggestions:
                     if token_count > max_tokens_full - delta_output:
                         get_logger().warning(
                             f"Token count {token_count} exceeds the limit {max_tokens_full - delta_output}. clipping the tokens")
-                        patch_final = clip_tokens(patch_final, max_tokens_full - delta_output)
+                        patch_final = clip_tokens(patch_final, max_tokens_full - delta_output,
+                                                  num_input_tokens=token_count)
                     patches_diff_list.append(patch_final)
                 return patches_diff_list
             except Exception as e:
@@ -928,23 +972,23 @@ class PRCodeSuggestions:
                          'prev_suggestions_str': prev_suggestions_str,
                          "is_ai_metadata": get_settings().get("config.enable_ai_metadata", False),
                          'duplicate_prompt_examples': get_settings().config.get('duplicate_prompt_examples', False)}
-            environment = Environment(undefined=StrictUndefined)
 
             if dedicated_prompt:
-                system_prompt_reflect = environment.from_string(
+                system_prompt_reflect = get_prompt_template(
                     get_settings().get(dedicated_prompt).system).render(variables)
-                user_prompt_reflect = environment.from_string(
+                user_prompt_reflect = get_prompt_template(
                     get_settings().get(dedicated_prompt).user).render(variables)
             else:
-                system_prompt_reflect = environment.from_string(
+                system_prompt_reflect = get_prompt_template(
                     get_settings().pr_code_suggestions_reflect_prompt.system).render(variables)
-                user_prompt_reflect = environment.from_string(
+                user_prompt_reflect = get_prompt_template(
                     get_settings().pr_code_suggestions_reflect_prompt.user).render(variables)
 
             with get_logger().contextualize(command="self_reflect_on_suggestions"):
                 response_reflect, finish_reason_reflect = await self.ai_handler.chat_completion(model=model,
                                                                                                 system=system_prompt_reflect,
-                                                                                                user=user_prompt_reflect)
+                                                                                                user=user_prompt_reflect,
+                                                                                                **get_structured_output_kwargs(system_prompt_reflect))
         except Exception as e:
             get_logger().info(f"Could not reflect on suggestions, error: {e}")
             return ""
@@ -6,7 +6,6 @@ from functools import partial
 from typing import List, Tuple
 
 import yaml
-from jinja2 import Environment, StrictUndefined
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
@@ -14,7 +13,8 @@ from pr_agent.algo.pr_processing import (OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD,
                                          get_pr_diff,
                                          get_pr_diff_multiple_patchs,
                                          retry_with_fallback_models)
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.streaming import ThrottledCommentUpdater, stream_chat_completion
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.algo.utils import (ModelType, PRDescriptionHeader, clip_tokens,
                                  get_max_tokens, get_user_labels, load_yaml,
                                  set_custom_labels,
@@ -22,6 +22,7 @@ from pr_agent.algo.utils import (ModelType, PRDescriptionHeader, clip_tokens,
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import (GithubProvider, get_git_provider,
                                     get_git_provider_with_context)
+from pr_agent.git_providers.async_git_provider import get_async_git_provider
 from pr_agent.git_providers.git_provider import get_main_pr_language
 from pr_agent.log import get_logger
 from pr_agent.servers.help import HelpMessage
@@ -40,11 +41,8 @@ class PRDescription:
             pr_url (str): The URL of the pull request.
             args (list, optional): List of arguments passed to the PRDescription class. Defaults to None.
         """
-        # Initialize the git provider and main PR language
+        # Initialize the git provider
         self.git_provider = get_git_provider_with_context(pr_url)
-        self.main_pr_language = get_main_pr_language(
-            self.git_provider.get_languages(), self.git_provider.get_files()
-        )
         self.pr_id = self.git_provider.get_pr_id()
         self.keys_fix = ["filename:", "language:", "changes_summary:", "changes_title:", "description:", "title:"]
 
@@ -55,30 +53,59 @@ class PRDescription:
 
         # Initialize the AI handler
         self.ai_handler = ai_handler()
+
+        self.COLLAPSIBLE_FILE_LIST_THRESHOLD = get_settings().pr_description.get("collapsible_file_list_threshold", 8)
+
+        # The PR data (main PR language, variables dictionary, user description and token handler) is fetched by
+        # '_prepare_pr_data'
+        self.main_pr_language = None
+        self.vars = {}
+        self.user_description = None
+        self.token_handler = None
+
+        # Initialize patches_diff and prediction attributes
+        self.patches_diff = None
+        self.prediction = None
+        self.file_label_dict = None
+        self.progress_response = None
+        self.progress_updater = None
+        self.streamed_files = []
+
+    async def _prepare_pr_data(self):
+        """
+        Fetches the PR data used by the description. The provider calls don't block the event loop.
+        """
+        git_provider = get_async_git_provider(self.git_provider)
+        languages, files, description, commit_messages, self.user_description = await asyncio.gather(
+            git_provider.get_languages(),
+            git_provider.get_files(),
+            git_provider.get_pr_description(full=False),
+            git_provider.get_commit_messages(),
+            git_provider.get_user_description(),
+        )
+        diff_files = await git_provider.get_diff_files()
+        self.main_pr_language = get_main_pr_language(languages, files)
         self.ai_handler.main_pr_language = self.main_pr_language
 
         # Initialize the variables dictionary
-        self.COLLAPSIBLE_FILE_LIST_THRESHOLD = get_settings().pr_description.get("collapsible_file_list_threshold", 8)
         enable_pr_diagram = get_settings().pr_description.get("enable_pr_diagram", False) and self.git_provider.is_supported("gfm_markdown") # github and gitlab support gfm_markdown
         self.vars = {
             "title": self.git_provider.pr.title,
             "branch": self.git_provider.get_pr_branch(),
-            "description": self.git_provider.get_pr_description(full=False),
+            "description": description,
             "language": self.main_pr_language,
             "diff": "",  # empty diff for initial calculation
             "extra_instructions": get_settings().pr_description.extra_instructions,
-            "commit_messages_str": self.git_provider.get_commit_messages(),
+            "commit_messages_str": commit_messages,
             "enable_custom_labels": get_settings().config.enable_custom_labels,
             "custom_labels_class": "",  # will be filled if necessary in 'set_custom_labels' function
             "enable_semantic_files_types": get_settings().pr_description.enable_semantic_files_types,
             "related_tickets": "",
-            "include_file_summary_changes": len(self.git_provider.get_diff_files()) <= self.COLLAPSIBLE_FILE_LIST_THRESHOLD,
+            "include_file_summary_changes": len(diff_files) <= self.COLLAPSIBLE_FILE_LIST_THRESHOLD,
             "duplicate_prompt_examples": get_settings().config.get("duplicate_prompt_examples", False),
             "enable_pr_diagram": enable_pr_diagram,
         }
 
-        self.user_description = self.git_provider.get_user_description()
-
         # Initialize the token handler
         self.token_handler = TokenHandler(
             self.git_provider.pr,
@@ -87,19 +114,16 @@ class PRDescription:
             get_settings().pr_description_prompt.user,
         )
 
-        # Initialize patches_diff and prediction attributes
-        self.patches_diff = None
-        self.prediction = None
-        self.file_label_dict = None
-
     async def run(self):
         try:
+            await self._prepare_pr_data()
             get_logger().info(f"Generating a PR description for pr_id: {self.pr_id}")
             relevant_configs = {'pr_description': dict(get_settings().pr_description),
                                 'config': dict(get_settings().config)}
             get_logger().debug("Relevant configs", artifact=relevant_configs)
             if get_settings().config.publish_output and not get_settings().config.get('is_auto_command', False):
-                self.git_provider.publish_comment("Preparing PR description...", is_temporary=True)
+                self.progress_response = self.git_provider.publish_comment("Preparing PR description...",
+                                                                           is_temporary=True)
 
             # ticket extraction if exists
             await extract_and_cache_pr_tickets(self.git_provider, self.vars)
@@ -293,8 +317,7 @@ class PRDescription:
                         get_logger().debug(f"Too many deleted files, clipping to {MAX_EXTRA_FILES_TO_PROMPT}")
                         files_walkthrough_prompt += f"\n... and {len(deleted_files_list) - MAX_EXTRA_FILES_TO_PROMPT} more"
                         break
-            tokens_files_walkthrough = len(
-                token_handler_only_description_prompt.encoder.encode(files_walkthrough_prompt))
+            tokens_files_walkthrough = token_handler_only_description_prompt.count_tokens(files_walkthrough_prompt)
             total_tokens = token_handler_only_description_prompt.prompt_tokens + tokens_files_walkthrough
             max_tokens_model = get_max_tokens(model)
             if total_tokens > max_tokens_model - OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD:
@@ -424,22 +447,42 @@ class PRDescription:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = patches_diff  # update diff
 
-        environment = Environment(undefined=StrictUndefined)
         set_custom_labels(variables, self.git_provider)
         self.variables = variables
 
-        system_prompt = environment.from_string(get_settings().get(prompt, {}).get("system", "")).render(self.variables)
-        user_prompt = environment.from_string(get_settings().get(prompt, {}).get("user", "")).render(self.variables)
+        system_prompt = get_prompt_template(get_settings().get(prompt, {}).get("system", "")).render(self.variables)
+        user_prompt = get_prompt_template(get_settings().get(prompt, {}).get("user", "")).render(self.variables)
 
-        response, finish_reason = await self.ai_handler.chat_completion(
-            model=model,
-            temperature=get_settings().config.temperature,
-            system=system_prompt,
-            user=user_prompt
-        )
+        if self.progress_response and get_settings().config.get("stream_progress", False):
+            # publish each file walkthrough in the progress comment as soon as it is generated
+            response = await stream_chat_completion(self.ai_handler, model=model,
+                                                    temperature=get_settings().config.temperature,
+                                                    system=system_prompt, user=user_prompt,
+                                                    list_keys=["pr_files"],
+                                                    on_items=self._publish_streamed_files)
+        else:
+            response, finish_reason = await self.ai_handler.chat_completion(
+                model=model,
+                temperature=get_settings().config.temperature,
+                system=system_prompt,
+                user=user_prompt
+            )
 
         return response
 
+    def _publish_streamed_files(self, items: list):
+        self.streamed_files.extend(item for _, item in items if isinstance(item, dict))
+        if not self.progress_updater:
+            self.progress_updater = ThrottledCommentUpdater(
+                self.git_provider, self.progress_response,
+                get_settings().config.get("stream_progress_interval_sec", 5))
+        body = f"Preparing PR description...\n\nFiles described so far ({len(self.streamed_files)}):\n"
+        for file in self.streamed_files:
+            filename = str(file.get('filename', '')).strip()
+            changes_title = str(file.get('changes_title', '')).strip()
+            body += f"\n- `{filename}`: {changes_title}"
+        self.progress_updater.update(body)
+
     def _prepare_data(self):
         # Load the AI prediction data into a dictionary
         self.data = load_yaml(self.prediction.strip(), keys_fix_yaml=self.keys_fix)
@@ -3,12 +3,10 @@ import re
 from functools import partial
 from typing import List, Tuple
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import get_pr_diff, retry_with_fallback_models
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.algo.utils import get_user_labels, load_yaml, set_custom_labels
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider
@@ -134,12 +132,11 @@ class PRGenerateLabels:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = self.patches_diff  # update diff
 
-        environment = Environment(undefined=StrictUndefined)
         set_custom_labels(variables, self.git_provider)
         self.variables = variables
 
-        system_prompt = environment.from_string(get_settings().pr_custom_labels_prompt.system).render(self.variables)
-        user_prompt = environment.from_string(get_settings().pr_custom_labels_prompt.user).render(self.variables)
+        system_prompt = get_prompt_template(get_settings().pr_custom_labels_prompt.system).render(self.variables)
+        user_prompt = get_prompt_template(get_settings().pr_custom_labels_prompt.user).render(self.variables)
 
         response, finish_reason = await self.ai_handler.chat_completion(
             model=model,
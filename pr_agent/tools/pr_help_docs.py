@@ -1,7 +1,8 @@
 import copy
+import json
+import time
 from functools import partial
 
-from jinja2 import Environment, StrictUndefined
 import math
 import os
 import re
@@ -10,11 +11,14 @@ from tempfile import TemporaryDirectory
 from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.docs_index import DocsIndex, get_docs_index_store
 from pr_agent.algo.pr_processing import retry_with_fallback_models
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.algo.utils import clip_tokens, get_max_tokens, load_yaml, ModelType
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider_with_context
+from pr_agent.git_providers.git_mirror import GitMirror
+from pr_agent.git_providers.git_provider import GitProvider
 from pr_agent.log import get_logger
 from pr_agent.servers.help import HelpMessage
 
@@ -261,9 +265,8 @@ class PredictionPreparator:
         try:
             self.ai_handler = ai_handler
             variables = copy.deepcopy(vars)
-            environment = Environment(undefined=StrictUndefined)
-            self.system_prompt = environment.from_string(system_prompt).render(variables)
-            self.user_prompt = environment.from_string(user_prompt).render(variables)
+            self.system_prompt = get_prompt_template(system_prompt).render(variables)
+            self.user_prompt = get_prompt_template(user_prompt).render(variables)
         except Exception as e:
             get_logger().exception(f"Caught exception during init. Setting ai_handler to None to prevent __call__.")
             self.ai_handler = None
@@ -332,28 +335,36 @@ class PRHelpDocs(object):
             return None
 
         try:
-            # Clone the repository and gather relevant documentation files.
-            docs_filepath_to_contents = self._gen_filenames_to_contents_map_from_repo()
-
-            #Generate prompt for the AI model. This will be the full text of all the documentation files combined.
-            docs_prompt = aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents)
-            if not docs_filepath_to_contents or not docs_prompt:
-                get_logger().warning(f"Could not find any usable documentation. Returning with no result...")
-                return None
-            docs_prompt_to_send_to_model = docs_prompt
-
-            # Estimate how many tokens will be needed.
-            # In case the expected number of tokens exceeds LLM limits, retry with just headings, asking the LLM to rank according to relevance to the question.
-            # Based on returned ranking, rerun but sort the documents accordingly, this time, trim in case of exceeding limit.
-
-            #First, check if the text is not too long to even query the LLM provider:
-            max_allowed_txt_input = get_maximal_text_input_length_for_token_count_estimation()
-            invoke_llm_just_with_headings = self._trim_docs_input(docs_prompt_to_send_to_model, max_allowed_txt_input,
-                                                                  only_return_if_trim_needed=True)
-            if invoke_llm_just_with_headings:
-                #Entire docs is too long. Rank and return according to relevance.
-                docs_prompt_to_send_to_model = await self._rank_docs_and_return_them_as_prompt(docs_filepath_to_contents,
-                                                                                         max_allowed_txt_input)
+            # Only the sections most relevant to the question, from the persistent docs index (if enabled):
+            docs_prompt_to_send_to_model = ""
+            if get_settings().get('PR_HELP_DOCS.USE_DOCS_INDEX', False):
+                docs_prompt_to_send_to_model = self._get_docs_prompt_from_index()
+            if not docs_prompt_to_send_to_model:
+                # Clone the repository and gather relevant documentation files.
+                docs_filepath_to_contents = self._gen_filenames_to_contents_map_from_repo()
+
+                #Generate prompt for the AI model. This will be the full text of all the documentation files combined.
+                docs_prompt = aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents)
+                if not docs_filepath_to_contents or not docs_prompt:
+                    get_logger().warning("Could not find any usable documentation. Returning with no result...")
+                    return None
+                docs_prompt_to_send_to_model = docs_prompt
+
+                # Estimate how many tokens will be needed.
+                # In case the expected number of tokens exceeds LLM limits, retry with just headings, asking the LLM to
+                # rank according to relevance to the question.
+                # Based on returned ranking, rerun but sort the documents accordingly, this time, trim in case of
+                # exceeding limit.
+
+                #First, check if the text is not too long to even query the LLM provider:
+                max_allowed_txt_input = get_maximal_text_input_length_for_token_count_estimation()
+                invoke_llm_just_with_headings = self._trim_docs_input(docs_prompt_to_send_to_model,
+                                                                      max_allowed_txt_input,
+                                                                      only_return_if_trim_needed=True)
+                if invoke_llm_just_with_headings:
+                    #Entire docs is too long. Rank and return according to relevance.
+                    docs_prompt_to_send_to_model = await self._rank_docs_and_return_them_as_prompt(
+                        docs_filepath_to_contents, max_allowed_txt_input)
 
             if not docs_prompt_to_send_to_model:
                 get_logger().error("Failed to generate docs prompt for model. Returning with no result...")
@@ -418,6 +429,72 @@ class PRHelpDocs(object):
             get_logger().exception(f"Unexpected exception thrown. Returning empty list.")
             return []
 
+    # The docs index of the repo (see pr_agent.algo.docs_index), refreshed with a shallow fetch to a local mirror when
+    # the repo has new commits. Only the doc files changed since the previous index are read.
+    def _get_docs_index(self) -> DocsIndex | None:
+        try:
+            store = get_docs_index_store()
+            key = json.dumps([self.repo_url, self.repo_desired_branch, self.docs_path, sorted(self.supported_doc_exts),
+                              self.include_root_readme_file])
+            index = store.get(key)
+
+            clone_url = self.git_provider._prepare_clone_url_with_token(self.repo_url)
+            if not clone_url:
+                get_logger().warning(f"Unable to obtain url to fetch: {self.repo_url}")
+                return None
+            index_dir = get_settings().get('PR_HELP_DOCS.DOCS_INDEX_DIR', '/tmp/pr_agent_docs_index')
+            mirror = GitMirror(os.path.join(index_dir, 'repos'), self.repo_url, timeout=GitProvider.CLONE_TIMEOUT_SEC)
+            ref = f"refs/heads/{self.repo_desired_branch}" if self.repo_desired_branch else "HEAD"
+            # the index is shared by all the callers of the process (and of the index dir), so it is served only after
+            # the remote is reached with the credentials of this caller, the same as a clone would need
+            if index and mirror.ls_remote(clone_url, ref) == index.commit_sha:
+                return index
+            commit_sha = mirror.fetch_ref(clone_url, ref, depth=1)
+            if index and index.commit_sha == commit_sha:
+                index.refreshed_at = time.time()
+            else:
+                def read_files(file_paths: list[str]) -> list[str]:
+                    contents = mirror.get_files_content([(commit_sha, file_path.lstrip('/'))
+                                                         for file_path in file_paths])
+                    return [clean_markdown_content(content) if file_path.endswith(('.md', '.mdx')) else content
+                            for file_path, content in zip(file_paths, contents, strict=True)]
+                index = DocsIndex.build(commit_sha, self._list_doc_files(mirror, commit_sha), read_files,
+                                        self.token_handler.count_tokens, previous=index)
+            store.set(key, index)
+            return index
+        except Exception as e:
+            get_logger().warning(f"Failed to get the docs index of {self.repo_url}, will clone the repo instead: {e}")
+            return None
+
+    # (file path, as given in the prompt, blob sha) of the documentation files of the repo at a commit
+    def _list_doc_files(self, mirror: GitMirror, commit_sha: str, max_allowed_files=5000) -> list[tuple[str, str]]:
+        dotless_extensions = [ext.lower().lstrip('.') for ext in self.supported_doc_exts]
+        doc_files = {}
+        if self.include_root_readme_file:
+            for file_path, blob_sha in mirror.list_files(commit_sha, recursive=False):
+                if file_path.lower().startswith("readme."):
+                    doc_files[f"/{file_path}"] = blob_sha
+        docs_path = self.docs_path.strip('/')
+        for file_path, blob_sha in mirror.list_files(commit_sha, [docs_path] if docs_path not in ('', '.') else None):
+            if any(file_path.lower().endswith(f'.{ext}') for ext in dotless_extensions):
+                doc_files.setdefault(f"/{file_path}", blob_sha)
+                if len(doc_files) >= max_allowed_files:
+                    get_logger().warning(f"Found at least {max_allowed_files} files in {self.docs_path}, "
+                                         f"skipping the rest.")
+                    break
+        return list(doc_files.items())
+
+    # The sections of the docs index most relevant to the question, grouped by file (in the order of their relevance)
+    def _get_docs_prompt_from_index(self) -> str:
+        index = self._get_docs_index()
+        if not index or not index.sections:
+            return ""
+        sections = index.search(self.question, get_settings().get('PR_HELP_DOCS.MAX_DOCS_TOKENS', 20000))
+        file_path_to_contents = index.group_by_file(sections)
+        get_logger().info(f"Selected {len(sections)} of {len(index.sections)} docs sections of commit "
+                          f"{index.commit_sha}, from {len(file_path_to_contents)} files")
+        return aggregate_documentation_files_for_prompt_contents(file_path_to_contents)
+
     def _gen_filenames_to_contents_map_from_repo(self) -> dict[str, str]:
         try:
             with TemporaryDirectory() as tmp_dir:
@@ -1,22 +1,74 @@
+import argparse
 import copy
+import hashlib
 import re
+import threading
 from functools import partial
 from pathlib import Path
 
-from jinja2 import Environment, StrictUndefined
+import litellm
 
-from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.docs_index import DocsIndex, SectionEmbeddings
 from pr_agent.algo.pr_processing import retry_with_fallback_models
-from pr_agent.algo.token_handler import TokenHandler
-from pr_agent.algo.utils import (ModelType, clip_tokens, get_max_tokens,
-                                 load_yaml)
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
+from pr_agent.algo.utils import ModelType, load_yaml
 from pr_agent.config_loader import get_settings
-from pr_agent.git_providers import (BitbucketServerProvider, GithubProvider,
-                                    get_git_provider_with_context)
+from pr_agent.git_providers import BitbucketServerProvider, GithubProvider, get_git_provider_with_context
 from pr_agent.log import get_logger
 
+HELP_DOCS_PATH = Path(__file__).parent.parent.parent / 'docs' / 'docs'
+# the prebuilt index of the bundled docs (see 'build_help_docs_index' below)
+HELP_DOCS_INDEX_DIR = Path(__file__).parent / 'help_docs_index'
+FOLDERS_TO_EXCLUDE = ['/finetuning_benchmark/']
+FILES_TO_EXCLUDE = {'EXAMPLE_BEST_PRACTICE.md', 'compression_strategy.md', '/docs/overview/index.md'}
+EMBEDDING_BATCH_SIZE = 64
+
+
+def build_help_docs_index(docs_path: Path = HELP_DOCS_PATH, embedding_model: str = None) -> DocsIndex:
+    """
+    Indexes the sections of the bundled docs (BM25, and their embeddings if 'embedding_model' is given).
+    """
+    md_files = sorted(docs_path.glob('**/*.md'))
+    md_files = [file for file in md_files if not any(folder in str(file) for folder in FOLDERS_TO_EXCLUDE)
+                and file.name not in FILES_TO_EXCLUDE]
+    contents = {str(file).replace(str(docs_path), ''): file.read_text(encoding='utf-8') for file in md_files}
+    files = [(file_path, hashlib.sha1(content.encode('utf-8')).hexdigest()) for file_path, content in contents.items()]
+    index = DocsIndex.build('', files, lambda file_paths: [contents[file_path] for file_path in file_paths],
+                            TokenHandler().count_tokens)
+    if embedding_model:
+        vectors = []
+        for i in range(0, len(index.sections), EMBEDDING_BATCH_SIZE):
+            batch = index.sections[i:i + EMBEDDING_BATCH_SIZE]
+            response = litellm.embedding(model=embedding_model,
+                                         input=[f"{section.file_path}\n{section.content}" for section in batch])
+            vectors.extend(record['embedding'] for record in response.data)
+        index.embeddings = SectionEmbeddings.from_vectors(embedding_model, vectors)
+    return index
+
+
+_help_docs_index = None
+_help_docs_index_lock = threading.Lock()
+
+
+def get_help_docs_index() -> DocsIndex:
+    """
+    The index of the bundled docs: the prebuilt one if it exists, otherwise a BM25 index which is built once per
+    process.
+    """
+    global _help_docs_index
+    if _help_docs_index is None:
+        with _help_docs_index_lock:
+            if _help_docs_index is None:
+                index_dir = get_settings().get('PR_HELP.DOCS_INDEX_DIR', '') or HELP_DOCS_INDEX_DIR
+                try:
+                    _help_docs_index = DocsIndex.load(str(index_dir))
+                except FileNotFoundError:
+                    get_logger().info(f"No prebuilt docs index in {index_dir}, indexing the docs in {HELP_DOCS_PATH}")
+                    _help_docs_index = build_help_docs_index()
+    return _help_docs_index
+
 
 def extract_header(snippet):
     res = ''
@@ -50,9 +102,8 @@ class PRHelpMessage:
     async def _prepare_prediction(self, model: str):
         try:
             variables = copy.deepcopy(self.vars)
-            environment = Environment(undefined=StrictUndefined)
-            system_prompt = environment.from_string(get_settings().pr_help_prompts.system).render(variables)
-            user_prompt = environment.from_string(get_settings().pr_help_prompts.user).render(variables)
+            system_prompt = get_prompt_template(get_settings().pr_help_prompts.system).render(variables)
+            user_prompt = get_prompt_template(get_settings().pr_help_prompts.user).render(variables)
             response, finish_reason = await self.ai_handler.chat_completion(
                 model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt)
             return response
@@ -60,6 +111,18 @@ class PRHelpMessage:
             get_logger().error(f"Error while preparing prediction: {e}")
             return ""
 
+    async def _get_question_embedding(self, index: DocsIndex) -> list[float] | None:
+        # the question is embedded only if the index has embeddings, and there is a key for the embedding model.
+        # otherwise, the sections are ranked by BM25
+        if index.embeddings is None or not get_settings().get('openai.key'):
+            return None
+        try:
+            response = await litellm.aembedding(model=index.embeddings.model, input=[self.question_str])
+            return response.data[0]['embedding']
+        except Exception as e:
+            get_logger().warning(f"Failed to embed the question, ranking the docs sections by BM25: {e}")
+            return None
+
     def parse_args(self, args):
         if args and len(args) > 0:
             question_str = " ".join(args)
@@ -100,50 +163,17 @@ class PRHelpMessage:
             if self.question_str:
                 get_logger().info(f'Answering a PR question about the PR {self.git_provider.pr_url} ')
 
-                if not get_settings().get('openai.key'):
-                    if get_settings().config.publish_output:
-                        self.git_provider.publish_comment(
-                            "The `Help` tool chat feature requires an OpenAI API key for calculating embeddings")
-                    else:
-                        get_logger().error("The `Help` tool chat feature requires an OpenAI API key for calculating embeddings")
-                    return
-
-                # current path
-                docs_path= Path(__file__).parent.parent.parent / 'docs' / 'docs'
-                # get all the 'md' files inside docs_path and its subdirectories
-                md_files = list(docs_path.glob('**/*.md'))
-                folders_to_exclude = ['/finetuning_benchmark/']
-                files_to_exclude = {'EXAMPLE_BEST_PRACTICE.md', 'compression_strategy.md', '/docs/overview/index.md'}
-                md_files = [file for file in md_files if not any(folder in str(file) for folder in folders_to_exclude) and not any(file.name == file_to_exclude for file_to_exclude in files_to_exclude)]
-
-                # sort the 'md_files' so that 'priority_files' will be at the top
-                priority_files_strings = ['/docs/index.md', '/usage-guide', 'tools/describe.md', 'tools/review.md',
-                                          'tools/improve.md', '/faq']
-                md_files_priority = [file for file in md_files if
-                                     any(priority_string in str(file) for priority_string in priority_files_strings)]
-                md_files_not_priority = [file for file in md_files if file not in md_files_priority]
-                md_files = md_files_priority + md_files_not_priority
-
+                # only the docs sections most relevant to the question
+                index = get_help_docs_index()
+                query_embedding = await self._get_question_embedding(index)
+                sections = index.search(self.question_str, get_settings().get('PR_HELP.MAX_DOCS_TOKENS', 8000),
+                                        query_embedding=query_embedding)
+                get_logger().debug(f"Selected {len(sections)} of {len(index.sections)} docs sections "
+                                   f"({'embeddings' if query_embedding is not None else 'BM25'})")
                 docs_prompt = ""
-                for file in md_files:
-                    try:
-                        with open(file, 'r') as f:
-                            file_path = str(file).replace(str(docs_path), '')
-                            docs_prompt += f"\n==file name==\n\n{file_path}\n\n==file content==\n\n{f.read().strip()}\n=========\n\n"
-                    except Exception as e:
-                        get_logger().error(f"Error while reading the file {file}: {e}")
-                token_count = self.token_handler.count_tokens(docs_prompt)
-                get_logger().debug(f"Token count of full documentation website: {token_count}")
-
-                model = get_settings().config.model
-                if model in MAX_TOKENS:
-                    max_tokens_full = MAX_TOKENS[model] # note - here we take the actual max tokens, without any reductions. we do aim to get the full documentation website in the prompt
-                else:
-                    max_tokens_full = get_max_tokens(model)
-                delta_output = 2000
-                if token_count > max_tokens_full - delta_output:
-                    get_logger().info(f"Token count {token_count} exceeds the limit {max_tokens_full - delta_output}. Skipping the PR Help message.")
-                    docs_prompt = clip_tokens(docs_prompt, max_tokens_full - delta_output)
+                for file_path, content in index.group_by_file(sections).items():
+                    docs_prompt += (f"\n==file name==\n\n{file_path}\n\n==file content==\n\n"
+                                    f"{content.strip()}\n=========\n\n")
                 self.vars['snippets'] = docs_prompt.strip()
 
                 # run the AI model
@@ -348,3 +378,16 @@ def generate_bbdc_table(column_arr_1, column_arr_2):
     # Combine all parts to form the complete table
     markdown_table = header_row + separator_row + data_rows
     return markdown_table
+
+
+if __name__ == '__main__':
+    # build-time step, e.g.: python -m pr_agent.tools.pr_help_message --embedding-model text-embedding-3-small
+    parser = argparse.ArgumentParser(description="Build the index of the bundled docs, for /help questions")
+    parser.add_argument('--embedding-model', default=None,
+                        help="embed the docs sections with this (litellm) model. Without it, only BM25 is used")
+    parser.add_argument('--output', default=str(HELP_DOCS_INDEX_DIR))
+    cli_args = parser.parse_args()
+    help_docs_index = build_help_docs_index(embedding_model=cli_args.embedding_model)
+    help_docs_index.save(cli_args.output)
+    print(f"Indexed {len(help_docs_index.sections)} sections of {len(help_docs_index.files)} files "
+          f"to {cli_args.output}")
@@ -1,3 +1,4 @@
+import asyncio
 import copy
 import datetime
 import traceback
@@ -5,20 +6,26 @@ from collections import OrderedDict
 from functools import partial
 from typing import List, Tuple
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.incremental_review import (ReviewState,
+                                              format_review_findings,
+                                              get_interdiff_files,
+                                              get_review_findings,
+                                              get_review_state_store)
 from pr_agent.algo.pr_processing import (add_ai_metadata_to_diff_files,
                                          get_pr_diff,
                                          retry_with_fallback_models)
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.streaming import ThrottledCommentUpdater, stream_chat_completion
+from pr_agent.algo.structured_output import get_structured_output_kwargs
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.algo.utils import (ModelType, PRReviewHeader,
                                  convert_to_markdown_v2, github_action_output,
                                  load_yaml, show_relevant_configurations)
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import (get_git_provider,
                                     get_git_provider_with_context)
+from pr_agent.git_providers.async_git_provider import get_async_git_provider
 from pr_agent.git_providers.git_provider import (IncrementalPR,
                                                  get_main_pr_language)
 from pr_agent.log import get_logger
@@ -47,12 +54,6 @@ class PRReviewer:
         self.git_provider = get_git_provider_with_context(pr_url)
         self.args = args
         self.incremental = self.parse_incremental(args)  # -i command
-        if self.incremental and self.incremental.is_incremental:
-            self.git_provider.get_incremental_commits(self.incremental)
-
-        self.main_language = get_main_pr_language(
-            self.git_provider.get_languages(), self.git_provider.get_files()
-        )
         self.pr_url = pr_url
         self.is_answer = is_answer
         self.is_auto = is_auto
@@ -60,15 +61,41 @@ class PRReviewer:
         if self.is_answer and not self.git_provider.is_supported("get_issue_comments"):
             raise Exception(f"Answer mode is not supported for {get_settings().config.git_provider} for now")
         self.ai_handler = ai_handler()
-        self.ai_handler.main_pr_language = self.main_language
         self.patches_diff = None
         self.prediction = None
-        answer_str, question_str = self._get_user_answers()
-        self.pr_description, self.pr_description_files = (
-            self.git_provider.get_pr_description(split_changes_walkthrough=True))
+        self.progress_response = None
+        self.progress_updater = None
+        self.streamed_issues = []
+        # set by '_prepare_pr_data', which fetches the PR data
+        self.main_language = None
+        self.pr_description, self.pr_description_files = None, None
+        self.vars = {}
+        self.token_handler = None
+
+    async def _prepare_pr_data(self) -> None:
+        """
+        Fetches the PR data used by the review. The provider calls don't block the event loop.
+        """
+        git_provider = get_async_git_provider(self.git_provider)
+        if self.incremental and self.incremental.is_incremental:
+            if self._is_incremental_review_engine_enabled():
+                await git_provider.run(self._prepare_incremental_diff_files)
+            else:
+                await git_provider.get_incremental_commits(self.incremental)
+
+        languages, files, (answer_str, question_str), pr_description, commit_messages = await asyncio.gather(
+            git_provider.get_languages(),
+            git_provider.get_files(),
+            git_provider.run(self._get_user_answers),
+            git_provider.get_pr_description(split_changes_walkthrough=True),
+            git_provider.get_commit_messages(),
+        )
+        self.main_language = get_main_pr_language(languages, files)
+        self.ai_handler.main_pr_language = self.main_language
+        self.pr_description, self.pr_description_files = pr_description
         if (self.pr_description_files and get_settings().get("config.is_auto_command", False) and
                 get_settings().get("config.enable_ai_metadata", False)):
-            add_ai_metadata_to_diff_files(self.git_provider, self.pr_description_files)
+            await git_provider.run(add_ai_metadata_to_diff_files, self.git_provider, self.pr_description_files)
             get_logger().debug(f"AI metadata added to the this command")
         else:
             get_settings().set("config.enable_ai_metadata", False)
@@ -91,13 +118,15 @@ class PRReviewer:
             'question_str': question_str,
             'answer_str': answer_str,
             "extra_instructions": get_settings().pr_reviewer.extra_instructions,
-            "commit_messages_str": self.git_provider.get_commit_messages(),
+            "commit_messages_str": commit_messages,
             "custom_labels": "",
             "enable_custom_labels": get_settings().config.enable_custom_labels,
             "is_ai_metadata":  get_settings().get("config.enable_ai_metadata", False),
             "related_tickets": get_settings().get('related_tickets', []),
             'duplicate_prompt_examples': get_settings().config.get('duplicate_prompt_examples', False),
             "date": datetime.datetime.now().strftime('%Y-%m-%d'),
+            "previous_review_findings": format_review_findings(self.incremental.previous_findings)
+            if self.incremental.is_incremental else "",
         }
 
         self.token_handler = TokenHandler(
@@ -107,6 +136,51 @@ class PRReviewer:
             get_settings().pr_review_prompt.user
         )
 
+    @staticmethod
+    def _is_incremental_review_engine_enabled() -> bool:
+        return get_settings().pr_reviewer.get("enable_incremental_review_engine", False)
+
+    def _prepare_incremental_diff_files(self) -> None:
+        """
+        Computes the changes since the head commit of the last review of the PR, for the incremental review engine.
+        Falls back to a full review if there is no previous review state, or if the changes since it are not
+        available (e.g. the PR history was rewritten).
+        """
+        head_sha = self.git_provider.get_pr_head_sha()
+        state = get_review_state_store().get(self.pr_url, "review") if head_sha else None
+        if state is None:
+            get_logger().info(f"No previous review state for {self.pr_url}, running a full review")
+            self.incremental.is_incremental = False
+            return
+        if state.head_sha == head_sha:
+            diff_files = []
+        else:
+            diff_files = get_interdiff_files(self.git_provider, state.head_sha, head_sha)
+            if diff_files is None:
+                get_logger().info(f"The changes of {self.pr_url} since commit {state.head_sha} are not available, "
+                                  f"running a full review")
+                self.incremental.is_incremental = False
+                return
+        self.incremental.last_reviewed_sha = state.head_sha
+        self.incremental.diff_files = diff_files
+        self.incremental.previous_findings = state.findings
+        get_logger().info(f"Incremental review of {len(diff_files)} files changed since commit {state.head_sha}")
+
+    def _save_review_state(self, data: dict) -> None:
+        if not self._is_incremental_review_engine_enabled():
+            return
+        try:
+            head_sha = self.git_provider.get_pr_head_sha()
+            if not head_sha:
+                return
+            findings = get_review_findings(data)
+            if self.incremental.is_incremental:  # the previous findings are still relevant for the next review
+                findings += [finding for finding in self.incremental.previous_findings if finding not in findings]
+            max_findings = get_settings().pr_reviewer.num_max_findings * 3
+            get_review_state_store().set(self.pr_url, "review", ReviewState(head_sha, findings[:max_findings]))
+        except Exception as e:
+            get_logger().warning(f"Failed to save the review state of {self.pr_url}: {e}")
+
     def parse_incremental(self, args: List[str]):
         is_incremental = False
         if args and len(args) >= 1:
@@ -118,6 +192,7 @@ class PRReviewer:
 
     async def run(self) -> None:
         try:
+            await self._prepare_pr_data()
             if not self.git_provider.get_files():
                 get_logger().info(f"PR has no files: {self.pr_url}, skipping review")
                 return None
@@ -138,6 +213,14 @@ class PRReviewer:
             # ticket extraction if exists
             await extract_and_cache_pr_tickets(self.git_provider, self.vars)
 
+            if self.incremental.is_incremental and self.incremental.diff_files == []:
+                get_logger().info(f"Incremental review is enabled for {self.pr_url} but there are no new changes")
+                if get_settings().config.publish_output and not self.is_auto:
+                    self.git_provider.publish_comment(f"Incremental Review Skipped\n"
+                                                      f"No files were changed since the previous PR Review "
+                                                      f"(commit {self.incremental.last_reviewed_sha})")
+                return None
+
             if self.incremental.is_incremental and hasattr(self.git_provider, "unreviewed_files_set") and not self.git_provider.unreviewed_files_set:
                 get_logger().info(f"Incremental review is enabled for {self.pr_url} but there are no new files")
                 previous_review_url = ""
@@ -149,7 +232,7 @@ class PRReviewer:
                 return None
 
             if get_settings().config.publish_output and not get_settings().config.get('is_auto_command', False):
-                self.git_provider.publish_comment("Preparing review...", is_temporary=True)
+                self.progress_response = self.git_provider.publish_comment("Preparing review...", is_temporary=True)
 
             await retry_with_fallback_models(self._prepare_prediction, model_type=ModelType.REGULAR)
             if not self.prediction:
@@ -190,7 +273,8 @@ class PRReviewer:
                                         self.token_handler,
                                         model,
                                         add_line_numbers_to_hunks=True,
-                                        disable_extra_lines=False,)
+                                        disable_extra_lines=False,
+                                        diff_files=self.incremental.diff_files,)
 
         if self.patches_diff:
             get_logger().debug(f"PR diff", diff=self.patches_diff)
@@ -212,19 +296,41 @@ class PRReviewer:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = self.patches_diff  # update diff
 
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(get_settings().pr_review_prompt.system).render(variables)
-        user_prompt = environment.from_string(get_settings().pr_review_prompt.user).render(variables)
-
-        response, finish_reason = await self.ai_handler.chat_completion(
-            model=model,
-            temperature=get_settings().config.temperature,
-            system=system_prompt,
-            user=user_prompt
-        )
+        system_prompt = get_prompt_template(get_settings().pr_review_prompt.system).render(variables)
+        user_prompt = get_prompt_template(get_settings().pr_review_prompt.user).render(variables)
+
+        if self.progress_response and get_settings().config.get("stream_progress", False):
+            # publish each key issue in the progress comment as soon as it is generated
+            response = await stream_chat_completion(self.ai_handler, model=model,
+                                                    temperature=get_settings().config.temperature,
+                                                    system=system_prompt, user=user_prompt,
+                                                    list_keys=["key_issues_to_review"],
+                                                    on_items=self._publish_streamed_issues,
+                                                    **get_structured_output_kwargs(system_prompt))
+        else:
+            response, finish_reason = await self.ai_handler.chat_completion(
+                model=model,
+                temperature=get_settings().config.temperature,
+                system=system_prompt,
+                user=user_prompt,
+                **get_structured_output_kwargs(system_prompt)
+            )
 
         return response
 
+    def _publish_streamed_issues(self, items: list):
+        self.streamed_issues.extend(item for _, item in items if isinstance(item, dict))
+        if not self.progress_updater:
+            self.progress_updater = ThrottledCommentUpdater(
+                self.git_provider, self.progress_response,
+                get_settings().config.get("stream_progress_interval_sec", 5))
+        body = f"Preparing review...\n\nKey issues found so far ({len(self.streamed_issues)}):\n"
+        for issue in self.streamed_issues:
+            relevant_file = str(issue.get('relevant_file', '')).strip()
+            issue_header = str(issue.get('issue_header', '')).strip()
+            body += f"\n- `{relevant_file}`: {issue_header}"
+        self.progress_updater.update(body)
+
     def _prepare_pr_review(self) -> str:
         """
         Prepare the PR review by processing the AI prediction and generating a markdown-formatted text that summarizes
@@ -247,9 +353,13 @@ class PRReviewer:
             key_issues_to_review = data['review'].pop('key_issues_to_review')
             data['review']['key_issues_to_review'] = key_issues_to_review
 
+        self._save_review_state(data)
+
         incremental_review_markdown_text = None
         # Add incremental review section
-        if self.incremental.is_incremental:
+        if self.incremental.is_incremental and self.incremental.last_reviewed_sha:
+            incremental_review_markdown_text = f"Starting from commit {self.incremental.last_reviewed_sha}"
+        elif self.incremental.is_incremental:
             last_commit_url = f"{self.git_provider.get_pr_url()}/commits/" \
                               f"{self.git_provider.incremental.first_new_commit_sha}"
             incremental_review_markdown_text = f"Starting from commit {last_commit_url}"
@@ -328,6 +438,10 @@ class PRReviewer:
         """
         Checks if we can run incremental review according the various configurations and previous review.
         """
+        # the incremental review engine reviews any new changes (and skips the review if there are none)
+        if self.incremental.last_reviewed_sha:
+            return True
+
         # checking if running is auto mode but there are no new commits
         if self.is_auto and not self.incremental.first_new_commit_sha:
             get_logger().info(f"Incremental review is enabled for {self.pr_url} but there are no new commits")
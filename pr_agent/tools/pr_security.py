@@ -1,12 +1,10 @@
 import copy
 from functools import partial
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import get_pr_diff, retry_with_fallback_models
-from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.token_handler import TokenHandler, get_prompt_template
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider_with_context
 from pr_agent.log import get_logger
@@ -110,9 +108,8 @@ class PRSecurityReview:
         self.patches_diff = get_pr_diff(self.git_provider, self.token_handler, model)
         variables = copy.deepcopy(self.vars)
         variables["diff"] = self.patches_diff
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(self.system_prompt).render(variables)
-        user_prompt = environment.from_string(self.user_prompt_template).render(variables)
+        system_prompt = get_prompt_template(self.system_prompt).render(variables)
+        user_prompt = get_prompt_template(self.user_prompt_template).render(variables)
 
         get_logger().debug("GET Prediction", user_prompt=user_prompt)
 
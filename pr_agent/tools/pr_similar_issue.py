@@ -1,4 +1,5 @@
 import time
+from datetime import datetime
 from enum import Enum
 from typing import List
 
@@ -8,6 +9,7 @@ from pydantic import BaseModel, Field
 from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import get_max_tokens
+from pr_agent.algo.vector_store import LocalVectorStore, embed_texts, get_embedding_function
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import get_git_provider
 from pr_agent.log import get_logger
@@ -174,6 +176,11 @@ class PRSimilarIssue:
                 else:
                     get_logger().info('No new issues to update')
 
+        elif get_settings().pr_similar_issue.vectordb == "local":
+            embedding_model, self.embed = get_embedding_function(MODEL)
+            self.local_store = LocalVectorStore(get_settings().local_vectordb.path, embedding_model)
+            self._update_local_store_with_issues(repo_obj, repo_name_for_index)
+
 
     async def run(self):
         get_logger().info('Getting issue...')
@@ -184,8 +191,11 @@ class PRSimilarIssue:
         get_logger().info('Done')
 
         get_logger().info('Querying...')
-        res = openai.Embedding.create(input=[issue_str], engine=MODEL)
-        embeds = [record['embedding'] for record in res['data']]
+        if get_settings().pr_similar_issue.vectordb == "local":
+            embeds = self.embed([issue_str])
+        else:
+            res = openai.Embedding.create(input=[issue_str], engine=MODEL)
+            embeds = [record['embedding'] for record in res['data']]
 
         relevant_issues_number_list = []
         relevant_comment_number_list = []
@@ -246,6 +256,28 @@ class PRSimilarIssue:
                 score_list.append(str("{:.2f}".format(1-r['_distance'])))
             get_logger().info('Done')
 
+        elif get_settings().pr_similar_issue.vectordb == "local":
+            res = self.local_store.search(self.repo_name_for_index, embeds[0], top_k=5)
+
+            for record_id, _metadata, score in res:
+                try:
+                    issue_number = int(record_id.split('.')[0].split('_')[-1])
+                except ValueError:
+                    get_logger().debug(f"Failed to parse issue number from {record_id}")
+                    continue
+
+                if original_issue_number == issue_number:
+                    continue
+                if issue_number not in relevant_issues_number_list:
+                    relevant_issues_number_list.append(issue_number)
+
+                if 'comment' in record_id:
+                    relevant_comment_number_list.append(int(record_id.split('.')[1].split('_')[-1]))
+                else:
+                    relevant_comment_number_list.append(-1)
+                score_list.append(str("{:.2f}".format(score)))
+            get_logger().info('Done')
+
         get_logger().info('Publishing response...')
         similar_issues_str = "### Similar Issues\n___\n\n"
 
@@ -272,6 +304,39 @@ class PRSimilarIssue:
         issue_str = f"Issue Header: \"{header}\"\n\nIssue Body:\n{body}"
         return issue_str, comments, number
 
+    def _get_issue_records(self, issue, repo_name_for_index) -> List["Record"]:
+        issue_str, comments, number = self._process_issue(issue)
+        issue_key = f"issue_{number}"
+        username = issue.user.login
+        created_at = str(issue.created_at)
+        records = []
+        if len(issue_str) < 8000 or \
+                self.token_handler.count_tokens(issue_str) < get_max_tokens(MODEL):  # fast reject first
+            records.append(Record(
+                id=issue_key + "." + "issue",
+                text=issue_str,
+                metadata=Metadata(repo=repo_name_for_index,
+                                  username=username,
+                                  created_at=created_at,
+                                  level=IssueLevel.ISSUE)
+            ))
+            for j, comment in enumerate(comments):
+                comment_body = comment.body
+                if not isinstance(comment_body, str) or len(comment_body.split()) < 10:
+                    continue
+
+                if len(comment_body) < 8000 or \
+                        self.token_handler.count_tokens(comment_body) < MAX_TOKENS[MODEL]:
+                    records.append(Record(
+                        id=issue_key + ".comment_" + str(j + 1),
+                        text=comment_body,
+                        metadata=Metadata(repo=repo_name_for_index,
+                                          username=username,  # use issue username for all comments
+                                          created_at=created_at,
+                                          level=IssueLevel.COMMENT)
+                    ))
+        return records
+
     def _update_index_with_issues(self, issues_list, repo_name_for_index, upsert=False):
         get_logger().info('Processing issues...')
         corpus = Corpus()
@@ -294,39 +359,8 @@ class PRSimilarIssue:
                 get_logger().info(f"Scanned {self.max_issues_to_scan} issues, stopping")
                 break
 
-            issue_str, comments, number = self._process_issue(issue)
-            issue_key = f"issue_{number}"
-            username = issue.user.login
-            created_at = str(issue.created_at)
-            if len(issue_str) < 8000 or \
-                    self.token_handler.count_tokens(issue_str) < get_max_tokens(MODEL):  # fast reject first
-                issue_record = Record(
-                    id=issue_key + "." + "issue",
-                    text=issue_str,
-                    metadata=Metadata(repo=repo_name_for_index,
-                                      username=username,
-                                      created_at=created_at,
-                                      level=IssueLevel.ISSUE)
-                )
-                corpus.append(issue_record)
-                if comments:
-                    for j, comment in enumerate(comments):
-                        comment_body = comment.body
-                        num_words_comment = len(comment_body.split())
-                        if num_words_comment < 10 or not isinstance(comment_body, str):
-                            continue
-
-                        if len(comment_body) < 8000 or \
-                                self.token_handler.count_tokens(comment_body) < MAX_TOKENS[MODEL]:
-                            comment_record = Record(
-                                id=issue_key + ".comment_" + str(j + 1),
-                                text=comment_body,
-                                metadata=Metadata(repo=repo_name_for_index,
-                                                  username=username,  # use issue username for all comments
-                                                  created_at=created_at,
-                                                  level=IssueLevel.COMMENT)
-                            )
-                            corpus.append(comment_record)
+            for record in self._get_issue_records(issue, repo_name_for_index):
+                corpus.append(record)
         df = pd.DataFrame(corpus.dict()["documents"])
         get_logger().info('Done')
 
@@ -390,39 +424,8 @@ class PRSimilarIssue:
                 get_logger().info(f"Scanned {self.max_issues_to_scan} issues, stopping")
                 break
 
-            issue_str, comments, number = self._process_issue(issue)
-            issue_key = f"issue_{number}"
-            username = issue.user.login
-            created_at = str(issue.created_at)
-            if len(issue_str) < 8000 or \
-                    self.token_handler.count_tokens(issue_str) < get_max_tokens(MODEL):  # fast reject first
-                issue_record = Record(
-                    id=issue_key + "." + "issue",
-                    text=issue_str,
-                    metadata=Metadata(repo=repo_name_for_index,
-                                        username=username,
-                                        created_at=created_at,
-                                        level=IssueLevel.ISSUE)
-                )
-                corpus.append(issue_record)
-                if comments:
-                    for j, comment in enumerate(comments):
-                        comment_body = comment.body
-                        num_words_comment = len(comment_body.split())
-                        if num_words_comment < 10 or not isinstance(comment_body, str):
-                            continue
-
-                        if len(comment_body) < 8000 or \
-                                self.token_handler.count_tokens(comment_body) < MAX_TOKENS[MODEL]:
-                            comment_record = Record(
-                                id=issue_key + ".comment_" + str(j + 1),
-                                text=comment_body,
-                                metadata=Metadata(repo=repo_name_for_index,
-                                                    username=username,  # use issue username for all comments
-                                                    created_at=created_at,
-                                                    level=IssueLevel.COMMENT)
-                            )
-                            corpus.append(comment_record)
+            for record in self._get_issue_records(issue, repo_name_for_index):
+                corpus.append(record)
         df = pd.DataFrame(corpus.dict()["documents"])
         get_logger().info('Done')
 
@@ -458,6 +461,44 @@ class PRSimilarIssue:
         get_logger().info('Done')
 
 
+    def _update_local_store_with_issues(self, repo_obj, repo_name_for_index):
+        # only the issues which were updated since they were indexed are embedded. The issues are listed by their
+        # update time, starting from the last indexed one, so a repo with more than 'max_issues_to_scan' issues is
+        # indexed over several runs.
+        indexed_issues = {} if get_settings().pr_similar_issue.force_update_dataset else \
+            self.local_store.get_documents(repo_name_for_index)
+        list_kwargs = {"state": 'all', "sort": 'updated', "direction": 'asc'}
+        if indexed_issues:
+            list_kwargs["since"] = datetime.fromisoformat(max(indexed_issues.values()))
+        issues_to_update = []
+        for issue in repo_obj.get_issues(**list_kwargs):
+            if issue.pull_request or indexed_issues.get(f"issue_{issue.number}") == issue.updated_at.isoformat():
+                continue
+            issues_to_update.append(issue)
+            if len(issues_to_update) >= self.max_issues_to_scan:
+                get_logger().info(f"Scanned {self.max_issues_to_scan} issues, stopping")
+                break
+        if not issues_to_update:
+            get_logger().info('No new issues to update')
+            return
+
+        get_logger().info(f'Embedding {len(issues_to_update)} new and updated issues...')
+        records = [record for issue in issues_to_update
+                   for record in self._get_issue_records(issue, repo_name_for_index)]
+        embeds = embed_texts([record.text for record in records], self.embed, self.token_handler.count_tokens,
+                             get_settings().local_vectordb.embedding_batch_size,
+                             get_settings().local_vectordb.embedding_batch_max_tokens)
+        if records and all(embed is None for embed in embeds):
+            raise Exception("Failed to embed the issues")
+        embedded_records = [(record, embed) for record, embed in zip(records, embeds, strict=True) if embed is not None]
+        self.local_store.upsert(repo_name_for_index,
+                                {f"issue_{issue.number}": issue.updated_at.isoformat() for issue in issues_to_update},
+                                [(record.id, record.id.split('.')[0], record.metadata.dict())
+                                 for record, _ in embedded_records],
+                                [embed for _, embed in embedded_records])
+        get_logger().info('Done')
+
+
 class IssueLevel(str, Enum):
     ISSUE = "issue"
     COMMENT = "comment"
@@ -1,11 +1,20 @@
+import asyncio
+import copy
+import hashlib
 import re
+import threading
+import time
 import traceback
+from collections import OrderedDict
+from typing import Optional
 
 from pr_agent.config_loader import get_settings
-from pr_agent.git_providers import GithubProvider
-from pr_agent.git_providers import AzureDevopsProvider
+from pr_agent.git_providers import AzureDevopsProvider, GithubProvider
+from pr_agent.git_providers.async_git_provider import get_async_git_provider
 from pr_agent.log import get_logger
 
+MAX_TICKET_CHARACTERS = 10000
+
 # Compile the regex pattern once, outside the function
 GITHUB_TICKET_PATTERN = re.compile(
      r'(https://github[^/]+/[^/]+/[^/]+/issues/\d+)|(\b(\w+)/(\w+)#(\d+)\b)|(#\d+)'
@@ -64,71 +73,165 @@ def extract_ticket_links_from_pr_description(pr_description, repo_path, base_url
     return list(github_tickets)
 
 
+class TicketCache:
+    """
+    A process-wide cache of the tickets linked to PRs:
+    - the content of each ticket (with its sub-issues), keyed by (repo, issue number, updated_at), so the sub-issues
+      of a ticket are fetched again only when the ticket was updated.
+    - the tickets of each PR, keyed by (PR url, user description), so the tools running on the same PR (e.g. /describe
+      and /review of an auto-command) share them. These expire after 'ttl_seconds'.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._tickets = OrderedDict()  # (repo, issue number, updated_at) -> ticket
+        self._pr_tickets = OrderedDict()  # (pr url, description digest) -> (tickets, stored_at)
+        self._lock = threading.Lock()
+
+    def _put(self, entries: OrderedDict, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    @staticmethod
+    def _pr_key(pr_url: str, user_description: str) -> tuple:
+        return pr_url, hashlib.sha256((user_description or "").encode("utf-8")).hexdigest()
+
+    def get_ticket(self, repo: str, issue_number: int, updated_at) -> Optional[dict]:
+        with self._lock:
+            ticket = self._tickets.get((repo, issue_number, str(updated_at)))
+            return copy.deepcopy(ticket) if ticket is not None else None
+
+    def set_ticket(self, repo: str, issue_number: int, updated_at, ticket: dict):
+        with self._lock:
+            self._put(self._tickets, (repo, issue_number, str(updated_at)), copy.deepcopy(ticket))
+
+    def get_pr_tickets(self, pr_url: str, user_description: str) -> Optional[list]:
+        key = self._pr_key(pr_url, user_description)
+        with self._lock:
+            entry = self._pr_tickets.get(key)
+            if entry is None or time.monotonic() - entry[1] >= self.ttl_seconds:
+                return None
+            return copy.deepcopy(entry[0])
+
+    def set_pr_tickets(self, pr_url: str, user_description: str, tickets: list):
+        with self._lock:
+            self._put(self._pr_tickets, self._pr_key(pr_url, user_description), (copy.deepcopy(tickets),
+                                                                                  time.monotonic()))
+
+    def clear(self):
+        with self._lock:
+            self._tickets.clear()
+            self._pr_tickets.clear()
+
+
+_ticket_cache = None
+_lock = threading.Lock()
+
+
+def get_ticket_cache() -> TicketCache:
+    global _ticket_cache
+    if _ticket_cache is None:
+        with _lock:
+            if _ticket_cache is None:
+                settings = get_settings()
+                _ticket_cache = TicketCache(ttl_seconds=settings.get("TICKET_CACHE.TTL_SECONDS", 300),
+                                            max_entries=settings.get("TICKET_CACHE.MAX_ENTRIES", 1000))
+    return _ticket_cache
+
+
+def _clip_ticket_body(body: str) -> str:
+    body = body or ""
+    if len(body) > MAX_TICKET_CHARACTERS:
+        body = body[:MAX_TICKET_CHARACTERS] + "..."
+    return body
+
+
+async def _fetch_github_sub_issue(git_provider, run, sub_issue_url):
+    try:
+        sub_repo, sub_issue_number = git_provider._parse_issue_url(sub_issue_url)
+        sub_issue = await run(git_provider.repo_obj.get_issue, sub_issue_number)
+        return {
+            'ticket_url': sub_issue_url,
+            'title': sub_issue.title,
+            'body': _clip_ticket_body(sub_issue.body)
+        }
+    except Exception as e:
+        get_logger().warning(f"Failed to fetch sub-issue content for {sub_issue_url}: {e}")
+        return None
+
+
+async def _fetch_github_ticket(git_provider, run, ticket, use_cache: bool):
+    repo_name, original_issue_number = git_provider._parse_issue_url(ticket)
+
+    try:
+        issue_main = await run(git_provider.repo_obj.get_issue, original_issue_number)
+    except Exception as e:
+        get_logger().error(f"Error getting main issue: {e}",
+                           artifact={"traceback": traceback.format_exc()})
+        return None
+
+    updated_at = getattr(issue_main, 'updated_at', None)
+    if use_cache and updated_at:
+        cached_ticket = get_ticket_cache().get_ticket(git_provider.repo, original_issue_number, updated_at)
+        if cached_ticket is not None:
+            cached_ticket['ticket_url'] = ticket
+            return cached_ticket
+
+    # Extract sub-issues (fetched concurrently)
+    sub_issues_content = []
+    try:
+        sub_issues = await run(git_provider.fetch_sub_issues, ticket)
+        sub_issues_content = [sub_issue for sub_issue in await asyncio.gather(
+            *[_fetch_github_sub_issue(git_provider, run, sub_issue_url) for sub_issue_url in sub_issues]) if sub_issue]
+    except Exception as e:
+        get_logger().warning(f"Failed to fetch sub-issues for {ticket}: {e}")
+
+    # Extract labels
+    labels = []
+    try:
+        for label in issue_main.labels:
+            labels.append(label.name if hasattr(label, 'name') else label)
+    except Exception as e:
+        get_logger().error(f"Error extracting labels error= {e}",
+                           artifact={"traceback": traceback.format_exc()})
+
+    ticket_content = {
+        'ticket_id': issue_main.number,
+        'ticket_url': ticket,
+        'title': issue_main.title,
+        'body': _clip_ticket_body(issue_main.body),
+        'labels': ", ".join(labels),
+        'sub_issues': sub_issues_content  # Store sub-issues content
+    }
+    if use_cache and updated_at:
+        get_ticket_cache().set_ticket(git_provider.repo, original_issue_number, updated_at, ticket_content)
+    return ticket_content
+
+
 async def extract_tickets(git_provider):
-    MAX_TICKET_CHARACTERS = 10000
     try:
         if isinstance(git_provider, GithubProvider):
             user_description = git_provider.get_user_description()
-            tickets = extract_ticket_links_from_pr_description(user_description, git_provider.repo, git_provider.base_url_html)
+            tickets = extract_ticket_links_from_pr_description(user_description, git_provider.repo,
+                                                               git_provider.base_url_html)
             tickets_content = []
 
             if tickets:
+                # the tickets and their sub-issues are fetched concurrently, with at most 'fetch_concurrency' calls
+                # to GitHub in flight. The calls are single PyGithub requests, which don't touch the provider state
+                async_git_provider = get_async_git_provider(git_provider)
+                semaphore = asyncio.Semaphore(max(1, get_settings().get("TICKET_CACHE.FETCH_CONCURRENCY", 8)))
 
-                for ticket in tickets:
-                    repo_name, original_issue_number = git_provider._parse_issue_url(ticket)
-
-                    try:
-                        issue_main = git_provider.repo_obj.get_issue(original_issue_number)
-                    except Exception as e:
-                        get_logger().error(f"Error getting main issue: {e}",
-                                           artifact={"traceback": traceback.format_exc()})
-                        continue
-
-                    issue_body_str = issue_main.body or ""
-                    if len(issue_body_str) > MAX_TICKET_CHARACTERS:
-                        issue_body_str = issue_body_str[:MAX_TICKET_CHARACTERS] + "..."
-
-                    # Extract sub-issues
-                    sub_issues_content = []
-                    try:
-                        sub_issues = git_provider.fetch_sub_issues(ticket)
-                        for sub_issue_url in sub_issues:
-                            try:
-                                sub_repo, sub_issue_number = git_provider._parse_issue_url(sub_issue_url)
-                                sub_issue = git_provider.repo_obj.get_issue(sub_issue_number)
-
-                                sub_body = sub_issue.body or ""
-                                if len(sub_body) > MAX_TICKET_CHARACTERS:
-                                    sub_body = sub_body[:MAX_TICKET_CHARACTERS] + "..."
-
-                                sub_issues_content.append({
-                                    'ticket_url': sub_issue_url,
-                                    'title': sub_issue.title,
-                                    'body': sub_body
-                                })
-                            except Exception as e:
-                                get_logger().warning(f"Failed to fetch sub-issue content for {sub_issue_url}: {e}")
-
-                    except Exception as e:
-                        get_logger().warning(f"Failed to fetch sub-issues for {ticket}: {e}")
-
-                    # Extract labels
-                    labels = []
-                    try:
-                        for label in issue_main.labels:
-                            labels.append(label.name if hasattr(label, 'name') else label)
-                    except Exception as e:
-                        get_logger().error(f"Error extracting labels error= {e}",
-                                           artifact={"traceback": traceback.format_exc()})
-
-                    tickets_content.append({
-                        'ticket_id': issue_main.number,
-                        'ticket_url': ticket,
-                        'title': issue_main.title,
-                        'body': issue_body_str,
-                        'labels': ", ".join(labels),
-                        'sub_issues': sub_issues_content  # Store sub-issues content
-                    })
+                async def run(func, *args):
+                    async with semaphore:
+                        return await async_git_provider.run_stateless(func, *args)
+
+                use_cache = get_settings().get("TICKET_CACHE.ENABLED", False)
+                tickets_content = [ticket for ticket in await asyncio.gather(
+                    *[_fetch_github_ticket(git_provider, run, ticket, use_cache) for ticket in tickets]) if ticket]
 
                 return tickets_content
 
@@ -137,9 +240,7 @@ async def extract_tickets(git_provider):
             tickets_content = []
             for ticket in tickets_info:
                 try:
-                    ticket_body_str = ticket.get("body", "")
-                    if len(ticket_body_str) > MAX_TICKET_CHARACTERS:
-                        ticket_body_str = ticket_body_str[:MAX_TICKET_CHARACTERS] + "..."
+                    ticket_body_str = _clip_ticket_body(ticket.get("body", ""))
 
                     tickets_content.append(
                         {
@@ -167,28 +268,47 @@ async def extract_and_cache_pr_tickets(git_provider, vars):
     if not get_settings().get('pr_reviewer.require_ticket_analysis_review', False):
         return
 
+    # tickets given explicitly in the configuration
     related_tickets = get_settings().get('related_tickets', [])
+    if related_tickets:
+        get_logger().info("Using configured tickets", artifact={"tickets": related_tickets})
+        vars['related_tickets'] = related_tickets
+        return
 
-    if not related_tickets:
-        tickets_content = await extract_tickets(git_provider)
-
-        if tickets_content:
-            # Store sub-issues along with main issues
-            for ticket in tickets_content:
-                if "sub_issues" in ticket and ticket["sub_issues"]:
-                    for sub_issue in ticket["sub_issues"]:
-                        related_tickets.append(sub_issue)  # Add sub-issues content
-
-                related_tickets.append(ticket)
-
-            get_logger().info("Extracted tickets and sub-issues from PR description",
-                              artifact={"tickets": related_tickets})
+    # the tickets of a PR are shared by the tools running on it, as long as the user description didn't change
+    pr_url = getattr(git_provider, 'pr_url', None)
+    use_cache = bool(get_settings().get("TICKET_CACHE.ENABLED", False) and pr_url)
+    user_description = ""
+    if use_cache:
+        try:
+            user_description = git_provider.get_user_description()
+        except Exception:
+            use_cache = False
+    if use_cache:
+        related_tickets = get_ticket_cache().get_pr_tickets(pr_url, user_description)
+        if related_tickets is not None:
+            get_logger().info("Using cached tickets", artifact={"tickets": related_tickets})
+            if related_tickets:
+                vars['related_tickets'] = related_tickets
+            return
+
+    related_tickets = []
+    tickets_content = await extract_tickets(git_provider)
+    if tickets_content:
+        # Store sub-issues along with main issues
+        for ticket in tickets_content:
+            if "sub_issues" in ticket and ticket["sub_issues"]:
+                for sub_issue in ticket["sub_issues"]:
+                    related_tickets.append(sub_issue)  # Add sub-issues content
+
+            related_tickets.append(ticket)
+
+        get_logger().info("Extracted tickets and sub-issues from PR description",
+                          artifact={"tickets": related_tickets})
 
-            vars['related_tickets'] = related_tickets
-            get_settings().set('related_tickets', related_tickets)
-    else:
-        get_logger().info("Using cached tickets", artifact={"tickets": related_tickets})
         vars['related_tickets'] = related_tickets
+    if use_cache and tickets_content is not None:
+        get_ticket_cache().set_pr_tickets(pr_url, user_description, related_tickets)
 
 
 def check_tickets_relevancy():
@@ -0,0 +1,101 @@
+"""
+Microbenchmark of the settings work done on the webhook path: creating the settings of a request, and the reads and
+writes a typical request does before running a command (ignore-logic checks, command args, repo settings,
+response language).
+Compares a deep copy of the global settings per request with the per-request settings overlay (LayeredSettings).
+
+Usage (from the repository root):
+    python -m tests.benchmarks.benchmark_request_settings [--requests 2000] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import copy
+import statistics
+import time
+import tracemalloc
+
+from starlette_context import request_cycle_context
+
+from pr_agent.algo.utils import update_settings_from_args
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
+from pr_agent.log import setup_logger
+
+REPO_SETTINGS = {"pr_reviewer": {"extra_instructions": "Focus on security", "num_max_findings": 5}}
+
+
+def deep_copy_settings():
+    return copy.deepcopy(global_settings)
+
+
+def layered_settings():
+    return LayeredSettings(global_settings)
+
+
+def handle_webhook(create_settings):
+    with request_cycle_context({"settings": create_settings()}):
+        settings = get_settings()
+        # ignore logic, as in should_process_pr_logic
+        for key in ["CONFIG.IGNORE_REPOSITORIES", "CONFIG.IGNORE_PR_AUTHORS", "CONFIG.IGNORE_PR_TITLE",
+                    "CONFIG.IGNORE_PR_LABELS", "CONFIG.IGNORE_PR_SOURCE_BRANCHES",
+                    "CONFIG.IGNORE_PR_TARGET_BRANCHES", "GITHUB_APP.IGNORE_BOT_PR"]:
+            settings.get(key)
+        # repo settings, as in apply_repo_settings
+        for section, contents in REPO_SETTINGS.items():
+            section_dict = copy.deepcopy(settings.get(section, None) or {})
+            section_dict.update(contents)
+            settings.unset(section)
+            settings.set(section, section_dict, merge=False)
+        # command args, and the command itself
+        update_settings_from_args(["--pr_reviewer.require_score_review=true"])
+        settings.set("config.is_auto_command", True)
+        _ = settings.config.model, settings.pr_reviewer.extra_instructions, settings.pr_review_prompt.system
+
+
+async def run_load(create_settings, num_requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request():
+        async with semaphore:
+            start = time.perf_counter()
+            handle_webhook(create_settings)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)  # let the other requests interleave
+
+    start = time.perf_counter()
+    await asyncio.gather(*[request() for _ in range(num_requests)])
+    return time.perf_counter() - start, latencies
+
+
+def measure_allocations(create_settings, num_requests: int = 50) -> float:
+    tracemalloc.start()
+    handle_webhook(create_settings)  # warm-up
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(num_requests):
+        handle_webhook(create_settings)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - before) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    setup_logger(level="ERROR")
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    print(f"{'settings':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>12}")
+    for name, create_settings in [("deepcopy", deep_copy_settings), ("layered", layered_settings)]:
+        total, latencies = asyncio.run(run_load(create_settings, args.requests, args.concurrency))
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        p95 = latencies_ms[int(0.95 * (len(latencies_ms) - 1))]
+        peak_kib = measure_allocations(create_settings)
+        print(f"{name:<12}{args.requests / total:>10.0f}{statistics.median(latencies_ms):>10.2f}{p95:>10.2f}"
+              f"{peak_kib:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
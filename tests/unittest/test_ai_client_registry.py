@@ -0,0 +1,62 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from pr_agent.algo.ai_handlers import client_registry
+from pr_agent.algo.ai_handlers.client_registry import AIClientRegistry, get_ai_client_registry
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.config_loader import get_settings
+
+
+@pytest.fixture
+def registry():
+    with patch.object(client_registry, "_ai_client_registry", AIClientRegistry()):
+        yield get_ai_client_registry()
+
+
+class TestAIClientRegistry:
+    def test_a_client_per_event_loop_and_credentials(self, registry):
+        async def get_clients():
+            return (registry.get_async_openai_client("key"), registry.get_async_openai_client("key"),
+                    registry.get_async_openai_client("other-key"),
+                    registry.get_async_openai_client("key", base_url="https://gateway.example.com/v1"))
+
+        client, same_client, other_key_client, other_base_client = asyncio.run(get_clients())
+        assert client is same_client
+        assert len({id(client), id(other_key_client), id(other_base_client)}) == 3
+        assert client._client._transport._pool._max_keepalive_connections == 20
+
+        new_loop_client = asyncio.run(get_clients())[0]  # the connections of a client are bound to its event loop
+        assert new_loop_client is not client
+        assert len(registry._clients) == 1  # the clients of the closed loop were released
+
+    def test_handler_config_per_settings_fingerprint(self, registry):
+        original = get_settings().get("OPENAI.API_BASE", None)
+        try:
+            with patch.object(LiteLLMAIHandler, "_configure", autospec=True,
+                              side_effect=LiteLLMAIHandler._configure) as mock_configure:
+                LiteLLMAIHandler()
+                handler = LiteLLMAIHandler()
+                assert mock_configure.call_count == 1
+                assert handler.api_base == original
+
+                get_settings().set("OPENAI.API_BASE", "https://gateway.example.com/v1")
+                assert LiteLLMAIHandler().api_base == "https://gateway.example.com/v1"
+                assert mock_configure.call_count == 2
+        finally:
+            get_settings().set("OPENAI.API_BASE", original)
+
+    def test_litellm_openai_calls_reuse_a_client(self, registry):
+        original = get_settings().get("OPENAI.KEY", None)
+        get_settings().set("OPENAI.KEY", "key")
+        try:
+            async def get_kwargs(model):
+                handler = LiteLLMAIHandler()
+                return [handler._prepare_completion_kwargs(model, "system", "user", 0)[0] for _ in range(2)]
+
+            first, second = asyncio.run(get_kwargs("gpt-4o"))
+            assert first["client"] is second["client"]
+            assert "client" not in asyncio.run(get_kwargs("anthropic/claude-3-7-sonnet-20250219"))[0]
+        finally:
+            get_settings().set("OPENAI.KEY", original)
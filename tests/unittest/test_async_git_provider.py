@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from starlette_context import request_cycle_context
+
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
+from pr_agent.git_providers.async_git_provider import AsyncGitProvider, get_async_git_provider
+from pr_agent.tools.pr_reviewer import PRReviewer
+
+FETCH_LATENCY_SEC = 0.1
+
+
+class SlowProvider:
+    """A git provider whose fetches take FETCH_LATENCY_SEC each, recording the threads they ran on."""
+
+    def __init__(self):
+        self.threads = []
+        self.pr = SimpleNamespace(title="title")
+        self.git_files = None
+
+    def _fetch(self, result):
+        self.threads.append(threading.current_thread())
+        time.sleep(FETCH_LATENCY_SEC)
+        return result
+
+    def get_languages(self):
+        return self._fetch({"Python": 100})
+
+    def get_files(self):
+        self.git_files = self._fetch(["main.py"])
+        return self.git_files
+
+    def get_pr_description(self, split_changes_walkthrough=False):
+        return self._fetch(("description", []))
+
+    def get_commit_messages(self):
+        return self._fetch("1. commit")
+
+    def get_response_language(self):
+        return self._fetch(get_settings().config.response_language)
+
+    def get_pr_branch(self):
+        return "feature"
+
+    def get_num_of_files(self):
+        return len(self.git_files)
+
+    def is_supported(self, capability):
+        return True
+
+
+class TestAsyncGitProvider:
+    def test_calls_are_offloaded_with_the_request_context(self):
+        provider = SlowProvider()
+        settings = LayeredSettings(global_settings)
+        settings.set("config.response_language", "fr-FR")
+
+        async def fetch():
+            with request_cycle_context({"settings": settings}):
+                async_provider = get_async_git_provider(provider)
+                assert get_async_git_provider(async_provider) is async_provider
+                assert async_provider.pr is provider.pr
+                return await async_provider.get_response_language()
+
+        assert asyncio.run(fetch()) == "fr-FR"
+        assert provider.threads[0] is not threading.main_thread()
+
+    def test_calls_of_a_provider_are_serialized(self):
+        provider = SlowProvider()
+        async_provider, other_view = AsyncGitProvider(provider), AsyncGitProvider(provider)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        async def fetch():
+            ticker = asyncio.create_task(tick())
+            results = await asyncio.gather(async_provider.get_languages(), other_view.get_files(),
+                                           async_provider.get_commit_messages())
+            ticker.cancel()
+            return results
+
+        start = time.perf_counter()
+        assert asyncio.run(fetch()) == [{"Python": 100}, ["main.py"], "1. commit"]
+        assert time.perf_counter() - start >= 3 * FETCH_LATENCY_SEC  # one at a time
+        assert ticks >= 10  # the event loop is not blocked meanwhile
+
+    def test_stateless_calls_overlap(self):
+        provider = SlowProvider()
+        async_provider = AsyncGitProvider(provider)
+
+        async def fetch():
+            return await asyncio.gather(*[async_provider.run_stateless(provider._fetch, i) for i in range(3)])
+
+        start = time.perf_counter()
+        assert asyncio.run(fetch()) == [0, 1, 2]
+        assert time.perf_counter() - start < 2 * FETCH_LATENCY_SEC
+
+    def test_offload_disabled(self):
+        provider = SlowProvider()
+        assert asyncio.run(AsyncGitProvider(provider, offload=False).get_languages()) == {"Python": 100}
+        assert provider.threads == [threading.main_thread()]
+
+    def test_reviewer_fetches_pr_data_in_run(self):
+        provider = SlowProvider()
+        with patch("pr_agent.tools.pr_reviewer.get_git_provider_with_context", return_value=provider):
+            reviewer = PRReviewer("https://github.com/org/repo/pull/1", ai_handler=MagicMock)
+        assert provider.threads == []  # nothing is fetched before 'run'
+
+        with patch("pr_agent.tools.pr_reviewer.TokenHandler") as mock_token_handler:
+            asyncio.run(reviewer._prepare_pr_data())
+        assert mock_token_handler.call_args.args[1] is reviewer.vars
+        assert reviewer.main_language == "python"
+        assert reviewer.vars["description"] == "description"
+        assert reviewer.vars["commit_messages_str"] == "1. commit"
+        assert reviewer.vars["num_pr_files"] == 1
+
+    def test_provider_errors_are_handled_by_run(self):
+        provider = SlowProvider()
+        provider.get_languages = MagicMock(side_effect=Exception("Bad credentials"))
+        with patch("pr_agent.tools.pr_reviewer.get_git_provider_with_context", return_value=provider):
+            reviewer = PRReviewer("https://github.com/org/repo/pull/1", ai_handler=MagicMock)
+        assert asyncio.run(reviewer.run()) is None  # logged, as before the fetches moved to 'run'
@@ -0,0 +1,83 @@
+import os
+from unittest.mock import MagicMock, patch
+
+from pr_agent.git_providers.blob_cache import BlobCache, get_cached_blob, is_commit_sha
+
+SHA_1 = "a" * 40
+SHA_2 = "b" * 40
+
+
+class TestBlobCache:
+    def test_is_commit_sha(self):
+        assert is_commit_sha(SHA_1)
+        assert is_commit_sha("0123456789ab")  # abbreviated bitbucket hash
+        assert not is_commit_sha("main")
+        assert not is_commit_sha("feature/abc")
+        assert not is_commit_sha("")
+        assert not is_commit_sha(None)
+
+    def test_memory_lru_eviction(self):
+        cache = BlobCache(max_memory_bytes=10)
+        cache.set("repo", SHA_1, "a.py", "12345")
+        cache.set("repo", SHA_1, "b.py", "12345")
+        assert cache.get("repo", SHA_1, "a.py") == "12345"  # 'a.py' becomes the most recently used
+        cache.set("repo", SHA_1, "c.py", "12345")
+
+        assert cache.get("repo", SHA_1, "a.py") == "12345"
+        assert cache.get("repo", SHA_1, "b.py") is None
+        assert cache.get("repo", SHA_1, "c.py") == "12345"
+        assert cache._memory_bytes <= 10
+
+    def test_key_includes_repo_sha_and_path(self):
+        cache = BlobCache(max_memory_bytes=1000)
+        cache.set("repo", SHA_1, "a.py", "content")
+        assert cache.get("repo", SHA_2, "a.py") is None
+        assert cache.get("other_repo", SHA_1, "a.py") is None
+        assert cache.get("repo", SHA_1, "b.py") is None
+
+    def test_disk_tier(self, tmp_path):
+        cache = BlobCache(max_memory_bytes=1000, disk_path=str(tmp_path), max_disk_bytes=1000)
+        cache.set("repo", SHA_1, "a.py", "content")
+
+        # a new process (empty memory tier) reads the blob from disk
+        other_cache = BlobCache(max_memory_bytes=1000, disk_path=str(tmp_path), max_disk_bytes=1000)
+        assert other_cache._disk_bytes == len("content")
+        assert other_cache.get("repo", SHA_1, "a.py") == "content"
+
+    def test_disk_eviction(self, tmp_path):
+        cache = BlobCache(max_memory_bytes=1000, disk_path=str(tmp_path), max_disk_bytes=25)
+        for i in range(5):
+            cache.set("repo", SHA_1, f"{i}.py", "0123456789")
+            os.utime(cache._disk_file(cache._digest("repo", SHA_1, f"{i}.py")), (i, i))
+
+        assert cache._disk_bytes <= 25
+        other_cache = BlobCache(max_memory_bytes=1000, disk_path=str(tmp_path), max_disk_bytes=25)
+        assert other_cache.get("repo", SHA_1, "0.py") is None
+        assert other_cache.get("repo", SHA_1, "4.py") == "0123456789"
+
+    def test_clear_both_tiers(self, tmp_path):
+        cache = BlobCache(max_memory_bytes=1000, disk_path=str(tmp_path), max_disk_bytes=1000)
+        cache.set("repo", SHA_1, "a.py", "content")
+        cache.clear()
+        assert cache._disk_bytes == 0
+        assert cache.get("repo", SHA_1, "a.py") is None
+        assert BlobCache(max_memory_bytes=1000, disk_path=str(tmp_path), max_disk_bytes=1000)._disk_bytes == 0
+
+    def test_get_cached_blob(self):
+        cache = BlobCache(max_memory_bytes=1000)
+        fetch = MagicMock(return_value="content")
+        with patch("pr_agent.git_providers.blob_cache.get_blob_cache", return_value=cache):
+            assert get_cached_blob("repo", SHA_1, "a.py", fetch) == "content"
+            assert get_cached_blob("repo", SHA_1, "a.py", fetch) == "content"
+            assert fetch.call_count == 1
+
+            # branch names are never cached
+            assert get_cached_blob("repo", "main", "a.py", fetch) == "content"
+            assert get_cached_blob("repo", "main", "a.py", fetch) == "content"
+            assert fetch.call_count == 3
+
+            # failed (empty) fetches are not cached
+            empty_fetch = MagicMock(return_value="")
+            get_cached_blob("repo", SHA_2, "a.py", empty_fetch)
+            get_cached_blob("repo", SHA_2, "a.py", empty_fetch)
+            assert empty_fetch.call_count == 2
@@ -1,7 +1,10 @@
+import random
+from unittest.mock import MagicMock, patch
+
 import pytest
-from unittest.mock import patch, MagicMock
-from pr_agent.algo.utils import clip_tokens
+
 from pr_agent.algo.token_handler import TokenEncoder
+from pr_agent.algo.utils import clip_tokens
 
 
 class TestClipTokens:
@@ -99,13 +102,13 @@ class TestClipTokens:
         max_tokens = 10
         num_input_tokens = 15
 
-        # Should not call the encoder when num_input_tokens is provided
+        # Should not encode the text when num_input_tokens is provided and the encoder has no token offsets
         with patch.object(TokenEncoder, 'get_token_encoder') as mock_encoder:
-            mock_encoder.return_value = None  # Should not be called
+            mock_encoder.return_value = MagicMock()
 
             result = clip_tokens(text, max_tokens, num_input_tokens=num_input_tokens)
             assert result.endswith("\n...(truncated)")
-            mock_encoder.assert_not_called()
+            mock_encoder.return_value.encode.assert_not_called()
 
     def test_pre_computed_tokens_under_limit(self):
         """Test pre-computed tokens under the limit."""
@@ -304,5 +307,47 @@ class TestClipTokens:
 
         max_tokens = 10
         result = clip_tokens(text, max_tokens)
-        expected_results = 'line1\nline2\nline3\n\n...(truncated)'
-        assert result == expected_results
\ No newline at end of file
+        expected_results = 'line1\nline2\n...(truncated)'
+        assert result == expected_results
+
+    @pytest.mark.parametrize("add_three_dots", [True, False])
+    @pytest.mark.parametrize("delete_last_line", [True, False])
+    def test_exact_fit(self, add_three_dots, delete_last_line):
+        """The clipped text uses as much of the budget as possible, without exceeding it."""
+        encoder = TokenEncoder.get_token_encoder()
+        rng = random.Random(0)
+        words = ["def", "foo():", "return", "x", "é漢字", "\n", "    ", "//", "<|endoftext|>", "1234567", "));",
+                 "\U0001F600"]
+        suffix = "\n...(truncated)" if add_three_dots else ""
+        for _ in range(200):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 300)))
+            num_tokens = len(encoder.encode(text, disallowed_special=()))
+            max_tokens = rng.randint(1, num_tokens + 5)
+            result = clip_tokens(text, max_tokens, add_three_dots=add_three_dots, delete_last_line=delete_last_line)
+            if num_tokens <= max_tokens:
+                assert result == text
+                continue
+            assert len(encoder.encode(result, disallowed_special=())) <= max_tokens
+            if result:
+                assert result.endswith(suffix)
+                assert text.startswith(result[:len(result) - len(suffix)])
+            if not delete_last_line and max_tokens >= 20:
+                # only the token merged across the cut (and the truncation indicator) may be lost
+                assert len(encoder.encode(result, disallowed_special=())) >= max_tokens - 2
+
+    def test_budget_scaled_by_accurate_token_count(self):
+        """An input counted by a different (more accurate) tokenizer scales the budget down."""
+        encoder = TokenEncoder.get_token_encoder()
+        text = "word " * 1000
+        num_tokens = len(encoder.encode(text))
+        result = clip_tokens(text, 500, num_input_tokens=2 * num_tokens)
+        assert len(encoder.encode(result)) <= 250
+
+    def test_clipped_when_only_the_accurate_count_is_over_budget(self):
+        """The text fits by the encoder count, but not by the accurate count, so it is clipped by their ratio."""
+        encoder = TokenEncoder.get_token_encoder()
+        text = "word " * 1000
+        num_tokens = len(encoder.encode(text))
+        result = clip_tokens(text, num_tokens + 5, num_input_tokens=2 * num_tokens)
+        assert result != text
+        assert len(encoder.encode(result)) <= (num_tokens + 5) // 2
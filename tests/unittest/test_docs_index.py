@@ -0,0 +1,138 @@
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo import docs_index
+from pr_agent.algo.docs_index import DocsIndex, DocsIndexStore, SectionEmbeddings, split_doc_sections
+from pr_agent.git_providers.git_mirror import GitMirror
+from pr_agent.tools.pr_help_docs import PRHelpDocs
+from pr_agent.tools.pr_help_message import HELP_DOCS_PATH, build_help_docs_index
+
+README = "# Project\n\nA tool for reviewing pull requests.\n"
+REVIEW_DOC = ("# Review\n\nThe review tool scans the PR code changes.\n\n"
+              "## Configuration\n\nSet `num_max_findings` to limit the number of findings.\n\n"
+              "```bash\n# not a heading\n```\n")
+IMPROVE_DOC = "# Improve\n\nThe improve tool suggests code improvements.\n"
+
+
+def git(repo, *args) -> str:
+    return subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@test", *args],
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, files: dict) -> str:
+    for path, content in files.items():
+        (repo / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo / path).write_text(content)
+        git(repo, "add", path)
+    git(repo, "commit", "-q", "-m", "docs")
+    return git(repo, "rev-parse", "HEAD")
+
+
+class TestDocsIndex:
+    def test_split_sections(self):
+        sections = split_doc_sections("/docs/review.md", REVIEW_DOC)
+        assert [section.heading for section in sections] == ["# Review", "## Configuration"]
+        assert "# not a heading" in sections[1].content
+
+        rst_sections = split_doc_sections("/docs/index.rst", "Intro\n=====\n\nHello.\n\nUsage\n-----\n\nRun it.\n")
+        assert [section.heading for section in rst_sections] == ["Intro", "Usage"]
+
+        long_sections = split_doc_sections("/docs/long.md", "# Long\n\n" + "\n\n".join(["word " * 100] * 10),
+                                           max_section_chars=1000)
+        assert len(long_sections) > 1 and all(section.heading == "# Long" for section in long_sections)
+
+    def test_search_within_the_token_budget(self):
+        files = {"/README.md": README, "/docs/review.md": REVIEW_DOC, "/docs/improve.md": IMPROVE_DOC}
+        index = DocsIndex.build("sha1", [(path, f"blob-{path}") for path in files],
+                                lambda paths: [files[path] for path in paths], count_tokens=len)
+        selected = index.search("How do I limit the number of review findings?", max_tokens=10000)
+        assert (selected[0].file_path, selected[0].heading) == ("/docs/review.md", "## Configuration")
+        assert len(index.search("How do I limit the number of review findings?", max_tokens=80)) == 1
+
+    def test_incremental_rebuild_and_persistence(self, tmp_path):
+        files = {"/docs/review.md": REVIEW_DOC, "/docs/improve.md": IMPROVE_DOC}
+        read_files = MagicMock(side_effect=lambda paths: [files[path] for path in paths])
+        index = DocsIndex.build("sha1", [("/docs/review.md", "a"), ("/docs/improve.md", "b")], read_files, len)
+
+        files["/docs/improve.md"] = "# Improve\n\nUpdated.\n"
+        new_index = DocsIndex.build("sha2", [("/docs/review.md", "a"), ("/docs/improve.md", "c")], read_files, len,
+                                    previous=index)
+        assert read_files.call_args.args[0] == ["/docs/improve.md"]  # the unchanged file is not read again
+        assert new_index.sections[-1].content == "# Improve\n\nUpdated."
+
+        DocsIndexStore(str(tmp_path)).set("repo", new_index)
+        loaded = DocsIndexStore(str(tmp_path)).get("repo")  # a new process
+        assert (loaded.commit_sha, loaded.sections) == ("sha2", new_index.sections)
+        assert loaded.search("improve", 1000) == new_index.search("improve", 1000)
+
+
+class TestSectionEmbeddings:
+    def test_cosine_top_k_and_persistence(self, tmp_path):
+        files = {"/docs/review.md": REVIEW_DOC, "/docs/improve.md": IMPROVE_DOC}
+        index = DocsIndex.build("", [(path, path) for path in files], lambda paths: [files[path] for path in paths],
+                                len)
+        assert len(index.sections) == 3
+        index.embeddings = SectionEmbeddings.from_vectors("embedding-model", [[1, 0], [0, 2], [1, 1]])
+        selected = index.search("ignored", 10000, max_sections=2, query_embedding=[0, 1])
+        assert [section.heading for section in selected] == ["## Configuration", "# Improve"]
+        assert index.search("improve", 10000, max_sections=1)[0].heading == "# Improve"  # BM25 without an embedding
+
+        index.save(str(tmp_path))
+        loaded = DocsIndex.load(str(tmp_path))
+        assert loaded.embeddings.model == "embedding-model"
+        assert loaded.search("", 10000, query_embedding=[0, 1]) == selected + [index.sections[0]]
+
+
+class TestHelpDocsIndex:
+    def test_bundled_docs(self):
+        index = build_help_docs_index()
+        full_docs_tokens = sum(section.tokens for section in index.sections)
+        sections = index.search("How do I run an incremental review?", max_tokens=8000)
+        assert sum(section.tokens for section in sections) <= 8000 < full_docs_tokens / 5
+        assert "/tools/review.md" in [section.file_path for section in sections[:5]]
+        assert all(str(HELP_DOCS_PATH) not in file_path for file_path in index.group_by_file(sections))
+
+
+class TestPRHelpDocsIndex:
+    @pytest.fixture
+    def source(self, tmp_path):
+        repo = tmp_path / "source"
+        repo.mkdir()
+        git(repo, "init", "-q", "-b", "main")
+        commit(repo, {"README.md": README, "docs/review.md": REVIEW_DOC, "docs/improve.md": IMPROVE_DOC,
+                      "src/app.py": "print('not a doc')\n"})
+        return repo
+
+    def test_questions_use_the_index(self, source, tmp_path):
+        git_provider = MagicMock()
+        git_provider.get_git_repo_url.return_value = "https://github.com/org/repo.git"
+        git_provider._prepare_clone_url_with_token.return_value = str(source)
+        with patch("pr_agent.tools.pr_help_docs.get_git_provider_with_context", return_value=git_provider), \
+                patch.object(docs_index, "_docs_index_store", DocsIndexStore(str(tmp_path / "index"))), \
+                patch("pr_agent.tools.pr_help_docs.get_settings") as mock_settings:
+            settings = {"PR_HELP_DOCS.REPO_URL": "", "PR_HELP_DOCS.EXCLUDE_ROOT_README": False,
+                        "PR_HELP_DOCS.SUPPORTED_DOC_EXTS": [".md"], "PR_HELP_DOCS.DOCS_PATH": "docs",
+                        "PR_HELP_DOCS.DOCS_INDEX_DIR": str(tmp_path / "index"),
+                        "PR_HELP_DOCS.MAX_DOCS_TOKENS": 20000}
+            mock_settings.return_value.get.side_effect = lambda key, default=None: settings.get(key, default)
+            mock_settings.return_value.__getitem__.side_effect = lambda key: settings[key]
+            help_docs = PRHelpDocs("https://github.com/org/repo/issues/1", ai_handler=MagicMock,
+                                   args=("how to limit the findings of the review?",))
+            help_docs.token_handler = MagicMock(count_tokens=len)
+
+            docs_prompt = help_docs._get_docs_prompt_from_index()
+            assert "==file name==\n\n/docs/review.md" in docs_prompt and "num_max_findings" in docs_prompt
+            assert set(help_docs._get_docs_index().files) == {"/README.md", "/docs/review.md", "/docs/improve.md"}
+
+            with patch.object(PRHelpDocs, "_gen_filenames_to_contents_map_from_repo") as mock_clone, \
+                    patch.object(GitMirror, "fetch_ref") as mock_fetch:
+                help_docs._get_docs_prompt_from_index()  # no new commits - no fetch
+            mock_clone.assert_not_called()
+            mock_fetch.assert_not_called()
+            assert git_provider._prepare_clone_url_with_token.call_count == 3  # the access is verified on each call
+
+            # a caller without access to the repo is not served the index of another caller
+            git_provider._prepare_clone_url_with_token.return_value = str(tmp_path / "no-access")
+            assert help_docs._get_docs_index() is None
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.tools import ticket_pr_compliance_check
+from pr_agent.tools.ticket_pr_compliance_check import TicketCache, extract_and_cache_pr_tickets, extract_tickets
+
+ISSUES_URL = "https://github.com/org/repo/issues"
+
+
+class SlowRepo:
+    """A repo whose get_issue blocks, and records the maximal number of concurrent calls."""
+
+    def __init__(self, updated_at="2024-01-01"):
+        self.updated_at = updated_at
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_issue(self, number):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self._lock:
+            self.in_flight -= 1
+        return SimpleNamespace(number=number, title=f"issue {number}", body=f"body {number}", labels=[],
+                               updated_at=self.updated_at)
+
+
+@pytest.fixture
+def provider():
+    with patch.object(GithubProvider, "_get_github_client", return_value=MagicMock()):
+        provider = GithubProvider()
+    provider.repo = "org/repo"
+    provider.pr_url = "https://github.com/org/repo/pull/1"
+    provider.user_description = "Fixes #1, #2 and #3"
+    provider.repo_obj = SlowRepo()
+    provider.fetch_sub_issues = MagicMock(side_effect=lambda url: [f"{ISSUES_URL}/1{url[-1]}",
+                                                                   f"{ISSUES_URL}/2{url[-1]}"])
+    with patch.object(ticket_pr_compliance_check, "_ticket_cache", TicketCache(ttl_seconds=300, max_entries=100)):
+        yield provider
+
+
+class TestExtractTickets:
+    def test_tickets_are_fetched_concurrently(self, provider):
+        tickets = asyncio.run(extract_tickets(provider))
+        assert sorted(ticket["ticket_id"] for ticket in tickets) == [1, 2, 3]
+        ticket = next(ticket for ticket in tickets if ticket["ticket_id"] == 1)
+        assert [sub_issue["title"] for sub_issue in ticket["sub_issues"]] == ["issue 11", "issue 21"]
+        assert provider.repo_obj.calls == 9
+        assert 1 < provider.repo_obj.max_in_flight <= get_settings().get("TICKET_CACHE.FETCH_CONCURRENCY")
+
+    def test_tickets_are_cached_until_updated(self, provider):
+        first = asyncio.run(extract_tickets(provider))
+        assert provider.fetch_sub_issues.call_count == 3
+        assert asyncio.run(extract_tickets(provider)) == first
+        assert provider.fetch_sub_issues.call_count == 3  # the sub-issues of the cached tickets are not fetched
+
+        provider.repo_obj.updated_at = "2024-01-02"
+        asyncio.run(extract_tickets(provider))
+        assert provider.fetch_sub_issues.call_count == 6
+
+    def test_tickets_are_shared_by_the_tools_of_a_pr(self, provider):
+        review_vars, describe_vars = {}, {}
+        asyncio.run(extract_and_cache_pr_tickets(provider, review_vars))
+        assert len(review_vars["related_tickets"]) == 9  # 3 tickets, and their sub-issues
+        calls = provider.repo_obj.calls
+
+        asyncio.run(extract_and_cache_pr_tickets(provider, describe_vars))
+        assert describe_vars["related_tickets"] == review_vars["related_tickets"]
+        assert provider.repo_obj.calls == calls
+        assert not get_settings().get("related_tickets", [])  # not shared through the global settings
+
+        provider.user_description = "Fixes #4"
+        asyncio.run(extract_and_cache_pr_tickets(provider, describe_vars))
+        assert [ticket["ticket_id"] for ticket in describe_vars["related_tickets"] if "ticket_id" in ticket] == [4]
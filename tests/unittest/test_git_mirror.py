@@ -0,0 +1,124 @@
+import subprocess
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers import git_mirror
+from pr_agent.git_providers.git_mirror import GitMirror
+from pr_agent.git_providers.github_provider import GithubProvider
+
+
+def git(repo, *args) -> str:
+    return subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@test", *args],
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, files: dict, message: str) -> str:
+    for path, content in files.items():
+        if content is None:
+            git(repo, "rm", "-q", path)
+        else:
+            (repo / path).parent.mkdir(parents=True, exist_ok=True)
+            (repo / path).write_bytes(content) if isinstance(content, bytes) else (repo / path).write_text(content)
+            git(repo, "add", path)
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def source(tmp_path):
+    """A repo with a PR branch ('feature') and a parallel commit on the base branch ('main')."""
+    repo = tmp_path / "source"
+    repo.mkdir()
+    git(repo, "init", "-q", "-b", "main")
+    commit(repo, {"app.py": "a = 1\nb = 2\n", "old_name.py": "x = 1\n" * 5, "removed.py": "gone\n"}, "init")
+    git(repo, "checkout", "-q", "-b", "feature")
+    git(repo, "mv", "old_name.py", "new_name.py")
+    head = commit(repo, {"app.py": "a = 1\nb = 3\n", "added.py": "c = 4\n", "removed.py": None,
+                         "image.png": b"\x89PNG\0\0"}, "feature")
+    git(repo, "checkout", "-q", "main")
+    base = commit(repo, {"other.py": "parallel\n"}, "parallel merge")
+    return SimpleNamespace(path=repo, url=str(repo), base=base, head=head)
+
+
+class TestGitMirror:
+    def test_diff_files(self, source, tmp_path):
+        mirror = GitMirror(str(tmp_path / "mirrors"), "https://github.com/org/repo.git")
+        mirror.fetch(source.url, [source.base, source.head])
+        diff_files = {file.filename: file for file in mirror.get_diff_files(source.base, source.head)}
+
+        # against the merge base - the parallel commit on the base branch is not part of the diff
+        assert set(diff_files) == {"app.py", "added.py", "new_name.py", "removed.py", "image.png"}
+        app = diff_files["app.py"]
+        assert (app.base_file, app.head_file, app.edit_type) == ("a = 1\nb = 2\n", "a = 1\nb = 3\n", EDIT_TYPE.MODIFIED)
+        assert app.patch == "@@ -1,2 +1,2 @@\n a = 1\n-b = 2\n+b = 3"
+        assert (app.num_plus_lines, app.num_minus_lines) == (1, 1)
+        assert (diff_files["added.py"].base_file, diff_files["added.py"].edit_type) == ("", EDIT_TYPE.ADDED)
+        assert (diff_files["removed.py"].head_file, diff_files["removed.py"].edit_type) == ("", EDIT_TYPE.DELETED)
+        renamed = diff_files["new_name.py"]
+        assert (renamed.edit_type, renamed.old_filename, renamed.base_file) == \
+               (EDIT_TYPE.RENAMED, "old_name.py", "x = 1\n" * 5)
+        assert diff_files["image.png"].head_file == "" and diff_files["image.png"].patch == ""
+
+    def test_fetches_incrementally(self, source, tmp_path):
+        mirror = GitMirror(str(tmp_path / "mirrors"), "https://github.com/org/repo.git")
+        mirror.fetch(source.url, [source.base, source.head])
+        with patch.object(mirror, "_git", wraps=mirror._git) as mock_git:
+            mirror.fetch(source.url, [source.base, source.head])  # already in the mirror
+        assert not any("fetch" in call.args for call in mock_git.call_args_list)
+
+        git(source.path, "checkout", "-q", "feature")
+        new_head = commit(source.path, {"app.py": "a = 1\nb = 4\n"}, "update")
+        mirror.fetch(source.url, [source.base, new_head])
+        diff_files = {file.filename: file for file in mirror.get_diff_files(source.base, new_head)}
+        assert diff_files["app.py"].head_file == "a = 1\nb = 4\n"
+
+    def test_falls_back_to_refspecs(self, source, tmp_path):
+        mirror = GitMirror(str(tmp_path / "mirrors"), "https://bitbucket.org/org/repo.git")
+        refspecs = ["+refs/heads/feature:refs/mirror/heads/feature", "+refs/heads/main:refs/mirror/heads/main"]
+        mirror.fetch(source.url, [source.base[:12], source.head[:12]], refspecs)  # abbreviated, as from bitbucket
+        assert len(mirror.get_diff_files(source.base[:12], source.head[:12])) == 5
+
+
+class TestGithubProviderGitMirror:
+    @pytest.fixture
+    def mirror_enabled(self, tmp_path):
+        original = get_settings().get("GIT_MIRROR.ENABLED")
+        get_settings().set("GIT_MIRROR.ENABLED", True)
+        with patch.object(git_mirror, "_git_mirrors", {}), \
+                patch.object(git_mirror, "get_settings", return_value=MagicMock(get=lambda key, default=None:
+                str(tmp_path / "mirrors") if key == "GIT_MIRROR.CACHE_DIR" else default)):
+            yield
+        get_settings().set("GIT_MIRROR.ENABLED", original)
+
+    def test_get_diff_files_from_mirror(self, source, mirror_enabled):
+        with patch.object(GithubProvider, "_get_github_client", return_value=MagicMock()):
+            provider = GithubProvider()
+        provider.repo = "org/repo"
+        provider.pr = MagicMock(number=1)
+        provider.pr.base.sha, provider.pr.head.sha = source.base, source.head
+        with patch.object(provider, "_prepare_clone_url_with_token", return_value=source.url), \
+                patch.object(provider, "get_files") as mock_get_files:
+            diff_files = provider.get_diff_files()
+        mock_get_files.assert_not_called()
+        # filtered by extension, as with the API
+        assert {file.filename for file in diff_files} == {"app.py", "added.py", "new_name.py", "removed.py"}
+
+    def test_falls_back_to_the_api(self, mirror_enabled):
+        with patch.object(GithubProvider, "_get_github_client", return_value=MagicMock()):
+            provider = GithubProvider()
+        with patch.object(provider, "_prepare_clone_url_with_token", return_value="/does/not/exist"):
+            assert provider._get_diff_files_from_mirror("https://github.com/org/repo.git", "a" * 40, "b" * 40) is None
+
+    def test_diff_between_commits_of_the_pr(self, source, tmp_path):
+        mirror = GitMirror(str(tmp_path / "mirrors"), "https://github.com/org/repo.git")
+        git(source.path, "checkout", "-q", "feature")
+        new_head = commit(source.path, {"app.py": "a = 1\nb = 4\n"}, "update")
+        mirror.fetch(source.url, [source.head, new_head])
+        assert mirror.is_ancestor(source.head, new_head) and not mirror.is_ancestor(new_head, source.head)
+        diff_files = mirror.get_diff_files(source.head, new_head, against_merge_base=False)
+        assert [(file.filename, file.base_file, file.patch) for file in diff_files] == \
+               [("app.py", "a = 1\nb = 3\n", "@@ -1,2 +1,2 @@\n a = 1\n-b = 3\n+b = 4")]
@@ -0,0 +1,109 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_provider import MAX_FILES_ALLOWED_FULL
+from pr_agent.git_providers.github_provider import GithubProvider
+
+FETCH_LATENCY_SEC = 0.02
+HEAD_SHA = "head_sha"
+MERGE_BASE_SHA = "merge_base_sha"
+
+
+def make_file(index: int):
+    file = MagicMock()
+    file.filename = f"src/module_{index}.py"
+    file.patch = f"@@ -1,1 +1,1 @@\n-old_{index}\n+new_{index}"
+    file.status = "modified"
+    file.additions = 1
+    file.deletions = 1
+    return file
+
+
+class RecordedRepo:
+    """A mocked PyGithub repository, answering 'get_contents' with a fixed network latency."""
+
+    full_name = "owner/repo"
+
+    def __init__(self):
+        self.calls = []
+
+    def get_contents(self, path, ref):
+        self.calls.append((path, ref))
+        time.sleep(FETCH_LATENCY_SEC)
+        return SimpleNamespace(decoded_content=f"{path}@{ref}".encode())
+
+    def compare(self, base, head):
+        compare = MagicMock()
+        compare.merge_base_commit.sha = MERGE_BASE_SHA
+        return compare
+
+
+class TestGithubConcurrentFetch:
+    @pytest.fixture
+    def provider(self):
+        with patch.object(GithubProvider, "_get_github_client", return_value=MagicMock()):
+            provider = GithubProvider()
+        provider.repo = "owner/repo"
+        provider.repo_obj = RecordedRepo()
+        provider.pr = MagicMock()
+        provider.pr.base.sha = "base_sha"
+        provider.pr.head.sha = HEAD_SHA
+        return provider
+
+    @pytest.fixture
+    def concurrency(self):
+        original = get_settings().get("GITHUB.FILE_FETCH_CONCURRENCY")
+
+        def set_concurrency(value):
+            get_settings().set("GITHUB.FILE_FETCH_CONCURRENCY", value)
+
+        yield set_concurrency
+        get_settings().set("GITHUB.FILE_FETCH_CONCURRENCY", original)
+
+    def run_get_diff_files(self, provider, num_files):
+        provider.diff_files = None
+        provider.repo_obj.calls = []
+        provider.git_files = [make_file(i) for i in range(num_files)]
+        with patch.object(provider, "get_files", return_value=provider.git_files):
+            start = time.perf_counter()
+            diff_files = provider.get_diff_files()
+            return diff_files, time.perf_counter() - start
+
+    def test_same_result_and_order(self, provider, concurrency):
+        concurrency(1)
+        sequential_files, _ = self.run_get_diff_files(provider, 10)
+        concurrency(8)
+        concurrent_files, _ = self.run_get_diff_files(provider, 10)
+
+        assert [f.filename for f in concurrent_files] == [f"src/module_{i}.py" for i in range(10)]
+        assert concurrent_files == sequential_files
+        for file in concurrent_files:
+            assert file.head_file == f"{file.filename}@{HEAD_SHA}"
+            assert file.base_file == f"{file.filename}@{MERGE_BASE_SHA}"
+
+    def test_max_files_allowed_full(self, provider, concurrency):
+        concurrency(8)
+        num_files = MAX_FILES_ALLOWED_FULL + 5
+        diff_files, _ = self.run_get_diff_files(provider, num_files)
+
+        assert len(diff_files) == num_files
+        num_loaded = MAX_FILES_ALLOWED_FULL - 1
+        assert all(f.head_file and f.base_file for f in diff_files[:num_loaded])
+        assert all(not f.head_file and not f.base_file for f in diff_files[num_loaded:])
+        assert len(provider.repo_obj.calls) == 2 * num_loaded
+
+    def test_benchmark_wall_clock(self, provider, concurrency):
+        num_files = 30
+        concurrency(1)
+        _, sequential_time = self.run_get_diff_files(provider, num_files)
+        concurrency(8)
+        _, concurrent_time = self.run_get_diff_files(provider, num_files)
+
+        print(f"\nget_diff_files for {num_files} files ({2 * num_files} fetches, {FETCH_LATENCY_SEC}s each): "
+              f"sequential={sequential_time:.2f}s, concurrent={concurrent_time:.2f}s")
+        assert sequential_time >= 2 * num_files * FETCH_LATENCY_SEC
+        assert concurrent_time < sequential_time / 3
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.git_providers import blob_cache
+from pr_agent.git_providers.blob_cache import BlobCache
+from pr_agent.git_providers.github_graphql import GithubGraphQLClient, GithubGraphQLError, get_graphql_url
+from pr_agent.git_providers.github_provider import GithubProvider
+
+HEAD_SHA = "a" * 40
+BASE_SHA = "b" * 40
+
+
+def graphql_response(data=None, errors=None):
+    response = MagicMock(headers={})
+    response.json.return_value = {"data": data, "errors": errors} if errors else {"data": data}
+    return response
+
+
+@pytest.fixture
+def client():
+    client = GithubGraphQLClient("https://api.github.com", lambda: "token")
+    client.session = MagicMock()
+    return client
+
+
+class TestGithubGraphQLClient:
+    def test_graphql_url(self):
+        assert get_graphql_url("https://api.github.com") == "https://api.github.com/graphql"
+        assert get_graphql_url("https://github.example.com/api/v3/") == "https://github.example.com/api/graphql"
+
+    def test_blob_texts_in_batches(self, client):
+        client.session.post.side_effect = [
+            graphql_response({"repository": {"b0": {"text": "head", "isBinary": False, "isTruncated": False},
+                                             "b1": None}}),
+            graphql_response({"repository": {"b0": {"text": None, "isBinary": True, "isTruncated": False},
+                                             "b1": {"text": "", "isBinary": False, "isTruncated": True}}}),
+        ]
+        blobs = [(HEAD_SHA, "a.py"), (BASE_SHA, "a.py"), (HEAD_SHA, "image.png"), (HEAD_SHA, "large.py")]
+        assert client.get_blob_texts("org/repo", blobs, batch_size=2) == ["head", "", "", None]
+
+        assert client.session.post.call_count == 2
+        first_query = client.session.post.call_args_list[0].kwargs["json"]
+        assert first_query["variables"] == {"owner": "org", "name": "repo", "e0": f"{HEAD_SHA}:a.py",
+                                            "e1": f"{BASE_SHA}:a.py"}
+        assert "b1: object(expression: $e1)" in first_query["query"]
+        assert client.session.post.call_args_list[0].kwargs["headers"]["Authorization"] == "bearer token"
+
+    def test_blob_sha(self, client):
+        client.session.post.side_effect = [graphql_response({"repository": {"object": {"oid": HEAD_SHA}}}),
+                                           graphql_response({"repository": {"object": None}})]
+        assert client.get_blob_sha("org/repo", "HEAD:.pr_agent.toml") == HEAD_SHA
+        assert client.get_blob_sha("org/repo", "HEAD:.pr_agent.toml") == ""
+        assert client.session.post.call_args.kwargs["json"]["variables"]["expression"] == "HEAD:.pr_agent.toml"
+
+    def test_errors(self, client):
+        client.session.post.return_value = graphql_response(errors=[{"message": "Bad credentials"}])
+        with pytest.raises(GithubGraphQLError):
+            client.get_blob_texts("org/repo", [(HEAD_SHA, "a.py")])
+
+
+class TestGithubProviderGraphQL:
+    @pytest.fixture
+    def provider(self):
+        with patch.object(GithubProvider, "_get_github_client", return_value=MagicMock()):
+            provider = GithubProvider()
+        provider.repo = "org/repo"
+        provider.repo_obj = MagicMock(full_name="org/repo")
+        provider.repo_obj.get_contents.side_effect = \
+            lambda path, ref: SimpleNamespace(decoded_content=f"rest {path}@{ref}".encode())
+        provider.graphql_client = MagicMock()
+        with patch.object(blob_cache, "_blob_cache", BlobCache(max_memory_bytes=1024 * 1024)):
+            yield provider
+
+    def test_files_content_in_one_query_through_the_cache(self, provider):
+        file_a, file_b = SimpleNamespace(filename="a.py"), SimpleNamespace(filename="b.py")
+        fetch_requests = [(file_a, HEAD_SHA), (file_a, BASE_SHA), (file_b, HEAD_SHA), (file_b, BASE_SHA)]
+        provider.graphql_client.get_blob_texts.return_value = ["a head", "a base", None, ""]
+
+        contents = provider._get_pr_files_content(fetch_requests)
+        # truncated blobs are fetched with the REST API
+        assert contents == ["a head", "a base", f"rest b.py@{HEAD_SHA}", ""]
+        assert provider.graphql_client.get_blob_texts.call_count == 1
+        assert provider.repo_obj.get_contents.call_count == 1
+
+        # the fetched contents are cached
+        provider.graphql_client.get_blob_texts.return_value = [""]
+        assert provider._get_pr_files_content(fetch_requests) == contents
+        assert provider.graphql_client.get_blob_texts.call_args.args[1] == [(BASE_SHA, "b.py")]
+        assert provider.repo_obj.get_contents.call_count == 1
+
+    def test_falls_back_to_rest(self, provider):
+        provider.graphql_client.get_blob_texts.side_effect = GithubGraphQLError("Bad credentials")
+        file_c = SimpleNamespace(filename="c.py")
+        assert provider._get_pr_files_content([(file_c, HEAD_SHA)]) == [f"rest c.py@{HEAD_SHA}"]
@@ -0,0 +1,92 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+import urllib3
+
+from pr_agent.git_providers import http_session
+from pr_agent.git_providers.http_session import create_pooled_session, get_shared_pool_manager
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        server.client_ports.add(self.client_address[1])
+        server.num_requests += 1
+        status = server.statuses.pop(0) if server.statuses else 200
+        body = b"ok" if status == 200 else b"error"
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.client_ports = set()
+    server.num_requests = 0
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    with patch.object(http_session, "_shared_adapter", None), patch.object(http_session, "_shared_pool_managers", {}), \
+            patch("pr_agent.git_providers.http_session.Retry.DEFAULT_BACKOFF_MAX", 0):
+        yield
+
+
+class TestHttpSession:
+    def test_sessions_share_connections(self, server):
+        url = f"http://127.0.0.1:{server.server_address[1]}/file"
+        for _ in range(10):
+            # a new provider instance (and session) per request, as in the server
+            session = create_pooled_session()
+            session.headers["Authorization"] = "Bearer token"
+            assert session.get(url).text == "ok"
+        assert server.num_requests == 10
+        assert len(server.client_ports) == 1
+
+    def test_session_headers_are_not_shared(self):
+        first = create_pooled_session()
+        first.headers["Authorization"] = "Bearer first"
+        second = create_pooled_session()
+        assert "Authorization" not in second.headers
+        assert first.get_adapter("https://api.bitbucket.org") is second.get_adapter("https://api.bitbucket.org")
+
+    def test_retry_on_transient_errors(self, server):
+        server.statuses = [503, 429]
+        url = f"http://127.0.0.1:{server.server_address[1]}/file"
+        response = create_pooled_session().get(url)
+        assert response.status_code == 200
+        assert server.num_requests == 3
+
+    def test_shared_pool_manager(self, server):
+        pool_manager = get_shared_pool_manager()
+        assert get_shared_pool_manager() is pool_manager
+        assert get_shared_pool_manager(verify_ssl=False) is not pool_manager
+        assert get_shared_pool_manager(maxsize=5) is not pool_manager
+        proxy_manager = get_shared_pool_manager(proxy="http://proxy:3128", cert_file="client.pem",
+                                                key_file="client.key")
+        assert isinstance(proxy_manager, urllib3.ProxyManager)
+        assert proxy_manager.connection_pool_kw["cert_file"] == "client.pem"
+
+        server.statuses = [502]
+        url = f"http://127.0.0.1:{server.server_address[1]}/file"
+        for _ in range(3):
+            assert pool_manager.request("GET", url).status == 200
+        assert server.num_requests == 4
+        assert len(server.client_ports) == 1
@@ -0,0 +1,177 @@
+from unittest.mock import MagicMock, patch
+
+import litellm  # noqa: F401
+import pytest
+from tiktoken import get_encoding
+
+from pr_agent.algo.git_patch_processing import split_patch_to_hunks
+from pr_agent.algo.pr_processing import (
+    generate_full_patch,
+    get_pr_multi_diffs,
+    pack_patch_hunks,
+    pr_generate_compressed_diff,
+    score_hunk,
+)
+from pr_agent.algo.token_handler import TokenHandler
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+
+
+def get_encoder(name: str):
+    # litellm points TIKTOKEN_CACHE_DIR to the encodings it bundles when imported; without them tiktoken downloads
+    try:
+        return get_encoding(name)
+    except Exception as e:
+        pytest.skip(f"The {name} encoding is unavailable: {e}")
+
+
+def make_hunk(start: int, num_changed: int, num_context: int = 2, section_header: str = "") -> str:
+    lines = [f"@@ -{start},{num_context} +{start},{num_context + num_changed} @@ {section_header}".rstrip()]
+    lines += [f" context_{start}_{i}" for i in range(num_context)]
+    lines += [f"+added_line_{start}_{i} = compute({i})" for i in range(num_changed)]
+    return "\n".join(lines)
+
+
+def make_patch(hunk_sizes) -> str:
+    return "\n".join(make_hunk(100 * i + 1, size) for i, size in enumerate(hunk_sizes))
+
+
+@pytest.fixture
+def token_handler():
+    token_handler = TokenHandler()
+    token_handler.encoder = get_encoder("o200k_base")
+    token_handler.prompt_tokens = 100
+    return token_handler
+
+
+@pytest.fixture
+def packing_policy():
+    original = get_settings().get("CONFIG.PATCH_PACKING_POLICY")
+    yield lambda value: get_settings().set("CONFIG.PATCH_PACKING_POLICY", value)
+    get_settings().set("CONFIG.PATCH_PACKING_POLICY", original)
+
+
+class TestHunkPacking:
+    def test_split_patch_to_hunks(self):
+        patch_str = "\n\n## File: 'a.py'\n\n" + make_patch([1, 2, 3])
+        header, hunks = split_patch_to_hunks(patch_str)
+        assert header == "\n\n## File: 'a.py'\n"
+        assert len(hunks) == 3
+        assert all(hunk.startswith("@@ ") for hunk in hunks)
+        assert "\n".join([header] + hunks) == patch_str
+
+        header, hunks = split_patch_to_hunks(make_patch([1, 2]))
+        assert header == ""
+        assert "\n".join(hunks) == make_patch([1, 2])
+
+    def test_score_hunk(self):
+        assert score_hunk(make_hunk(1, 4)) == 4
+        assert score_hunk(make_hunk(1, 4), language_rank=1) == 2
+        assert score_hunk(make_hunk(1, 4, section_header="def foo():")) > score_hunk(make_hunk(1, 4))
+        assert score_hunk(make_hunk(1, 0)) == 0
+        # lines of a patch converted to hunks with line numbers
+        assert score_hunk("@@ -1,2 +1,3 @@\n__new hunk__\n1  a\n2 +b\n3  c\n__old hunk__\n a\n-d\n c") == 2
+
+    def test_pack_within_budget(self, token_handler):
+        patch_str = make_patch([30, 2, 10, 2, 30, 5])
+        total_tokens = token_handler.count_tokens(patch_str)
+        for max_tokens in [50, 200, total_tokens // 2, total_tokens - 1]:
+            packed, packed_tokens, rest = pack_patch_hunks(patch_str, token_handler, max_tokens)
+            assert packed
+            assert packed_tokens == token_handler.count_tokens(packed) <= max_tokens
+            # every hunk is either packed, or left for the next call, in the original order
+            _, packed_hunks = split_patch_to_hunks(packed)
+            _, rest_hunks = split_patch_to_hunks(rest)
+            _, all_hunks = split_patch_to_hunks(patch_str)
+            assert sorted(packed_hunks + rest_hunks, key=all_hunks.index) == all_hunks
+            assert packed_hunks == sorted(packed_hunks, key=all_hunks.index)
+
+        packed, packed_tokens, rest = pack_patch_hunks(patch_str, token_handler, total_tokens)
+        assert packed == patch_str and rest == ""
+        assert pack_patch_hunks(patch_str, token_handler, 5) == ("", 0, patch_str)
+
+    def test_full_patch_packs_hunks(self, token_handler, packing_policy):
+        small_patch = make_patch([20])
+        large_patch = make_patch([40] * 20)
+        file_dict = {
+            "small.py": {"patch": small_patch, "tokens": token_handler.count_tokens(small_patch),
+                         "edit_type": EDIT_TYPE.MODIFIED, "language_rank": 0},
+            "large.py": {"patch": large_patch, "tokens": token_handler.count_tokens(large_patch),
+                         "edit_type": EDIT_TYPE.MODIFIED, "language_rank": 0},
+        }
+        max_tokens_model = 1500 + token_handler.prompt_tokens + file_dict["large.py"]["tokens"] // 2
+
+        packing_policy("file")
+        total_tokens, patches, remaining, files_in_patch = generate_full_patch(
+            False, dict(file_dict), max_tokens_model, list(file_dict), token_handler)
+        assert files_in_patch == ["small.py"]
+        assert remaining == ["large.py"]
+
+        packing_policy("hunks")
+        pending_file_dict = dict(file_dict)
+        packed_total_tokens, packed_patches, remaining, files_in_patch = generate_full_patch(
+            False, pending_file_dict, max_tokens_model, list(file_dict), token_handler)
+        assert files_in_patch == ["small.py", "large.py"]
+        assert remaining == ["large.py"]
+        assert packed_total_tokens > total_tokens
+        assert packed_total_tokens == token_handler.prompt_tokens + sum(map(token_handler.count_tokens, packed_patches))
+        assert packed_total_tokens <= max_tokens_model - 1500
+        # the hunks which were left out are carried to the next iteration
+        assert pending_file_dict["large.py"]["patch"] != large_patch
+        assert file_dict["large.py"]["patch"] == large_patch
+
+    def test_compressed_diff_reports_partly_packed_files(self, token_handler, packing_policy):
+        packing_policy("hunks")
+        files = [FilePatchInfo("", "", make_patch([40] * 20), "large.py", tokens=1, edit_type=EDIT_TYPE.MODIFIED)]
+        patch_tokens = token_handler.count_tokens(files[0].patch)
+
+        def run(max_tokens, large_pr_handling):
+            with patch("pr_agent.algo.pr_processing.get_max_tokens", return_value=max_tokens):
+                return pr_generate_compressed_diff([{'language': 'Python', 'files': files}], token_handler, "model",
+                                                   False, large_pr_handling=large_pr_handling)
+
+        # a single patch: the hunks which were left out are reported
+        patches_list, _, _, remaining_files_list, _, files_in_patches_list = run(
+            1500 + token_handler.prompt_tokens + patch_tokens // 3, large_pr_handling=False)
+        assert len(patches_list) == 1
+        assert files_in_patches_list == [["large.py"]]
+        assert remaining_files_list == ["large.py"]
+
+        # several patches, which cover all the hunks
+        patches_list, _, _, remaining_files_list, _, files_in_patches_list = run(
+            1500 + token_handler.prompt_tokens + patch_tokens * 2 // 3, large_pr_handling=True)
+        assert len(patches_list) > 1
+        assert all(files_in_patch == ["large.py"] for files_in_patch in files_in_patches_list)
+        assert remaining_files_list == []
+
+    def test_hunks_without_changes_are_packed_last(self, token_handler):
+        patch_str = make_patch([0, 10, 0])
+        _, hunks = split_patch_to_hunks(patch_str)
+        max_tokens = token_handler.count_tokens(hunks[1] + "\n") + 2
+        packed, _, rest = pack_patch_hunks(patch_str, token_handler, max_tokens)
+        assert packed == hunks[1]
+        assert rest == "\n".join([hunks[0], hunks[2]])
+
+    def test_multi_diffs_need_fewer_calls(self, token_handler, packing_policy):
+        files = [FilePatchInfo("", "", make_patch([25] * 6), f"src/file_{i}.py", tokens=i,
+                               edit_type=EDIT_TYPE.MODIFIED) for i in range(8)]
+        git_provider = MagicMock()
+        git_provider.get_diff_files.return_value = files
+        git_provider.get_languages.return_value = {}
+        patch_tokens = token_handler.count_tokens(files[0].patch)
+        max_tokens = 1500 + token_handler.prompt_tokens + int(patch_tokens * 1.5)
+
+        def run():
+            with patch("pr_agent.algo.pr_processing.get_max_tokens", return_value=max_tokens):
+                return get_pr_multi_diffs(git_provider, token_handler, "model", max_calls=20, add_line_numbers=False)
+
+        packing_policy("file")
+        file_diffs = run()
+        packing_policy("hunks")
+        hunk_diffs = run()
+
+        assert len(hunk_diffs) < len(file_diffs)
+        for diff in hunk_diffs:
+            assert token_handler.prompt_tokens + token_handler.count_tokens(diff) <= max_tokens - 1500
+        # all the hunks are still covered
+        assert sum(diff.count("\n@@ ") + diff.startswith("@@ ") for diff in hunk_diffs) == 6 * len(files)
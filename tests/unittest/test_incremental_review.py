@@ -0,0 +1,136 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from jinja2 import Environment, StrictUndefined
+
+from pr_agent.algo import incremental_review
+from pr_agent.algo.incremental_review import ReviewState, ReviewStateStore, format_review_findings, get_interdiff_files
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.tools.pr_reviewer import PRReviewer
+
+PR_URL = "https://github.com/org/repo/pull/1"
+FINDING = {"relevant_file": "app.py", "issue_header": "Possible Bug", "issue_content": "b is never reset",
+           "start_line": 2, "end_line": 2}
+
+
+class TestReviewStateStore:
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_state_per_pr_and_command(self, backend, tmp_path):
+        store = ReviewStateStore(str(tmp_path / "states.db") if backend == "sqlite" else "", max_entries=2)
+        assert store.get(PR_URL, "review") is None
+        store.set(PR_URL, "review", ReviewState("a" * 40, [FINDING]))
+        state = store.get(PR_URL, "review")
+        assert (state.head_sha, state.findings) == ("a" * 40, [FINDING])
+        assert store.get(PR_URL, "improve") is None
+
+        store.set(PR_URL, "review", ReviewState("b" * 40, []))
+        assert store.get(PR_URL, "review").head_sha == "b" * 40
+        store.set(f"{PR_URL}2", "review", ReviewState("c" * 40))
+        store.set(f"{PR_URL}3", "review", ReviewState("d" * 40, updated_at=state.updated_at + 1000))
+        assert store.get(PR_URL, "review") is None  # evicted
+        store.clear()
+        assert store.get(f"{PR_URL}3", "review") is None
+
+
+class TestInterdiff:
+    def test_restricted_to_the_pr_files(self):
+        git_provider = MagicMock()
+        git_provider.diff_files = None
+        git_provider.get_files.return_value = ["app.py"]
+        git_provider.get_pr_file_content.return_value = "a = 1\nb = 4\n"
+        git_provider.get_diff_files_between.return_value = [
+            FilePatchInfo("a = 1\nb = 3\n", "", "@@ -2 +2 @@\n-b = 3\n+b = 4", "app.py", edit_type=EDIT_TYPE.MODIFIED),
+            FilePatchInfo("", "", "@@ -1 +1 @@\n-x\n+y", "merged_from_base.py", edit_type=EDIT_TYPE.MODIFIED)]
+
+        diff_files = get_interdiff_files(git_provider, "a" * 40, "b" * 40)
+        git_provider.get_diff_files_between.assert_called_once_with("a" * 40, "b" * 40)
+        assert [file.filename for file in diff_files] == ["app.py"]
+        file = diff_files[0]
+        assert (file.base_file, file.head_file, file.patch) == ("a = 1\nb = 3\n", "a = 1\nb = 4\n",
+                                                                "@@ -2 +2 @@\n-b = 3\n+b = 4")
+        assert (file.num_plus_lines, file.num_minus_lines) == (1, 1)
+        # only the head contents of the inter-diff files are fetched, not the full PR diff files
+        git_provider.get_diff_files.assert_not_called()
+        git_provider.get_pr_file_content.assert_called_once_with("app.py", "b" * 40)
+
+    def test_reuses_the_loaded_pr_diff_files(self):
+        git_provider = MagicMock()
+        git_provider.get_files.return_value = [MagicMock(filename="app.py")]
+        git_provider.diff_files = [FilePatchInfo("a = 1\n", "a = 2\n", "@@ -1 +1 @@\n-a = 1\n+a = 2", "app.py",
+                                                 language="Python")]
+        git_provider.get_diff_files_between.return_value = [
+            FilePatchInfo("a = 1\n", "a = 2\n", "@@ -1 +1 @@\n-a = 1\n+a = 2", "app.py")]
+        diff_files = get_interdiff_files(git_provider, "a" * 40, "b" * 40)
+        assert (diff_files[0].head_file, diff_files[0].language) == ("a = 2\n", "Python")
+        git_provider.get_pr_file_content.assert_not_called()
+
+    def test_not_available(self):
+        git_provider = MagicMock()
+        git_provider.get_diff_files_between.return_value = None
+        assert get_interdiff_files(git_provider, "a" * 40, "b" * 40) is None
+        git_provider.get_diff_files_between.side_effect = Exception("force pushed")
+        assert get_interdiff_files(git_provider, "a" * 40, "b" * 40) is None
+
+
+class TestPRReviewerIncrementalEngine:
+    @pytest.fixture
+    def reviewer(self):
+        original = get_settings().pr_reviewer.get("enable_incremental_review_engine", False)
+        get_settings().set("pr_reviewer.enable_incremental_review_engine", True)
+        git_provider = MagicMock()
+        git_provider.get_pr_head_sha.return_value = "b" * 40
+        git_provider.diff_files = None
+        git_provider.get_files.return_value = ["app.py"]
+        git_provider.get_pr_file_content.return_value = "b = 4\n"
+        git_provider.get_diff_files_between.return_value = [FilePatchInfo("", "", "@@ -1 +1 @@\n-b = 3\n+b = 4",
+                                                                          "app.py")]
+        with patch("pr_agent.tools.pr_reviewer.get_git_provider_with_context", return_value=git_provider), \
+                patch.object(incremental_review, "_review_state_store", ReviewStateStore()):
+            yield PRReviewer(PR_URL, args=["-i"], ai_handler=MagicMock)
+        get_settings().set("pr_reviewer.enable_incremental_review_engine", original)
+
+    def test_full_review_without_a_previous_state(self, reviewer):
+        reviewer._prepare_incremental_diff_files()
+        assert not reviewer.incremental.is_incremental
+        assert reviewer.incremental.diff_files is None  # get_pr_diff uses all the PR diff files
+
+    def test_changes_since_the_last_review(self, reviewer):
+        reviewer._save_review_state({"review": {"key_issues_to_review": [FINDING]}})
+        reviewer.git_provider.get_pr_head_sha.return_value = "c" * 40
+        reviewer._prepare_incremental_diff_files()
+        reviewer.git_provider.get_diff_files_between.assert_called_once_with("b" * 40, "c" * 40)
+        assert reviewer.incremental.is_incremental
+        assert [file.patch for file in reviewer.incremental.diff_files] == ["@@ -1 +1 @@\n-b = 3\n+b = 4"]
+        assert reviewer.incremental.previous_findings == [FINDING]
+
+        # the previous findings are kept for the next incremental review, after the new ones
+        new_finding = dict(FINDING, issue_header="Performance")
+        reviewer._save_review_state({"review": {"key_issues_to_review": [new_finding]}})
+        state = incremental_review.get_review_state_store().get(PR_URL, "review")
+        assert (state.head_sha, state.findings) == ("c" * 40, [new_finding, FINDING])
+
+    def test_no_new_commits(self, reviewer):
+        reviewer._save_review_state({"review": {}})
+        reviewer._prepare_incremental_diff_files()
+        reviewer.git_provider.get_diff_files_between.assert_not_called()
+        assert reviewer.incremental.diff_files == []
+
+    def test_rewritten_history(self, reviewer):
+        reviewer._save_review_state({"review": {}})
+        reviewer.git_provider.get_pr_head_sha.return_value = "c" * 40
+        reviewer.git_provider.get_diff_files_between.return_value = None
+        reviewer._prepare_incremental_diff_files()
+        assert not reviewer.incremental.is_incremental
+
+    def test_previous_findings_in_the_prompt(self):
+        variables = {"related_tickets": [], "date": "", "title": "", "branch": "", "description": "",
+                     "question_str": "", "diff": "", "duplicate_prompt_examples": False,
+                     "previous_review_findings": format_review_findings([FINDING])}
+        user_prompt = Environment(undefined=StrictUndefined).from_string(
+            get_settings().pr_review_prompt.user).render(variables)
+        assert "- app.py 2-2: Possible Bug\n  b is never reset" in user_prompt
+        assert "incremental review" in user_prompt
+        variables["previous_review_findings"] = ""
+        assert "incremental review" not in Environment(undefined=StrictUndefined).from_string(
+            get_settings().pr_review_prompt.user).render(variables)
@@ -0,0 +1,108 @@
+import asyncio
+
+from pr_agent.servers.github_app import get_job_key
+from pr_agent.servers.job_scheduler import JobScheduler, JobStatus
+
+
+class Recorder:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.done = []
+        self.release = asyncio.Event()
+
+    def job(self, name):
+        async def run():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await self.release.wait()
+            self.running -= 1
+            self.done.append(name)
+        return run
+
+
+class TestJobScheduler:
+    def test_concurrency_limits(self):
+        async def run():
+            recorder = Recorder()
+            scheduler = JobScheduler(max_concurrent_jobs=3, max_concurrent_jobs_per_tenant=2, max_queued_jobs=100)
+            for i in range(5):
+                scheduler.submit(recorder.job(f"a{i}"), tenant="a")
+            await asyncio.sleep(0.01)
+            assert recorder.running == 2  # the tenant limit
+            scheduler.submit(recorder.job("b0"), tenant="b")
+            scheduler.submit(recorder.job("b1"), tenant="b")
+            await asyncio.sleep(0.01)
+            assert recorder.running == 3  # the global limit
+            assert scheduler.stats()["queued_jobs"] == 4
+            recorder.release.set()
+            await scheduler.join()
+            assert sorted(recorder.done) == ["a0", "a1", "a2", "a3", "a4", "b0", "b1"]
+            assert recorder.max_running == 3
+            stats = scheduler.stats()
+            assert stats["queued_jobs"] == stats["running_jobs"] == stats["active_tenants"] == 0
+            assert stats["max_wait_time_sec"] > 0
+
+        asyncio.run(run())
+
+    def test_bounded_queue(self):
+        async def run():
+            recorder = Recorder()
+            scheduler = JobScheduler(max_concurrent_jobs=1, max_concurrent_jobs_per_tenant=1, max_queued_jobs=2)
+            assert scheduler.submit(recorder.job(0)) is JobStatus.SCHEDULED
+            await asyncio.sleep(0)  # the first job starts running
+            assert scheduler.submit(recorder.job(1)) is JobStatus.SCHEDULED
+            assert scheduler.submit(recorder.job(2)) is JobStatus.SCHEDULED
+            assert scheduler.submit(recorder.job(3)) is JobStatus.REJECTED
+            recorder.release.set()
+            await scheduler.join()
+            assert recorder.done == [0, 1, 2]
+            assert scheduler.stats()["rejected_jobs"] == 1
+
+        asyncio.run(run())
+
+    def test_coalesce_queued_jobs(self):
+        async def run():
+            recorder = Recorder()
+            scheduler = JobScheduler(max_concurrent_jobs=1, max_concurrent_jobs_per_tenant=1, max_queued_jobs=1)
+            scheduler.submit(recorder.job("push1"), tenant="a", key=("pr1", "synchronize"))
+            await asyncio.sleep(0)  # running jobs are not replaced
+            scheduler.submit(recorder.job("push2"), tenant="a", key=("pr1", "synchronize"))
+            # the queue is full, but the new job replaces the queued one
+            assert scheduler.submit(recorder.job("push3"), tenant="a",
+                                    key=("pr1", "synchronize")) is JobStatus.COALESCED
+            assert scheduler.submit(recorder.job("other"), tenant="b",
+                                    key=("pr1", "synchronize")) is JobStatus.REJECTED
+            recorder.release.set()
+            await scheduler.join()
+            assert recorder.done == ["push1", "push3"]
+            assert scheduler.stats()["coalesced_jobs"] == 1
+            assert scheduler.stats()["active_tenants"] == 0
+
+        asyncio.run(run())
+
+    def test_failed_job_releases_its_slot(self):
+        async def run():
+            scheduler = JobScheduler(max_concurrent_jobs=1, max_concurrent_jobs_per_tenant=1, max_queued_jobs=10)
+            done = []
+
+            async def failing():
+                raise ValueError("failed")
+
+            async def succeeding():
+                done.append(True)
+
+            scheduler.submit(failing)
+            scheduler.submit(succeeding)
+            await scheduler.join()
+            assert done == [True]
+
+        asyncio.run(run())
+
+    def test_github_job_key(self):
+        pr_url = "https://api.github.com/repos/org/repo/pulls/1"
+        assert get_job_key({"action": "synchronize", "pull_request": {"url": pr_url}}, "pull_request") == \
+               (pr_url, "synchronize")
+        assert get_job_key({"action": "created", "issue": {"pull_request": {"url": pr_url}},
+                            "comment": {"body": "/review"}}, "issue_comment") == (pr_url, "/review")
+        assert get_job_key({"action": "created", "check_run": {}}, "check_run") is None
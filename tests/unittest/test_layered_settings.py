@@ -0,0 +1,75 @@
+import copy
+from unittest.mock import MagicMock, patch
+
+from starlette_context import request_cycle_context
+
+from pr_agent.algo.utils import update_settings_from_args
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
+from pr_agent.git_providers.utils import apply_repo_settings
+
+
+class TestLayeredSettings:
+    def test_reads_fall_through_to_the_base(self):
+        settings = LayeredSettings(global_settings)
+        assert settings.config.model == global_settings.config.model
+        assert settings.get("CONFIG.MODEL") == settings.get("config.model") == global_settings.config.model
+        assert settings["PR_HELP_DOCS.DOCS_PATH"] == global_settings.pr_help_docs.docs_path
+        assert settings.get("NO_SUCH_SECTION.KEY", "default") == "default"
+        assert settings.find_file("configuration.toml") == global_settings.find_file("configuration.toml")
+
+    def test_writes_do_not_modify_the_base(self):
+        base_num_max_findings = global_settings.pr_reviewer.num_max_findings
+        base_bad_extensions = list(global_settings.bad_extensions.default)
+        settings = LayeredSettings(global_settings)
+
+        settings.pr_reviewer.num_max_findings = base_num_max_findings + 1
+        settings.set("pr_description.extra_instructions", "be brief")
+        settings.set("ask_diff_hunk", "@@ -1 +1 @@")
+        settings.bad_extensions.default += ["new"]
+        settings.set("new_section.nested.key", 1)
+
+        assert settings.get("pr_reviewer.num_max_findings") == base_num_max_findings + 1
+        assert settings.pr_description.extra_instructions == "be brief"
+        assert settings.get("ask_diff_hunk") == "@@ -1 +1 @@"
+        assert settings.new_section.nested.key == 1
+        assert global_settings.pr_reviewer.num_max_findings == base_num_max_findings
+        assert global_settings.pr_description.extra_instructions != "be brief"
+        assert global_settings.get("ask_diff_hunk") is None
+        assert global_settings.bad_extensions.default == base_bad_extensions
+        assert "NEW_SECTION" not in global_settings
+
+        # every request starts from the base settings
+        assert LayeredSettings(global_settings).pr_reviewer.num_max_findings == base_num_max_findings
+
+    def test_set_and_unset_sections(self):
+        settings = LayeredSettings(global_settings)
+        settings.set("pr_reviewer", {"extra_instructions": "merged"})
+        assert settings.pr_reviewer.extra_instructions == "merged"
+        assert settings.pr_reviewer.num_max_findings == global_settings.pr_reviewer.num_max_findings
+
+        settings.set("pr_reviewer", {"extra_instructions": "replaced"}, merge=False)
+        assert settings.get("pr_reviewer.num_max_findings") is None
+
+        settings.unset("pr_questions")
+        assert settings.get("pr_questions") is None
+        assert not hasattr(settings, "pr_questions")
+        assert "PR_QUESTIONS" not in settings.keys()
+        assert "PR_QUESTIONS" not in settings.to_dict()
+        assert copy.deepcopy(settings).get("pr_questions.enable_help_text") is None
+        assert settings.to_dict()["PR_REVIEWER"] == {"extra_instructions": "replaced"}
+
+    def test_request_settings(self):
+        with request_cycle_context({"settings": LayeredSettings(global_settings)}):
+            update_settings_from_args(["--pr_code_suggestions.num_code_suggestions_per_chunk=7"])
+            assert get_settings().pr_code_suggestions.num_code_suggestions_per_chunk == 7
+
+            git_provider = MagicMock()
+            git_provider.get_repo_settings.return_value = b"[pr_reviewer]\nextra_instructions = 'from repo'\n"
+            with patch("pr_agent.git_providers.utils.get_git_provider_with_context", return_value=git_provider):
+                apply_repo_settings("https://github.com/org/repo/pull/1")
+            assert get_settings().pr_reviewer.extra_instructions == "from repo"
+            assert get_settings().pr_reviewer.num_max_findings == global_settings.pr_reviewer.num_max_findings
+
+        assert get_settings() is global_settings
+        assert global_settings.pr_reviewer.extra_instructions != "from repo"
+        assert global_settings.pr_code_suggestions.num_code_suggestions_per_chunk != 7
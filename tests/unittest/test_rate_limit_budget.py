@@ -0,0 +1,128 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo.utils import get_rate_limit_status, validate_and_await_rate_limit
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers import blob_cache, rate_limit_budget
+from pr_agent.git_providers.blob_cache import BlobCache
+from pr_agent.git_providers.github_client_cache import PooledHTTPSConnection
+from pr_agent.git_providers.github_graphql import GithubGraphQLError
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.rate_limit_budget import RateLimitTracker, get_rate_limit_key
+
+KEY = get_rate_limit_key("token")
+
+
+def rate_limit_headers(limit=5000, remaining=5000, reset_in_sec=3600, resource="core"):
+    return {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(time.time() + reset_in_sec)), "X-RateLimit-Resource": resource}
+
+
+@pytest.fixture
+def tracker():
+    tracker = RateLimitTracker(reserve_ratio=0.1, max_burst=100)
+    with patch.object(rate_limit_budget, "_rate_limit_tracker", tracker):
+        yield tracker
+
+
+@pytest.fixture
+def budget_enabled():
+    original = get_settings().get("GITHUB.RATE_LIMIT_BUDGET")
+    get_settings().set("GITHUB.RATE_LIMIT_BUDGET", True)
+    yield
+    get_settings().set("GITHUB.RATE_LIMIT_BUDGET", original)
+
+
+class TestRateLimitTracker:
+    def test_unknown_budgets_are_not_limited(self, tracker):
+        assert tracker.try_acquire(KEY, 1000)
+        assert not tracker.is_close_to_rate_limit(KEY)
+        assert tracker.get_status(KEY) is None
+
+    def test_updated_from_headers(self, tracker):
+        tracker.update_from_headers(KEY, rate_limit_headers(remaining=4000))
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=30, remaining=10, resource="search"))
+        tracker.update_from_headers(KEY, {"X-Other": "1"})  # ignored
+        status = tracker.get_status(KEY)
+        assert status["rate"]["remaining"] == 4000
+        assert status["resources"]["search"]["limit"] == 30
+        assert tracker.get_status(get_rate_limit_key("other token")) is None
+
+    def test_reserve_is_kept(self, tracker):
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=5000, remaining=510))
+        assert tracker.try_acquire(KEY, 10)
+        assert not tracker.try_acquire(KEY, 10)  # below the reserve (10% of the limit)
+        assert tracker.is_close_to_rate_limit(KEY)
+        assert tracker.try_acquire(KEY, 10, resource="graphql")  # a separate budget
+
+    def test_low_priority_work_is_spread_over_the_window(self, tracker):
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=5000, remaining=3600 + 500, reset_in_sec=3600))
+        assert tracker.try_acquire(KEY, 100)  # the burst
+        assert not tracker.try_acquire(KEY, 10)
+        # refilled at (remaining - reserve) / seconds to reset = ~1 call per second
+        budget = tracker.get_budget(KEY)
+        budget.refilled_at -= 20
+        assert tracker.try_acquire(KEY, 10)
+
+    def test_new_window(self, tracker):
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=5000, remaining=0, reset_in_sec=-1))
+        assert tracker.try_acquire(KEY, 10)
+        assert tracker.get_budget(KEY).remaining == 4990
+
+
+class TestRateLimitBudgetUsage:
+    def test_connections_feed_the_tracker(self, tracker, budget_enabled):
+        connection = PooledHTTPSConnection("api.github.com", timeout=15)
+        connection.session = MagicMock()
+        connection.session.get.return_value = MagicMock(status_code=200, headers=rate_limit_headers(remaining=42),
+                                                        text="{}")
+        connection.request("GET", "/repos/org/repo", None, {"Authorization": "token token"})
+        connection.getresponse()
+        assert tracker.get_budget(KEY).remaining == 42
+
+    def test_rate_limit_status_without_polling(self, tracker, budget_enabled):
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=5000, remaining=10))
+        with patch("pr_agent.algo.utils.requests.get") as mock_get, patch("time.sleep") as mock_sleep:
+            assert get_rate_limit_status("token")["rate"]["remaining"] == 10
+            assert validate_and_await_rate_limit("token")["rate"]["remaining"] == 10
+        mock_get.assert_not_called()
+        mock_sleep.assert_not_called()
+
+    @pytest.fixture
+    def provider(self):
+        with patch.object(GithubProvider, "_get_github_client", return_value=MagicMock()):
+            provider = GithubProvider()
+        provider.auth = SimpleNamespace(token="token")
+        provider.repo = "owner/repo"
+        provider.repo_obj = MagicMock(full_name="owner/repo")
+        provider.repo_obj.get_contents.side_effect = \
+            lambda path, ref: SimpleNamespace(decoded_content=f"{path}@{ref}".encode())
+        provider.repo_obj.compare.return_value.merge_base_commit.sha = "budget_base_sha"
+        provider.pr = MagicMock()
+        provider.pr.base.sha = "budget_base_sha"
+        provider.pr.head.sha = "budget_head_sha"
+        provider.graphql_client = MagicMock()
+        files = [SimpleNamespace(filename=f"src/budget_{i}.py", patch="@@ -1 +1 @@\n-a\n+b", status="modified",
+                                 additions=1, deletions=1) for i in range(10)]
+        with patch.object(provider, "get_files", return_value=files), \
+                patch.object(blob_cache, "_blob_cache", BlobCache(max_memory_bytes=1024 * 1024)):
+            yield provider
+
+    def test_get_diff_files_degrades_to_diffs_only(self, tracker, budget_enabled, provider):
+        provider.graphql_client.get_blob_texts.side_effect = GithubGraphQLError("Bad credentials")
+        # a budget of 3 full files (2 REST loads each) above the reserve
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=5000, remaining=500 + 6))
+        diff_files = provider.get_diff_files()
+        assert len(diff_files) == 10
+        assert all(file.head_file and file.base_file for file in diff_files[:3])
+        assert all(not file.head_file and not file.base_file for file in diff_files[3:])
+
+    def test_only_rest_loads_are_charged(self, tracker, budget_enabled, provider):
+        provider.graphql_client.get_blob_texts.side_effect = lambda repo, blobs, batch_size: \
+            [f"{path}@{sha}" for sha, path in blobs]
+        tracker.update_from_headers(KEY, rate_limit_headers(limit=5000, remaining=500 + 6))
+        assert all(file.head_file and file.base_file for file in provider.get_diff_files())
+        assert tracker.get_budget(KEY).remaining == 506  # the GraphQL queries are charged to the 'graphql' budget
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+
+import litellm
+import pytest
+from litellm import ModelResponse
+
+from pr_agent.algo.ai_handlers import rate_limiter
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.ai_handlers.rate_limiter import AdaptiveConcurrencyLimiter, get_rate_limiter
+
+
+def rate_limit_error():
+    return litellm.RateLimitError("rate limited", llm_provider="openai", model="gpt-4o")
+
+
+class TestAdaptiveConcurrencyLimiter:
+    def test_concurrency_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_concurrency=2)
+        in_flight, max_in_flight = 0, 0
+
+        async def call():
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return "response"
+
+        async def run_all():
+            return await asyncio.gather(*[limiter.run(call) for _ in range(6)])
+
+        assert asyncio.run(run_all()) == ["response"] * 6
+        assert max_in_flight == 2
+        assert limiter.in_flight == 0 and 4 < limiter.concurrency < 5  # about +1 per "concurrency" successful calls
+
+    def test_tokens_per_minute_budget(self):
+        limiter = AdaptiveConcurrencyLimiter(tokens_per_minute=100, window_seconds=0.2)
+        admitted_at = []
+
+        async def call():
+            admitted_at.append(time.monotonic())
+
+        async def run_all():
+            await asyncio.gather(*[limiter.run(call, tokens=60) for _ in range(3)])
+
+        start = time.monotonic()
+        asyncio.run(run_all())
+        assert admitted_at[0] - start < 0.1  # queued, not failed
+        assert admitted_at[1] - admitted_at[0] >= 0.19 and admitted_at[2] - admitted_at[1] >= 0.19
+
+    def test_rate_limited_calls_are_queued_again(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_concurrency=8, max_rate_limit_retries=1, window_seconds=0.05)
+        call = AsyncMock(side_effect=[rate_limit_error(), "response"])
+        assert asyncio.run(limiter.run(call)) == "response"
+        assert call.await_count == 2
+        assert 4 <= limiter.concurrency < 5  # halved, and increased by the success
+
+        call = AsyncMock(side_effect=rate_limit_error())
+        with pytest.raises(litellm.RateLimitError):
+            asyncio.run(limiter.run(call))
+        assert call.await_count == 2 and limiter.in_flight == 0
+
+    def test_a_limiter_per_model(self):
+        with patch.dict(rate_limiter._rate_limiters, clear=True):
+            assert get_rate_limiter("gpt-4o") is get_rate_limiter("gpt-4o")
+            assert get_rate_limiter("gpt-4o") is not get_rate_limiter("gpt-4o", "deployment")
+
+
+class TestChatCompletionRateLimit:
+    def test_a_rate_limited_call_is_retried(self):
+        model_response = ModelResponse(choices=[{"message": {"role": "assistant", "content": "the review"},
+                                                 "finish_reason": "stop"}])
+        limiter = AdaptiveConcurrencyLimiter(window_seconds=0.05)
+        with patch.dict(rate_limiter._rate_limiters, {("gpt-4o", ""): limiter}), \
+                patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                      new=AsyncMock(side_effect=[rate_limit_error(), model_response])) as mock_completion:
+            response = asyncio.run(LiteLLMAIHandler().chat_completion(model="gpt-4o", system="system", user="user",
+                                                                      temperature=0))
+        assert response == ("the review", "stop")
+        assert mock_completion.await_count == 2
+        assert limiter._window[-1][1] == 2  # the estimated prompt tokens
@@ -0,0 +1,116 @@
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+from starlette_context import request_cycle_context
+
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
+from pr_agent.git_providers import repo_settings_cache
+from pr_agent.git_providers.repo_settings_cache import RepoSettingsCache, get_repo_id, git_blob_sha, parse_repo_settings
+from pr_agent.git_providers.utils import apply_repo_settings
+
+REPO_SETTINGS = b"""[pr_reviewer]
+extra_instructions = "from repo"
+num_max_findings = 7
+
+[config]
+response_language = "fr-FR"
+"""
+
+
+@pytest.fixture
+def cache():
+    cache = RepoSettingsCache(ttl_seconds=0, max_entries=10)
+    with patch.object(repo_settings_cache, "_repo_settings_cache", cache):
+        yield cache
+
+
+def apply_in_request(git_provider, pr_url="https://github.com/org/repo/pull/1"):
+    with request_cycle_context({"settings": LayeredSettings(global_settings)}):
+        with patch("pr_agent.git_providers.utils.get_git_provider_with_context", return_value=git_provider):
+            apply_repo_settings(pr_url)
+        return get_settings().pr_reviewer.to_dict(), get_settings().config.response_language
+
+
+class TestRepoSettingsCache:
+    def test_git_blob_sha(self, tmp_path):
+        path = tmp_path / ".pr_agent.toml"
+        path.write_bytes(REPO_SETTINGS)
+        expected = subprocess.run(["git", "hash-object", str(path)], capture_output=True, text=True).stdout.strip()
+        assert git_blob_sha(REPO_SETTINGS) == expected
+
+    def test_repo_id(self):
+        assert get_repo_id("https://github.com/org/repo/pull/12") == "https://github.com/org/repo"
+        assert get_repo_id("https://api.github.com/repos/org/repo/pulls/12") == "https://api.github.com/repos/org/repo"
+        assert get_repo_id("https://gitlab.com/group/sub/project/-/merge_requests/3") == \
+               "https://gitlab.com/group/sub/project"
+        assert get_repo_id("https://bitbucket.org/ws/repo/pull-requests/5") == "https://bitbucket.org/ws/repo"
+
+    def test_parse_legacy_toml(self):
+        # mixed-type arrays are invalid in TOML 1.0, but are accepted by Dynaconf
+        assert parse_repo_settings(b"[config]\nvalues = [1, 'a']\n") == {"config": {"values": [1, "a"]}}
+
+    def test_settings_file_is_fetched_when_its_sha_changes(self, cache):
+        git_provider = MagicMock()
+        git_provider.get_repo_settings.return_value = REPO_SETTINGS
+        git_provider.get_repo_settings_sha.return_value = git_blob_sha(REPO_SETTINGS)
+        for _ in range(3):
+            pr_reviewer, response_language = apply_in_request(git_provider)
+            assert pr_reviewer["extra_instructions"] == "from repo"
+            assert pr_reviewer["num_max_findings"] == 7
+            assert pr_reviewer["require_score_review"] == global_settings.pr_reviewer.require_score_review
+            assert response_language == "fr-FR"
+        assert git_provider.get_repo_settings.call_count == 1
+        assert git_provider.get_repo_settings_sha.call_count == 2
+
+        apply_in_request(git_provider, pr_url="https://github.com/org/other-repo/pull/1")
+        assert git_provider.get_repo_settings.call_count == 2
+
+        # the settings file was edited
+        git_provider.get_repo_settings.return_value = REPO_SETTINGS.replace(b"7", b"8")
+        git_provider.get_repo_settings_sha.return_value = git_blob_sha(git_provider.get_repo_settings.return_value)
+        pr_reviewer, _ = apply_in_request(git_provider)
+        assert pr_reviewer["num_max_findings"] == 8
+        assert git_provider.get_repo_settings.call_count == 3
+        assert global_settings.pr_reviewer.extra_instructions != "from repo"
+
+    def test_settings_file_without_sha_lookup(self, cache):
+        git_provider = MagicMock()
+        git_provider.get_repo_settings.return_value = REPO_SETTINGS
+        git_provider.get_repo_settings_sha.return_value = None
+        for _ in range(2):
+            apply_in_request(git_provider)
+        assert git_provider.get_repo_settings.call_count == 2
+
+        # with a ttl, also the lookup is skipped
+        cache.ttl_seconds = 60
+        git_provider.get_repo_settings_sha.reset_mock(return_value=True)
+        for _ in range(2):
+            apply_in_request(git_provider)
+        assert git_provider.get_repo_settings.call_count == 2
+        assert git_provider.get_repo_settings_sha.call_count == 0
+
+    def test_parsed_and_merged_sections_are_reused(self, cache):
+        current_section = global_settings.get("pr_reviewer")
+        contents = {"extra_instructions": "from repo"}
+        with patch.object(repo_settings_cache, "parse_repo_settings", wraps=parse_repo_settings) as mock_parse:
+            assert cache.get_parsed(REPO_SETTINGS) is cache.get_parsed(REPO_SETTINGS)
+        assert mock_parse.call_count == 1
+
+        first = cache.get_merged_section(REPO_SETTINGS, "pr_reviewer", current_section, contents)
+        first["num_max_findings"] = 100  # the merged sections are owned by the caller
+        second = cache.get_merged_section(REPO_SETTINGS, "pr_reviewer", current_section, contents)
+        assert second["num_max_findings"] == global_settings.pr_reviewer.num_max_findings
+        assert second["extra_instructions"] == "from repo"
+
+        # not reused on top of a different section
+        other = cache.get_merged_section(REPO_SETTINGS, "pr_reviewer", {"num_max_findings": 1}, contents)
+        assert other == {"num_max_findings": 1, "extra_instructions": "from repo"}
+
+    def test_invalid_settings_file(self, cache):
+        git_provider = MagicMock()
+        git_provider.get_repo_settings.return_value = b"[pr_reviewer\n"
+        git_provider.is_supported.return_value = False
+        apply_in_request(git_provider)
+        git_provider.publish_persistent_comment.assert_called_once()
+        assert "failed to apply 'local' repo settings" in git_provider.publish_persistent_comment.call_args.args[0]
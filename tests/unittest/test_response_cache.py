@@ -0,0 +1,115 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from litellm import ModelResponse
+
+from pr_agent.algo.ai_handlers import response_cache
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.ai_handlers.response_cache import (
+    InMemoryResponseCacheBackend,
+    ResponseCache,
+    SQLiteResponseCacheBackend,
+    response_cache_key,
+)
+from pr_agent.config_loader import get_settings
+
+MESSAGES = [{"role": "system", "content": "system"}, {"role": "user", "content": "user"}]
+
+
+class TestResponseCache:
+    def test_key(self):
+        key = response_cache_key("gpt-4o", MESSAGES, 0, 42)
+        assert key == response_cache_key("gpt-4o", [dict(m) for m in MESSAGES], 0, 42)
+        assert key != response_cache_key("gpt-4o-mini", MESSAGES, 0, 42)
+        assert key != response_cache_key("gpt-4o", MESSAGES, 0.2, 42)
+        assert key != response_cache_key("gpt-4o", MESSAGES, 0, -1)
+        assert key != response_cache_key("gpt-4o", [MESSAGES[0], {"role": "user", "content": "other"}], 0, 42)
+
+    def test_memory_backend_ttl_and_lru(self):
+        backend = InMemoryResponseCacheBackend(max_entries=2)
+        backend.set("a", ("resp_a", "stop"), ttl_seconds=60)
+        backend.set("b", ("resp_b", "stop"), ttl_seconds=60)
+        assert backend.get("a") == ("resp_a", "stop")  # 'a' becomes the most recently used
+        backend.set("c", ("resp_c", "stop"), ttl_seconds=60)
+        assert backend.get("b") is None
+        assert backend.get("a") == ("resp_a", "stop")
+
+        backend.set("expired", ("resp", "stop"), ttl_seconds=-1)
+        assert backend.get("expired") is None
+
+    def test_sqlite_backend(self, tmp_path):
+        path = str(tmp_path / "cache" / "responses.db")
+        backend = SQLiteResponseCacheBackend(path, max_entries=2)
+        backend.set("a", ("resp_a", "stop"), ttl_seconds=60)
+        backend.set("expired", ("resp", "stop"), ttl_seconds=-1)
+        assert backend.get("expired") is None
+
+        # shared between processes
+        other_backend = SQLiteResponseCacheBackend(path, max_entries=2)
+        assert other_backend.get("a") == ("resp_a", "stop")
+        other_backend.set("b", ("resp_b", "stop"), ttl_seconds=60)
+        other_backend.set("c", ("resp_c", "length"), ttl_seconds=60)
+        assert backend.get("a") is None
+        assert backend.get("c") == ("resp_c", "length")
+
+        backend.clear()
+        assert backend.get("c") is None
+
+    def test_metrics(self):
+        cache = ResponseCache(InMemoryResponseCacheBackend(max_entries=10), ttl_seconds=60)
+        assert cache.get("a") is None
+        cache.set("a", ("resp", "stop"))
+        assert cache.get("a") == ("resp", "stop")
+        assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+class TestChatCompletionResponseCache:
+    @pytest.fixture
+    def enabled_cache(self):
+        original = get_settings().get("RESPONSE_CACHE.ENABLED")
+        get_settings().set("RESPONSE_CACHE.ENABLED", True)
+        cache = ResponseCache(InMemoryResponseCacheBackend(max_entries=10), ttl_seconds=60)
+        with patch.object(response_cache, "_response_cache", cache):
+            yield cache
+        get_settings().set("RESPONSE_CACHE.ENABLED", original)
+
+    def test_identical_requests_call_the_model_once(self, enabled_cache):
+        model_response = ModelResponse(choices=[{"message": {"role": "assistant", "content": "the review"},
+                                                 "finish_reason": "stop"}])
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                   new=AsyncMock(return_value=model_response)) as mock_completion:
+            handler = LiteLLMAIHandler()
+            first = asyncio.run(handler.chat_completion(model="gpt-4o", system="system", user="user", temperature=0))
+            second = asyncio.run(handler.chat_completion(model="gpt-4o", system="system", user="user", temperature=0))
+            third = asyncio.run(handler.chat_completion(model="gpt-4o", system="system", user="other", temperature=0))
+
+        assert first == second == third == ("the review", "stop")
+        assert mock_completion.await_count == 2
+        assert enabled_cache.stats()["hits"] == 1
+
+    def test_stream_is_keyed_on_the_response_format(self, enabled_cache):
+        requests = []
+
+        async def stream(**kwargs):
+            requests.append(kwargs)
+            yield ModelResponse(stream=True, choices=[{"delta": {"content": "{}"}, "index": 0,
+                                                       "finish_reason": "stop"}])
+
+        async def collect(**kwargs):
+            return [chunk async for chunk in LiteLLMAIHandler().chat_completion_stream(
+                model="gpt-4o", system="system", user="user", temperature=0, **kwargs)]
+
+        response_schema = {"name": "review", "schema": {"type": "object"}}
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion", side_effect=stream):
+            assert asyncio.run(collect(response_schema=response_schema)) == ["{}"]
+            assert asyncio.run(collect(response_schema=response_schema)) == ["{}"]
+            assert asyncio.run(collect()) == ["{}"]
+
+        assert len(requests) == 2
+        assert requests[0]["response_format"] == {"type": "json_schema", "json_schema": response_schema}
+        assert "response_format" not in requests[1]
+
+    def test_disabled_by_default(self):
+        assert not get_settings().get("RESPONSE_CACHE.ENABLED")
+        assert response_cache.get_response_cache() is None
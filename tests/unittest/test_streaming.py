@@ -0,0 +1,167 @@
+import asyncio
+import random
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import litellm
+import yaml
+from litellm import ModelResponse
+
+from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.streaming import IncrementalYamlListParser, ThrottledCommentUpdater, stream_chat_completion
+from pr_agent.tools.pr_reviewer import PRReviewer
+
+CODE_SUGGESTIONS_RESPONSE = """```yaml
+code_suggestions:
+- relevant_file: |
+    src/a.py
+  language: |
+    python
+  existing_code: |
+    x = 1
+
+    y = 2
+  one_sentence_summary: |
+    Rename variable
+- relevant_file: |
+    src/b.py
+  existing_code: |
+    - not a new item
+  one_sentence_summary: |
+    Fix loop
+- relevant_file: |
+    src/c.py
+  one_sentence_summary: |
+    Add check
+```"""
+
+REVIEW_RESPONSE = """review:
+  estimated_effort_to_review_[1-5]: |
+    3
+  key_issues_to_review:
+    - relevant_file: |
+        a.py
+      issue_header: |
+        Possible bug
+    - relevant_file: |
+        b.py
+      issue_header: |
+        Performance
+  security_concerns: |
+    No
+"""
+
+
+def feed_in_chunks(parser, text, rng):
+    items = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 20)
+        items.extend(parser.feed(text[position:position + size]))
+        position += size
+    return items
+
+
+class FakeStreamingHandler(BaseAiHandler):
+    def __init__(self, response):
+        self.response = response
+
+    @property
+    def deployment_id(self):
+        return None
+
+    async def chat_completion(self, model, system, user, temperature=0.2, img_path=None, response_schema=None):
+        return self.response, "stop"
+
+    async def chat_completion_stream(self, model, system, user, temperature=0.2, img_path=None,
+                                     response_schema=None):
+        for i in range(0, len(self.response), 7):
+            yield self.response[i:i + 7]
+
+
+class TestIncrementalYamlListParser:
+    def test_items_match_full_parse(self):
+        expected = yaml.safe_load(CODE_SUGGESTIONS_RESPONSE.removeprefix("```yaml").removesuffix("```"))
+        for seed in range(20):
+            parser = IncrementalYamlListParser(["code_suggestions"])
+            items = feed_in_chunks(parser, CODE_SUGGESTIONS_RESPONSE, random.Random(seed))
+            items += parser.close()
+            assert [item for _, item in items] == expected["code_suggestions"]
+            assert {key for key, _ in items} == {"code_suggestions"}
+
+    def test_item_is_returned_when_the_next_one_starts(self):
+        parser = IncrementalYamlListParser(["code_suggestions"])
+        first_item_end = CODE_SUGGESTIONS_RESPONSE.index("- relevant_file: |\n    src/b.py")
+        assert parser.feed(CODE_SUGGESTIONS_RESPONSE[:first_item_end]) == []
+        items = parser.feed("- relevant_file: |\n")
+        assert [item["relevant_file"] for _, item in items] == ["src/a.py\n"]
+
+    def test_nested_key(self):
+        parser = IncrementalYamlListParser(["key_issues_to_review"])
+        items = feed_in_chunks(parser, REVIEW_RESPONSE, random.Random(0))
+        # the list ends when the next key starts, before the end of the stream
+        assert [item["issue_header"] for _, item in items] == ["Possible bug\n", "Performance\n"]
+        assert parser.close() == []
+
+
+class TestStreaming:
+    def test_throttled_comment_updater(self):
+        git_provider = MagicMock()
+        updater = ThrottledCommentUpdater(git_provider, "comment", min_interval_sec=60)
+        assert updater.update("first")
+        assert not updater.update("second")
+        assert updater.update("final", force=True)
+        assert [c.kwargs["body"] for c in git_provider.edit_comment.call_args_list] == ["first", "final"]
+
+    def test_stream_chat_completion(self):
+        handler = FakeStreamingHandler(CODE_SUGGESTIONS_RESPONSE)
+        published = []
+        texts = []
+        response = asyncio.run(stream_chat_completion(handler, "model", "system", "user", 0,
+                                                      list_keys=["code_suggestions"],
+                                                      on_items=published.extend, on_text=texts.append))
+        assert response == CODE_SUGGESTIONS_RESPONSE
+        assert len(published) == 3
+        assert texts[-1] == CODE_SUGGESTIONS_RESPONSE
+
+    def test_default_stream_yields_whole_completion(self):
+        class NonStreamingHandler(FakeStreamingHandler):
+            chat_completion_stream = BaseAiHandler.chat_completion_stream
+
+        response = asyncio.run(stream_chat_completion(NonStreamingHandler("full response"), "model", "system",
+                                                      "user", 0))
+        assert response == "full response"
+
+    def test_litellm_stream(self):
+        async def stream(**kwargs):
+            assert kwargs["stream"]
+            for content in ["Hello", " world", None]:
+                yield ModelResponse(stream=True, choices=[{"delta": {"content": content}, "index": 0,
+                                                           "finish_reason": None if content else "stop"}])
+
+        async def collect():
+            return [chunk async for chunk in LiteLLMAIHandler().chat_completion_stream("gpt-4o", "system", "user")]
+
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion", side_effect=stream):
+            assert asyncio.run(collect()) == ["Hello", " world"]
+
+    def test_review_progress_lists_the_streamed_issues(self):
+        reviewer = PRReviewer.__new__(PRReviewer)
+        reviewer.git_provider = MagicMock()
+        reviewer.progress_response = "comment"
+        reviewer.progress_updater = None
+        reviewer.streamed_issues = []
+        reviewer._publish_streamed_issues(IncrementalYamlListParser(["key_issues_to_review"]).feed(REVIEW_RESPONSE))
+        body = reviewer.git_provider.edit_comment.call_args.kwargs["body"]
+        assert "Key issues found so far (2)" in body
+        assert "- `a.py`: Possible bug" in body
+
+    def test_litellm_completion_retries_api_errors(self):
+        model_response = ModelResponse(choices=[{"message": {"role": "assistant", "content": "the review"},
+                                                 "finish_reason": "stop"}])
+        api_error = litellm.APIError(500, "server error", llm_provider="openai", model="gpt-4o")
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                   new=AsyncMock(side_effect=[api_error, model_response])) as mock_completion:
+            response = asyncio.run(LiteLLMAIHandler().chat_completion("gpt-4o", "system", "user", temperature=0))
+        assert response == ("the review", "stop")
+        assert mock_completion.await_count == 2
@@ -0,0 +1,85 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from jinja2 import Environment
+from litellm import ModelResponse
+
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.structured_output import get_response_schema, get_structured_output_kwargs, parse_json_response
+from pr_agent.algo.utils import load_yaml
+from pr_agent.config_loader import get_settings
+
+
+@pytest.fixture
+def structured_output():
+    original = get_settings().get("CONFIG.STRUCTURED_OUTPUT")
+    get_settings().set("CONFIG.STRUCTURED_OUTPUT", True)
+    yield
+    get_settings().set("CONFIG.STRUCTURED_OUTPUT", original)
+
+
+def render_review_prompt(**variables) -> str:
+    return Environment().from_string(get_settings().pr_review_prompt.system).render(
+        num_max_findings=3, require_estimate_effort_to_review=True, require_security_review=True, **variables)
+
+
+class TestResponseSchema:
+    def test_review_schema_from_the_prompt(self, structured_output):
+        response_schema = get_response_schema(render_review_prompt(require_todo_scan=True))
+        assert response_schema["name"] == "PRReview"
+        review = response_schema["schema"]["properties"]["review"]
+        assert set(review["required"]) == {"estimated_effort_to_review_[1-5]", "key_issues_to_review",
+                                           "security_concerns", "todo_sections"}
+        issue = review["properties"]["key_issues_to_review"]["items"]
+        assert issue["properties"]["start_line"]["type"] == "integer"
+        assert "'Possible Bug'" in issue["properties"]["issue_header"]["description"]
+        assert review["properties"]["todo_sections"]["anyOf"][1] == {"type": "string"}
+
+    def test_schema_follows_the_rendered_prompt(self, structured_output):
+        review = get_response_schema(render_review_prompt())["schema"]["properties"]["review"]
+        assert "todo_sections" not in review["properties"]
+
+    def test_code_suggestions_schema(self, structured_output):
+        system_prompt = Environment().from_string(get_settings().pr_code_suggestions_prompt.system).render(
+            focus_only_on_problems=True)
+        response_schema = get_response_schema(system_prompt)
+        suggestion = response_schema["schema"]["properties"]["code_suggestions"]["items"]
+        assert response_schema["name"] == "PRCodeSuggestions"
+        assert {"relevant_file", "existing_code", "improved_code", "label"} <= set(suggestion["required"])
+
+    def test_disabled_or_no_definitions(self, structured_output):
+        assert get_response_schema("Answer in plain text") is None
+        assert get_structured_output_kwargs("Answer in plain text") == {}
+        get_settings().set("CONFIG.STRUCTURED_OUTPUT", False)
+        assert get_response_schema(render_review_prompt()) is None
+
+
+class TestParseJsonResponse:
+    def test_single_pass_without_yaml_fallbacks(self):
+        response = '```json\n{"review": {"key_issues_to_review": [{"issue_content": "line 1\nline 2"}]}}\n```'
+        with patch("pr_agent.algo.utils.yaml.safe_load") as mock_safe_load:
+            data = load_yaml(response)
+        mock_safe_load.assert_not_called()
+        assert data["review"]["key_issues_to_review"][0]["issue_content"] == "line 1\nline 2"
+
+    def test_not_json(self):
+        assert parse_json_response("review:\n  security_concerns: No") is None
+        assert parse_json_response("{review: [unclosed") is None
+        assert parse_json_response('{"a": 1} trailing text') == {"a": 1}
+
+
+class TestChatCompletionStructuredOutput:
+    @pytest.mark.parametrize("supported", [True, False])
+    def test_response_format(self, supported):
+        model_response = ModelResponse(choices=[{"message": {"role": "assistant", "content": "{}"},
+                                                 "finish_reason": "stop"}])
+        response_schema = {"name": "PRReview", "schema": {"type": "object"}}
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                   new=AsyncMock(return_value=model_response)) as mock_completion, \
+                patch("pr_agent.algo.ai_handlers.litellm_ai_handler.litellm.supports_response_schema",
+                      return_value=supported):
+            asyncio.run(LiteLLMAIHandler().chat_completion(model="gpt-4o", system="system", user="user",
+                                                           response_schema=response_schema))
+        response_format = mock_completion.call_args.kwargs.get("response_format")
+        assert response_format == ({"type": "json_schema", "json_schema": response_schema} if supported else None)
@@ -0,0 +1,102 @@
+import random
+from unittest.mock import patch
+
+import litellm  # noqa: F401
+import pytest
+from tiktoken import get_encoding
+
+from pr_agent.algo.pr_processing import pr_generate_compressed_diff
+from pr_agent.algo.token_handler import TokenCountCache, TokenHandler, get_prompt_template
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+
+LINE_PIECES = ["foo", "bar();", "  x = 1", "// comment", "/path/to", "}", "{", "\t", "é漢字", "123", "'s", " ", "\r",
+               "@@ -1,3 +1,4 @@", "\\ No newline at end of file", "));", "=>", "/", "#", '"""', "__new hunk__"]
+
+
+def random_patch(rng: random.Random) -> str:
+    lines = []
+    for _ in range(rng.randint(1, 12)):
+        prefix = rng.choice(["+", "-", " ", ""])
+        lines.append(prefix + "".join(rng.choice(LINE_PIECES) for _ in range(rng.randint(0, 6))))
+    leading = rng.choice(["", "\n", "\n\n", "  ", "\n\n__new hunk__\n"])
+    trailing = rng.choice(["", "\n", "\n\n", " \n"])
+    return leading + "\n".join(lines) + trailing
+
+
+def get_encoder(name: str):
+    # litellm points TIKTOKEN_CACHE_DIR to the encodings it bundles when imported; without them tiktoken downloads
+    try:
+        return get_encoding(name)
+    except Exception as e:
+        pytest.skip(f"The {name} encoding is unavailable: {e}")
+
+
+def naive_count_wrapped_tokens(self, prefix, text, text_tokens, suffix=""):
+    return self.count_tokens(prefix + text.strip() + suffix)
+
+
+class TestTokenCounting:
+    @pytest.fixture(params=["o200k_base", "cl100k_base"])
+    def token_handler(self, request):
+        token_handler = TokenHandler()
+        token_handler.encoder = get_encoder(request.param)
+        token_handler.prompt_tokens = 50
+        return token_handler
+
+    def test_count_wrapped_tokens_matches_full_encoding(self, token_handler):
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = random_patch(rng)
+            filename = rng.choice(["a.py", "src/x.ts", "weird'name", "é.md"])
+            for prefix, suffix in [(f"\n\n## File: '{filename}'\n\n", "\n"), ("\n\n", "")]:
+                expected = len(token_handler.encoder.encode(prefix + text.strip() + suffix, disallowed_special=()))
+                assert token_handler.count_wrapped_tokens(prefix, text, token_handler.count_tokens(text),
+                                                          suffix) == expected
+
+    def test_count_tokens_is_memoized(self, token_handler):
+        TokenCountCache.clear()
+        text = "def foo():\n    return 1\n"
+        with patch.object(token_handler.encoder, "encode", wraps=token_handler.encoder.encode) as mock_encode:
+            first = token_handler.count_tokens(text)
+            second = token_handler.count_tokens(text)
+        assert first == second
+        assert mock_encode.call_count == 1
+
+    def test_prompt_templates_are_compiled_once(self):
+        system = "You are a reviewer of {{ title }}"
+        user = "Diff:\n{{ diff }}"
+        get_prompt_template.cache_clear()
+        vars = {"title": "a PR", "diff": "+foo"}
+        first = TokenHandler(pr=object(), vars=vars, system=system, user=user)
+        second = TokenHandler(pr=object(), vars=vars, system=system, user=user)
+
+        assert first.prompt_tokens == second.prompt_tokens > 0
+        assert first.prompt_tokens == (first.count_tokens("You are a reviewer of a PR") +
+                                       first.count_tokens("Diff:\n+foo"))
+        cache_info = get_prompt_template.cache_info()
+        assert cache_info.misses == 2
+        assert cache_info.hits == 2
+
+    @pytest.mark.parametrize("max_tokens", [300, 600, 1200, 4000])
+    @pytest.mark.parametrize("convert_hunks_to_line_numbers", [False, True])
+    def test_budget_decisions_unchanged(self, token_handler, max_tokens, convert_hunks_to_line_numbers):
+        rng = random.Random(max_tokens)
+        files = []
+        for i in range(40):
+            patch_str = "@@ -1,3 +1,4 @@\n" + random_patch(rng)
+            files.append(FilePatchInfo("", "", patch_str, f"src/file_{i}.py", tokens=rng.randint(1, 500),
+                                       edit_type=EDIT_TYPE.MODIFIED))
+        pr_languages = [{'language': 'Python', 'files': files}]
+
+        def run():
+            with patch("pr_agent.algo.pr_processing.get_max_tokens", return_value=max_tokens + 1500), \
+                 patch("pr_agent.algo.pr_processing.handle_patch_deletions", side_effect=lambda p, *args: p), \
+                 patch("pr_agent.algo.pr_processing.decouple_and_convert_to_hunks_with_lines_numbers",
+                       side_effect=lambda p, file: f"\n\n## File: '{file.filename}'\n\n__new hunk__\n{p}\n"):
+                return pr_generate_compressed_diff(pr_languages, token_handler, "model",
+                                                   convert_hunks_to_line_numbers, large_pr_handling=True)
+
+        result = run()
+        with patch.object(TokenHandler, "count_wrapped_tokens", naive_count_wrapped_tokens):
+            expected = run()
+        assert result == expected
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo.vector_store import (
+    LocalVectorStore,
+    embed_texts,
+    get_embedding_batches,
+    get_embedding_function,
+    hashing_embedding,
+)
+from pr_agent.tools.pr_similar_issue import PRSimilarIssue
+
+np = pytest.importorskip("numpy")
+
+
+class TestLocalVectorStore:
+    def test_upsert_and_search(self, tmp_path):
+        store = LocalVectorStore(str(tmp_path), "model")
+        store.upsert("repo", {"issue_1": "t1", "issue_2": "t1"},
+                     [("issue_1.issue", "issue_1", {"level": "issue"}), ("issue_1.comment_1", "issue_1", {}),
+                      ("issue_2.issue", "issue_2", {})], [[1, 0], [0, 3], [1, 1]])
+        store.upsert("other-repo", {"issue_1": "t1"}, [("issue_1.issue", "issue_1", {})], [[0, 1]])
+        results = store.search("repo", [0, 1], top_k=2)
+        assert [(record_id, round(score, 2)) for record_id, _, score in results] == [("issue_1.comment_1", 1.0),
+                                                                                      ("issue_2.issue", 0.71)]
+        assert store.search("repo", [1, 0], top_k=1)[0][1] == {"level": "issue"}
+
+        # an updated issue replaces all its records. Its previous rows are reused by the next upsert
+        store.upsert("repo", {"issue_1": "t2"}, [("issue_1.issue", "issue_1", {})], [[-1, 0]])
+        assert [record_id for record_id, _, _ in store.search("repo", [0, 1], top_k=10)] == ["issue_2.issue",
+                                                                                            "issue_1.issue"]
+        store.upsert("repo", {"issue_3": "t3"}, [("issue_3.issue", "issue_3", {})], [[0, 1]])
+        assert np.load(tmp_path / "vectors.npy").shape == (6, 2)
+
+        reopened = LocalVectorStore(str(tmp_path), "model")  # a new process
+        assert reopened.get_documents("repo") == {"issue_1": "t2", "issue_2": "t1", "issue_3": "t3"}
+        assert reopened.search("repo", [0, 1], top_k=1)[0][0] == "issue_3.issue"
+        assert LocalVectorStore(str(tmp_path), "new-model").get_documents("repo") == {}
+
+
+class TestEmbedding:
+    def test_size_aware_batches(self):
+        texts = ["a" * 10, "b" * 10, "c" * 50, "d", "e", "f"]
+        assert get_embedding_batches(texts, len, max_batch_size=2, max_batch_tokens=30) == [[0, 1], [2], [3, 4], [5]]
+
+    def test_a_failed_text_does_not_fail_its_batch(self):
+        def embed(texts):
+            if "bad" in texts:
+                raise Exception("invalid input")
+            return [[len(text)] for text in texts]
+
+        embed_mock = MagicMock(side_effect=embed)
+        assert embed_texts(["a", "bb", "bad", "cccc"], embed_mock, len) == [[1], [2], None, [4]]
+        assert embed_mock.call_count == 5  # the batch, its halves, and the quarters of the failed half
+
+    def test_embedding_from_a_fixed_list(self):
+        with patch("pr_agent.algo.vector_store.get_settings") as mock_settings:
+            mock_settings.return_value.get.return_value = "hashing"
+            assert get_embedding_function("model") == ("hashing", hashing_embedding)
+            mock_settings.return_value.get.return_value = "subprocess:getoutput"  # never imported
+            with pytest.raises(ValueError):
+                get_embedding_function("model")
+
+    def test_hashing_embedding(self):
+        query, similar, other = np.asarray(hashing_embedding(["crash when saving a file", "the app crashes when "
+                                                              "saving the file", "add a dark mode"]))
+        assert query @ similar > query @ other
+
+
+class TestPRSimilarIssueLocal:
+    def test_incremental_update(self, tmp_path):
+        def issue(number, updated_at, title):
+            return MagicMock(number=number, title=title, body="", pull_request=None, user=MagicMock(login="user"),
+                             updated_at=datetime(2024, 1, updated_at, tzinfo=timezone.utc))
+
+        similar_issue = PRSimilarIssue.__new__(PRSimilarIssue)
+        similar_issue.max_issues_to_scan = 500
+        similar_issue.token_handler = MagicMock(count_tokens=len)
+        similar_issue.embed = MagicMock(side_effect=hashing_embedding)
+        similar_issue.local_store = LocalVectorStore(str(tmp_path), "hashing")
+        repo_obj = MagicMock()
+        repo_obj.get_issues.return_value = [issue(1, 1, "crash on save"), issue(2, 2, "dark mode")]
+        similar_issue._update_local_store_with_issues(repo_obj, "org-repo")
+        assert similar_issue.embed.call_count == 1  # a single batch
+
+        repo_obj.get_issues.return_value = [issue(2, 2, "dark mode"), issue(1, 3, "crash when saving a file")]
+        similar_issue._update_local_store_with_issues(repo_obj, "org-repo")
+        assert repo_obj.get_issues.call_args.kwargs["since"] == datetime(2024, 1, 2, tzinfo=timezone.utc)
+        assert similar_issue.embed.call_args.args[0] == ['Issue Header: "crash when saving a file"\n\nIssue Body:\n']
+
+        results = similar_issue.local_store.search("org-repo", hashing_embedding(["saving a file"])[0], top_k=1)
+        assert results[0][0] == "issue_1.issue" and results[0][1]["level"] == "issue"